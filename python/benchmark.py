@@ -0,0 +1,115 @@
+# This program times some of the library's bulk operations.
+
+import cabb_scheduler as cabb
+import numpy as np
+import io
+import timeit
+
+def bestTime(statement, number=1, repeat=5):
+    return min(timeit.repeat(statement, number=number, repeat=repeat)) / number
+
+# Flux density models: evaluate 2000 calibrator models at 100 frequencies,
+# one at a time and all at once.
+nModels = 2000
+frequencies = np.linspace(1100, 25000, 100)
+rng = np.random.default_rng(1)
+models = rng.uniform(-1, 1, ( nModels, 5 ))
+scalarModel = cabb.calibrator_database._calibrator__model2FluxDensity
+
+def scalarModels():
+    return np.array([ [ scalarModel(m, f) for f in frequencies ] for m in models ])
+
+def batchedModels():
+    return cabb.calibrator_database.modelFluxDensities(models, frequencies)
+
+print("Flux density models (%d models x %d frequencies):" % ( nModels, len(frequencies) ))
+scalarTime = bestTime(scalarModels, repeat=3)
+batchedTime = bestTime(batchedModels, number=10)
+print("  one at a time: %.4f s" % scalarTime)
+print("  all at once:   %.4f s (%.0f times faster)" % ( batchedTime, scalarTime / batchedTime ))
+print("  largest relative difference: %.1e" %
+      np.max(np.abs(batchedModels() / scalarModels() - 1)))
+
+# Scan times: the LST and UTC of every scan in a 200 scan schedule, for
+# every minute (and every few seconds) of LST the schedule could start at.
+sched = cabb.schedule()
+for i in range(0, 200):
+    sched.addScan({ 'source': "source%d" % i, 'rightAscension': "%02d:00:00" % (i % 24),
+                    'declination': "-30:00:00", 'scanLength': "00:10:00" })
+for nStarts in ( 1440, 10000 ):
+    startTimes = np.linspace(0, 24, nStarts, endpoint=False)
+    print("Scan times (%d scans x %d start times):" % ( sched.getNumberOfScans(), nStarts ))
+    print("  %.4f s" % bestTime(lambda: sched.getScanTimes(startTimes), number=5))
+
+# Visibility: the elevation of 1000 sources at every minute of LST, and
+# their rise and set LSTs above 12 and 35 degrees.
+ras = rng.uniform(0, 2 * np.pi, 1000)
+decs = np.arcsin(rng.uniform(-1, 1, 1000))
+lsts = np.linspace(0, 24, 1440, endpoint=False)
+print("Visibility (%d sources):" % len(ras))
+print("  elevations at %d LSTs: %.4f s" % ( len(lsts), bestTime(lambda: cabb.visibility.elevations(ras, decs, lsts)) ))
+print("  rise and set LSTs:     %.4f s" % bestTime(lambda: cabb.visibility.riseSetLsts(ras, decs, [ 12.0, 35.0 ]),
+                                                   number=100))
+
+# Serializing: the lines of a 20000 scan schedule, with the old way of
+# checking every handler of every scan against the previous scan, and the
+# compiled serializer that iterLines and write use.
+sched = cabb.schedule()
+sourceFrequencies = [ ( 2100, 2100 ), ( 5500, 9000 ), ( 17000, 19000 ), ( 33000, 35000 ) ]
+for i in range(0, 20000):
+    ( freq1, freq2 ) = sourceFrequencies[int(rng.integers(len(sourceFrequencies)))]
+    options = { 'source': "source%d" % (i % 50), 'rightAscension': "%02d:00:00" % (i % 24),
+                'declination': "-%02d:00:00" % (i % 90), 'freq1': freq1, 'freq2': freq2,
+                'scanLength': "00:%02d:00" % (1 + i % 20) }
+    if rng.random() < 0.3:
+        options['zoom%d-1' % int(rng.integers(1, 17))] = int(rng.integers(1, 30))
+    sched.addScan(options)
+prepareLine = sched._schedule__prepareScheduleLine
+formatSpecifier = sched._schedule__formatSpecifier
+
+def oldLines():
+    # The schedule lines, made the way toString used to make them.
+    scans = sched.scans
+    lines = []
+    for i in range(0, len(scans)):
+        lines.append("$SCAN*V5")
+        for ( h, handler ) in sched._schedule__scanHandlers.items():
+            line = prepareLine(scans[i], scans[i - 1] if i > 0 else None, handler['get'],
+                               h + "=" + formatSpecifier(handler['format']))
+            if line is not None:
+                lines.append(line)
+        for ( h, handler ) in sched._schedule__freqHandlers.items():
+            previous = getattr(scans[i - 1], handler['object'])() if i > 0 else None
+            line = prepareLine(getattr(scans[i], handler['object'])(), previous, handler['get'],
+                               h + "=" + formatSpecifier(handler['format']))
+            if line is not None:
+                lines.append(line)
+        for f in range(1, 3):
+            previous = getattr(scans[i - 1], "IF%d" % f)() if i > 0 else None
+            for z in range(1, 17):
+                line = prepareLine(getattr(scans[i], "IF%d" % f)(), previous, "getZoomChannel",
+                                   "Zoom%d-%d=%%d" % ( z, f ), z)
+                if line is not None:
+                    lines.append(line)
+        lines.append("$SCANEND")
+    return lines
+
+def oldWrite():
+    io.StringIO().write("\n".join(oldLines()) + "\n")
+
+def compiledLines():
+    return list(sched.iterLines())
+
+def compiledWrite():
+    sched.write(io.StringIO())
+
+print("Serializing (%d scans):" % sched.getNumberOfScans())
+oldTime = bestTime(oldLines, repeat=3)
+compiledTime = bestTime(compiledLines, repeat=3)
+print("  lines, old:      %.4f s" % oldTime)
+print("  lines, compiled: %.4f s (%.0f times faster)" % ( compiledTime, oldTime / compiledTime ))
+oldTime = bestTime(oldWrite, repeat=3)
+compiledTime = bestTime(compiledWrite, repeat=3)
+print("  write, old:      %.4f s" % oldTime)
+print("  write, compiled: %.4f s (%.0f times faster)" % ( compiledTime, oldTime / compiledTime ))
+print("  same lines: %s" % (oldLines() == compiledLines()))
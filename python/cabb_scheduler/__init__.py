@@ -1,6 +1,15 @@
 import cabb_scheduler.errors
+import cabb_scheduler.transport
+import cabb_scheduler.timeline
+import cabb_scheduler.visibility
 import cabb_scheduler.monica_information
+import cabb_scheduler.calibrator_database
+from cabb_scheduler.calibrator_cache import calibratorCache
+from cabb_scheduler.calibrator_catalogue import calibratorCatalogue
 from cabb_scheduler.schedule import schedule
+from cabb_scheduler.mapped_schedule import mappedSchedule
+from cabb_scheduler.builder import scheduleBuilder
 from cabb_scheduler.scan import scan
 from cabb_scheduler.frequency_setup import frequency_setup
 from cabb_scheduler.zoom import zoom
+from cabb_scheduler.scan_table import scanTable
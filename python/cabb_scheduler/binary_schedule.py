@@ -0,0 +1,123 @@
+# A compact binary form of a schedule, for caching and fast reloading.
+from cabb_scheduler.scan import scan, fieldNames
+from cabb_scheduler.frequency_setup import nZoomBands
+from cabb_scheduler.errors import ScanError
+import numpy as np
+import struct
+import json
+
+# Every binary schedule starts with this, then the format version.
+magic = b"CABBSCHB"
+version = 1
+
+# The header after the magic: version, number of scans, number of strings,
+# the lengths in bytes of the settings and the string data, and the number
+# of frequency setups with their own zoom channels and groups.
+headerFormat = "<HIIIII"
+
+# The fields kept as indices into the string table, and those kept as numbers.
+stringFields = ( 'source', 'rightAscension', 'declination', 'epoch', 'calCode', 'scanLength',
+                 'scanType', 'pointing', 'observer', 'project', 'time', 'timeCode',
+                 'tvChannels', 'command', 'catVel', 'freqConfig', 'comment', 'wrap' )
+integerFields = ( 'averaging', 'environment', 'freq1', 'freq2', 'bw1', 'bw2' )
+floatFields = ( 'pointingOffset1', 'pointingOffset2' )
+
+# The schedule settings that get saved with the scans.
+settingNames = ( 'looping', 'autoCals', 'calFirst', 'prepScans', 'delayScans',
+                 'pointingLowBand', 'calibratorAssociations' )
+
+def scheduleToBinary(sched=None):
+    # Return the binary form of a schedule, as bytes.
+    scans = sched.scans
+    nScans = len(scans)
+    columns = dict(zip(fieldNames, zip(*[ s.getFields() for s in scans ])))
+    if nScans == 0:
+        columns = dict([ ( f, () ) for f in fieldNames ])
+    # Every string is stored once, and the scans refer to it by number.
+    strings = {}
+    stringColumns = []
+    for f in stringFields + ( 'id', ):
+        if f == 'id':
+            values = [ s.getId() for s in scans ]
+        else:
+            values = columns[f]
+        stringColumns.append(np.array([ strings.setdefault(v, len(strings)) for v in values ],
+                                      dtype='<u4'))
+    encoded = [ v.encode("utf-8") for v in strings ]
+    settings = json.dumps(dict([ ( n, getattr(sched, n) ) for n in settingNames ])).encode("utf-8")
+    # The zooms of each IF: the enabled bitmask, and for the few setups that
+    # have them, the channels and groups (indexed by scan * 2 + IF - 1).
+    zoomEnabled = []
+    zoomSetups = []
+    zoomChannels = []
+    zoomGroups = []
+    for i in range(0, nScans):
+        for ( f, setup ) in enumerate(( scans[i].IF1(), scans[i].IF2() )):
+            ( enabled, channels, groups ) = setup.getZoomFields()
+            zoomEnabled.append(enabled)
+            if channels is not None:
+                zoomSetups.append(i * 2 + f)
+                zoomChannels.extend(channels)
+                zoomGroups.extend(groups)
+    parts = [ magic, struct.pack(headerFormat, version, nScans, len(encoded), len(settings),
+                                 sum([ len(e) for e in encoded ]), len(zoomSetups)),
+              settings, np.array([ len(e) for e in encoded ], dtype='<u4').tobytes(), b"".join(encoded) ]
+    parts += [ c.tobytes() for c in stringColumns ]
+    parts += [ np.array(columns[f], dtype='<i8').tobytes() for f in integerFields ]
+    parts += [ np.array(columns[f], dtype='<f8').tobytes() for f in floatFields ]
+    parts += [ np.array(zoomEnabled, dtype='<u4').tobytes(), np.array(zoomSetups, dtype='<u4').tobytes(),
+               np.array(zoomChannels, dtype='<i4').tobytes(), np.array(zoomGroups, dtype='<i4').tobytes() ]
+    return b"".join(parts)
+
+def binaryToScans(data=None, parent=None):
+    # Read the binary form of a schedule, and return the scans (belonging to
+    # parent) and a dictionary of the schedule settings.
+    if data[:len(magic)] != magic:
+        raise ScanError("Not a binary schedule.")
+    offset = len(magic)
+    ( fileVersion, nScans, nStrings, settingsLength, stringsLength,
+      nZoomSetups ) = struct.unpack_from(headerFormat, data, offset)
+    if fileVersion != version:
+        raise ScanError("Unsupported binary schedule version %d." % fileVersion)
+    offset += struct.calcsize(headerFormat)
+
+    def take(dtype, count):
+        nonlocal offset
+        a = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += a.nbytes
+        return a.tolist()
+
+    settings = json.loads(bytes(data[offset:offset + settingsLength]).decode("utf-8"))
+    offset += settingsLength
+    lengths = take('<u4', nStrings)
+    blob = bytes(data[offset:offset + stringsLength])
+    offset += stringsLength
+    strings = []
+    position = 0
+    for l in lengths:
+        strings.append(blob[position:position + l].decode("utf-8"))
+        position += l
+    values = {}
+    for f in stringFields + ( 'id', ):
+        values[f] = [ strings[i] for i in take('<u4', nScans) ]
+    for f in integerFields:
+        values[f] = take('<i8', nScans)
+    for f in floatFields:
+        values[f] = take('<f8', nScans)
+    zoomEnabled = take('<u4', nScans * 2)
+    zoomSetups = take('<u4', nZoomSetups)
+    zoomChannels = take('<i4', nZoomSetups * nZoomBands)
+    zoomGroups = take('<i4', nZoomSetups * nZoomBands)
+
+    scans = []
+    fieldColumns = [ values[f] for f in fieldNames ]
+    for ( fields, nId ) in zip(zip(*fieldColumns), values['id']):
+        scans.append(scan(parent, nId).setFields(fields))
+    for i in range(0, len(zoomEnabled)):
+        if zoomEnabled[i] != 0:
+            getattr(scans[i // 2], "IF%d" % (i % 2 + 1))().setZoomFields(zoomEnabled[i])
+    for ( j, i ) in enumerate(zoomSetups):
+        getattr(scans[i // 2], "IF%d" % (i % 2 + 1))().setZoomFields(
+            zoomEnabled[i], zoomChannels[j * nZoomBands:(j + 1) * nZoomBands],
+            zoomGroups[j * nZoomBands:(j + 1) * nZoomBands])
+    return ( scans, settings )
@@ -0,0 +1,266 @@
+# A builder for rapid response schedules, which turns a request to observe
+# a source in one or more bands into a complete schedule.
+from cabb_scheduler.schedule import schedule
+import cabb_scheduler.calibrator_database as calibrator_database
+import cabb_scheduler.visibility as visibility
+import cabb_scheduler.timeline as timeline
+import time
+
+# The bands that can be requested, in the order they get observed.
+bandNames = ( "16cm", "4cm", "15mm", "7mm" )
+
+# The longest time (in seconds) spent on the source in each band before going
+# back to its calibrator.
+bandMaxScanLengths = { '16cm': 2400, '4cm': 1200, '15mm': 900, '7mm': 600 }
+
+# The frequencies (in MHz) at which calibrators are looked for in each band.
+bandSearchFrequencies = { '16cm': [ 2100 ], '4cm': [ 5500, 9000 ],
+                          '15mm': [ 17000, 19000 ], '7mm': [ 33000, 35000 ] }
+
+# The flux density calibrator. We only try to get 1934-638, as it is not worth
+# getting 0823-500.
+fluxCalibrator = { 'source': "1934-638", 'rightAscension': "19:39:25.026",
+                   'declination': "-63:42:45.63" }
+
+def __secondsToTime(seconds=None):
+    # Turn a number of seconds into a HH:MM:SS scan length.
+    seconds = int(seconds)
+    return "%02d:%02d:%02d" % ( seconds // 3600, (seconds // 60) % 60, seconds % 60 )
+
+def _scheduleBuilder__secondsToTime(seconds=None):
+    return __secondsToTime(seconds)
+
+def __lstBetween(lst=None, start=None, end=None):
+    # Is the LST after start and before end, going forward from start (all in hours)?
+    return lst != start and ((lst - start) % 24.0) < ((end - start) % 24.0)
+
+def _scheduleBuilder__lstBetween(lst=None, start=None, end=None):
+    return __lstBetween(lst, start, end)
+
+class scheduleBuilder:
+    def __init__(self, array="6A", calibratorScanLength=120, fluxCalibratorScanLength=300,
+                 horizon=12.0, fluxCalibratorElevation=35.0, calibratorRadius=20,
+                 pointingLowBand="15mm", maxScanLengths={}):
+        # The array the schedule is for, which decides which calibrators are best.
+        self.array = array
+        # How long (in seconds) to spend on each calibrator scan, and on the flux
+        # density calibrator in each band.
+        self.calibratorScanLength = calibratorScanLength
+        self.fluxCalibratorScanLength = fluxCalibratorScanLength
+        # The source can only be observed above the horizon (in degrees), and
+        # we try to get the flux density calibrator above fluxCalibratorElevation,
+        # so we have good quality data and a bit of leeway if the schedule runs
+        # differently to what we expect.
+        self.horizon = horizon
+        self.fluxCalibratorElevation = fluxCalibratorElevation
+        # How far (in degrees) from the source a calibrator can be.
+        self.calibratorRadius = calibratorRadius
+        # The lowest band that needs pointing scans.
+        self.pointingLowBand = pointingLowBand
+        self.maxScanLengths = dict(bandMaxScanLengths)
+        self.maxScanLengths.update(maxScanLengths)
+        # The calibrator chosen for each position, band and array.
+        self.__calibrators = {}
+        # How long (in seconds) each phase of the last build took.
+        self.__timings = {}
+
+    def setArray(self, array=None):
+        if array is not None:
+            self.array = array
+        return self
+
+    def getArray(self):
+        return self.array
+
+    def getTimings(self):
+        # Return how long (in seconds) each phase of the last build took.
+        return dict(self.__timings)
+
+    def clearCalibrators(self):
+        # Forget the calibrators that have been chosen, so they get looked up
+        # again.
+        self.__calibrators = {}
+        return self
+
+    def findCalibrator(self, rightAscension=None, declination=None, band=None):
+        # Return the best calibrator near the position in the band, for the
+        # array. Each calibrator is only looked up once, and None is returned
+        # if there isn't a suitable one.
+        key = ( rightAscension, declination, band, self.array )
+        if key not in self.__calibrators:
+            calList = calibrator_database.coneSearch(rightAscension, declination, self.calibratorRadius,
+                                                     frequencies=list(bandSearchFrequencies[band]))
+            bestCal = None
+            if calList.numCalibrators() > 0:
+                bestCal = calList.getBestCalibrator(self.array)
+            if bestCal is not None:
+                bestCal = bestCal['calibrator']
+            self.__calibrators[key] = bestCal
+        return self.__calibrators[key]
+
+    def __fluxCalibratorTime(self, startLst, timeRemaining):
+        # Work out how long (in hours) we can wait before going to the flux
+        # density calibrator, and whether we can get it at all.
+        low = visibility.lstWindow(fluxCalibrator['rightAscension'], fluxCalibrator['declination'],
+                                   self.horizon)
+        high = visibility.lstWindow(fluxCalibrator['rightAscension'], fluxCalibrator['declination'],
+                                    self.fluxCalibratorElevation)
+        checkRise = False
+        hoursLeft = 0
+        if __lstBetween(startLst, low['rise'], low['set']):
+            # It is up. If it is above the higher elevation, we go before it
+            # drops below it, and if it is rising we can wait until then too.
+            if (__lstBetween(startLst, high['rise'], high['set']) or
+                __lstBetween(startLst, low['rise'], high['rise'])):
+                hoursLeft = visibility.hoursUntil(startLst, high['set'])
+            elif visibility.hoursUntil(startLst, low['set']) < 0.5:
+                # It is setting too soon to go now, so we may need to wait
+                # until it next rises.
+                checkRise = True
+        else:
+            checkRise = True
+        if checkRise:
+            # We go just after it rises above the higher elevation, so we don't
+            # get caught out by a schedule that goes past it rising and setting again.
+            hoursLeft = visibility.hoursUntil(startLst, high['rise'])
+            if hoursLeft > timeRemaining:
+                # We will have to compromise. If it rises above the horizon
+                # before we finish, we go at the end.
+                if visibility.hoursUntil(startLst, low['rise']) < timeRemaining:
+                    hoursLeft = timeRemaining
+                else:
+                    return ( None, False )
+        return ( float(hoursLeft), True )
+
+    def __bandPlan(self, request, band, sched):
+        # Work out how to observe the source in this band: the number of times
+        # to go to the source (enough that no visit is longer than the maximum
+        # scan length for the band, with two calibrator scans each), how long
+        # each visit is, and how much time (in hours) it all takes.
+        exposure = int(round(timeline.timeToHours(request[band]['exposureLength']) * 3600.0))
+        visitLength = self.maxScanLengths[band] + 2 * self.calibratorScanLength
+        nReps = max(1, -(-exposure // visitLength))
+        dwellLength = exposure // nReps
+        # Allow for 20s slews.
+        hours = ((nReps * dwellLength / 3600.0) + (nReps * 2 * 20.0 / 3600.0) +
+                 ((nReps + 1) * self.calibratorScanLength / 3600.0))
+        # If we're in a pointing band, allow a bit of extra time per hour.
+        if sched.needsPointing(band):
+            hours += 2.0 / 60.0
+        # Add some time for focusing.
+        hours += 2.0 / 60.0
+        return { 'band': band, 'reps': nReps, 'dwellLength': __secondsToTime(dwellLength),
+                 'hours': hours }
+
+    def __bandOptions(self, request, band, bandwidth):
+        options = { 'freq1': request[band]['freq1'], 'freq2': request[band]['freq2'],
+                    'project': request['project'], 'scanType': "Dwell" }
+        if bandwidth is not None:
+            options['bw1'] = bandwidth
+            options['bw2'] = bandwidth
+        return options
+
+    def __addFluxCalibrators(self, sched, request, bands, bandwidth):
+        for band in bands:
+            options = self.__bandOptions(request, band, bandwidth)
+            options.update(fluxCalibrator)
+            options['calCode'] = "C"
+            options['scanLength'] = __secondsToTime(self.fluxCalibratorScanLength)
+            sched.addScan(options)
+
+    def build(self, request=None, startLst=None, cabb64=False, delayCal=False):
+        # Make the schedule for a request, starting at the LST (as HH:MM:SS or
+        # in hours). The request is a dictionary with the source, rightAscension,
+        # declination, project and maxExposureLength, and for each band (like
+        # "4cm") a dictionary with use, exposureLength, freq1 and freq2. The
+        # bands are visited in turn, with a calibrator scan either side of each
+        # visit, until the time runs out or the source sets, with a visit to
+        # the flux density calibrator in each band when it is high enough.
+        # With cabb64 the correlator is in 64 MHz mode, and delayCal adds the
+        # delay calibration scans.
+        if request is None or startLst is None:
+            return None
+        self.__timings = {}
+        phaseStart = buildStart = time.perf_counter()
+        if isinstance(startLst, str):
+            startLstHours = timeline.timeToHours(startLst)
+        else:
+            ( startLstHours, startLst ) = ( float(startLst), timeline.hoursToTime(startLst) )
+        bandwidth = 64 if cabb64 else None
+
+        sched = schedule()
+        sched.setLooping(False)
+        sched.enablePrepScans()
+        if delayCal:
+            sched.enableDelayCal()
+        sched.setPointingLowBand(self.pointingLowBand)
+
+        # How long can we run, before the source sets?
+        bands = [ b for b in bandNames if b in request and request[b].get('use') == True ]
+        timeRemaining = timeline.timeToHours(request['maxExposureLength'])
+        sourceWindow = visibility.lstWindow(request['rightAscension'], request['declination'],
+                                            self.horizon)
+        if sourceWindow['set'] is not None:
+            # If it doesn't set, we can go for the full duration.
+            timeRemaining = min(timeRemaining, float(visibility.hoursUntil(startLstHours,
+                                                                           sourceWindow['set'])))
+        ( fluxCalTime, addFluxCal ) = self.__fluxCalibratorTime(startLstHours, timeRemaining)
+        plans = [ self.__bandPlan(request, b, sched) for b in bands ]
+        # Go around the bands until the time runs out, noting where the flux
+        # density calibrators go.
+        passes = []
+        timeConsumed = 0
+        fluxCalAdded = not addFluxCal
+        while timeConsumed < timeRemaining and len(plans) > 0:
+            fluxCalHere = not fluxCalAdded and timeConsumed >= fluxCalTime
+            if fluxCalHere:
+                fluxCalAdded = True
+                # Allow for slewing, focus, pointing.
+                timeConsumed += len(bands) * 15.0 / 60.0
+            passes.append(fluxCalHere)
+            for plan in plans:
+                timeConsumed += plan['hours']
+        now = time.perf_counter()
+        self.__timings['plan'] = now - phaseStart
+        phaseStart = now
+
+        calibrators = [ self.findCalibrator(request['rightAscension'], request['declination'], b)
+                        for b in bands ]
+        now = time.perf_counter()
+        self.__timings['calibrators'] = now - phaseStart
+        phaseStart = now
+
+        sourceScans = [ None ] * len(plans)
+        for fluxCalHere in passes:
+            if fluxCalHere:
+                self.__addFluxCalibrators(sched, request, bands, bandwidth)
+            for ( i, plan ) in enumerate(plans):
+                if sourceScans[i] is not None:
+                    # We just need to copy the scans.
+                    for j in range(0, plan['reps']):
+                        sched.copyScans([ sourceScans[i].getId() ])
+                    continue
+                options = self.__bandOptions(request, plan['band'], bandwidth)
+                options.update({ 'source': request['source'], 'rightAscension': request['rightAscension'],
+                                 'declination': request['declination'], 'scanLength': plan['dwellLength'] })
+                sourceScans[i] = sched.addScan(options)
+                if calibrators[i] is not None:
+                    sched.addCalibrator(calibrators[i], sourceScans[i],
+                                        { 'scanLength': __secondsToTime(self.calibratorScanLength) })
+                for j in range(1, plan['reps']):
+                    sched.copyScans([ sourceScans[i].getId() ])
+        if not fluxCalAdded:
+            # We have to put the flux density calibrators at the end.
+            self.__addFluxCalibrators(sched, request, bands, bandwidth)
+        now = time.perf_counter()
+        self.__timings['scans'] = now - phaseStart
+        phaseStart = now
+
+        if sched.getNumberOfScans() > 0:
+            sched.completeSchedule()
+            # Set the LST of the first scan.
+            sched.getScan(idx=0).setTime(startLst)
+        now = time.perf_counter()
+        self.__timings['complete'] = now - phaseStart
+        self.__timings['total'] = now - buildStart
+        return sched
@@ -0,0 +1,201 @@
+# A local cache of responses from the ATCA calibrator database, kept in an
+# SQLite file so it survives between runs.
+import sqlite3
+import threading
+import asyncio
+import json
+import time
+import os
+
+# How long (in seconds) each type of response stays fresh. The calibrator
+# qualities change very rarely, measurements more often.
+defaultTimesToLive = { 'source_quality': 7 * 86400,
+                       'source_all_details': 86400,
+                       'cals': 86400 }
+
+class calibratorCache:
+    def __init__(self, path=None, maxEntries=10000, timesToLive={}, defaultTimeToLive=86400,
+                 staleTime=7 * 86400):
+        # The cache is stored at path, or in the user's cache directory if
+        # none is given. Use ":memory:" for a cache that only lasts as long as
+        # this object. Once an entry is older than its time to live, it will
+        # still be used for up to staleTime seconds while it gets refreshed in
+        # the background. Only maxEntries responses are kept; the least
+        # recently used ones get removed first.
+        if path is None:
+            path = os.path.join(os.path.expanduser("~"), ".cache", "cabb_scheduler",
+                                "calibrator_database.sqlite")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.maxEntries = maxEntries
+        self.timesToLive = dict(defaultTimesToLive)
+        self.timesToLive.update(timesToLive)
+        self.defaultTimeToLive = defaultTimeToLive
+        self.staleTime = staleTime
+        # The connection is shared between threads, one statement at a time.
+        self.__lock = threading.Lock()
+        self.__refreshing = set()
+        # The refreshes running in an event loop, which must be kept until they finish.
+        self.__refreshTasks = set()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__lock:
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                      "key TEXT PRIMARY KEY, action TEXT, response TEXT, "
+                                      "stored REAL, accessed REAL)")
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS responsesAccessed "
+                                      "ON responses (accessed)")
+            self.__connection.commit()
+
+    def makeKey(self, data={}):
+        # Turn the request parameters into a key that doesn't depend on the
+        # order of the parameters or the types of their values.
+        return json.dumps(sorted([ ( str(k), str(data[k]) ) for k in data ]))
+
+    def getAction(self, data={}):
+        # The type of request, which decides how long it stays fresh.
+        if 'action' in data:
+            return data['action']
+        return data.get('mode')
+
+    def timeToLive(self, action=None):
+        return self.timesToLive.get(action, self.defaultTimeToLive)
+
+    def __lookup(self, key, action):
+        # Return the cached response and whether it is fresh, stale (usable
+        # but needing a refresh) or missing (None).
+        now = time.time()
+        with self.__lock:
+            row = self.__connection.execute("SELECT response, stored FROM responses WHERE key = ?",
+                                            ( key, )).fetchone()
+            if row is not None:
+                self.__connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", ( now, key ))
+                self.__connection.commit()
+        if row is not None:
+            age = now - row[1]
+            if age <= self.timeToLive(action):
+                return ( row[0], "fresh" )
+            if age <= self.timeToLive(action) + self.staleTime:
+                return ( row[0], "stale" )
+        return ( None, None )
+
+    def fetch(self, data={}, fetcher=None, parser=None):
+        # Return the response text for the request, from the cache if we can,
+        # otherwise by calling fetcher(data) and remembering what it returns.
+        # If a parser is given, the response is returned as parser(response)
+        # instead, and a new response is only remembered if that works;
+        # whatever the parser (or fetcher) raises is passed on.
+        key = self.makeKey(data)
+        action = self.getAction(data)
+        ( response, state ) = self.__lookup(key, action)
+        if state == "stale":
+            # Use what we have, but get a new copy for next time.
+            self.__refresh(key, action, data, fetcher, parser)
+        if state is None:
+            response = fetcher(data)
+        result = self.__parse(key, response, parser)
+        if state is None:
+            self.store(key, action, response)
+        return result
+
+    async def aFetch(self, data={}, fetcher=None, parser=None):
+        # The same as fetch, but fetcher(data) is a coroutine.
+        key = self.makeKey(data)
+        action = self.getAction(data)
+        ( response, state ) = self.__lookup(key, action)
+        if state == "stale":
+            self.__aRefresh(key, action, data, fetcher, parser)
+        if state is None:
+            response = await fetcher(data)
+        result = self.__parse(key, response, parser)
+        if state is None:
+            self.store(key, action, response)
+        return result
+
+    def __parse(self, key, response, parser):
+        if parser is None:
+            return response
+        try:
+            return parser(response)
+        except Exception:
+            # Don't keep a copy that can't be used (it may have been stored
+            # by an older version of the library).
+            with self.__lock:
+                self.__connection.execute("DELETE FROM responses WHERE key = ?", ( key, ))
+                self.__connection.commit()
+            raise
+
+    def store(self, key=None, action=None, response=None):
+        # Remember a response, and forget the least recently used ones if
+        # there are now too many.
+        if key is None or response is None:
+            return self
+        now = time.time()
+        with self.__lock:
+            self.__connection.execute("INSERT OR REPLACE INTO responses (key, action, response, stored, accessed) "
+                                      "VALUES (?, ?, ?, ?, ?)", ( key, action, response, now, now ))
+            count = self.__connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.maxEntries:
+                self.__connection.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                                          "ORDER BY accessed ASC LIMIT ?)", ( count - self.maxEntries, ))
+            self.__connection.commit()
+        return self
+
+    def __refresh(self, key, action, data, fetcher, parser):
+        # Fetch a new copy of a response in the background, unless that is
+        # already happening.
+        with self.__lock:
+            if key in self.__refreshing:
+                return
+            self.__refreshing.add(key)
+
+        def refresh():
+            try:
+                response = fetcher(data)
+                if parser is not None:
+                    parser(response)
+                self.store(key, action, response)
+            except Exception:
+                # We still have the stale copy, and will try again next time.
+                pass
+            finally:
+                with self.__lock:
+                    self.__refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def __aRefresh(self, key, action, data, fetcher, parser):
+        # The same as __refresh, as a task in the running event loop.
+        with self.__lock:
+            if key in self.__refreshing:
+                return
+            self.__refreshing.add(key)
+
+        async def refresh():
+            try:
+                response = await fetcher(data)
+                if parser is not None:
+                    parser(response)
+                self.store(key, action, response)
+            except Exception:
+                pass
+            finally:
+                with self.__lock:
+                    self.__refreshing.discard(key)
+
+        task = asyncio.ensure_future(refresh())
+        self.__refreshTasks.add(task)
+        task.add_done_callback(self.__refreshTasks.discard)
+
+    def numEntries(self):
+        with self.__lock:
+            return self.__connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self.__lock:
+            self.__connection.execute("DELETE FROM responses")
+            self.__connection.commit()
+        return self
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
@@ -0,0 +1,185 @@
+# A local copy of the ATCA calibrator catalogue, so calibrators can be found
+# without asking the calibrator database server.
+from cabb_scheduler.calibrator_database import calibratorSearchResponse, modelFluxDensities
+from cabb_scheduler.positions import positionToRadians, angularSeparations
+import numpy as np
+import json
+import math
+
+class calibratorCatalogue:
+    def __init__(self, path=None):
+        # The details of each calibrator, as given to calibrator(), with its
+        # flux densities sorted by frequency.
+        self.__calibrators = []
+        # The index: the position of each calibrator (in radians), sorted by
+        # declination.
+        self.__rightAscensions = None
+        self.__declinations = None
+        self.__order = None
+        if path is not None:
+            self.load(path)
+
+    def addCalibrator(self, details=None):
+        # Add a calibrator, described like the details given to calibrator():
+        # name, rightAscension, declination, fluxDensities (a list of
+        # frequency (MHz) and fluxDensity (Jy) pairs) and, if they are known,
+        # the qualities (as the database gives them, like { '6km': { '4cm': 4 } }).
+        if details is not None:
+            fluxDensities = sorted([ { 'frequency': int(f['frequency']), 'fluxDensity': float(f['fluxDensity']) }
+                                     for f in details.get('fluxDensities', []) ],
+                                   key=lambda f: f['frequency'])
+            self.__calibrators.append({ 'name': details['name'],
+                                        'rightAscension': details['rightAscension'],
+                                        'declination': details['declination'],
+                                        'fluxDensities': fluxDensities,
+                                        'qualities': details.get('qualities') })
+            self.__rightAscensions = None
+        return self
+
+    def addSearchResponse(self, response=None):
+        # Add all the calibrators found by a calibrator database search; an
+        # all-sky search (radius 180) with no flux limit copies the whole
+        # catalogue at the frequencies searched for.
+        if response is not None:
+            for c in response.getAllCalibrators():
+                cal = c['calibrator']
+                self.addCalibrator({ 'name': cal.getName(), 'rightAscension': cal.getRightAscension(),
+                                     'declination': cal.getDeclination(),
+                                     'fluxDensities': cal.getFluxDensities(),
+                                     'qualities': cal.getQuality() })
+        return self
+
+    def fetchQualities(self, maxFetches=None):
+        # Get the qualities of the calibrators that don't have them yet from
+        # the calibrator database, so that once the catalogue is saved the
+        # best calibrator can be chosen without the network. The qualities
+        # that were found are kept even if some of the requests fail (the
+        # first failure is raised).
+        missing = [ c for c in self.__calibrators if c['qualities'] is None ]
+        calList = calibratorSearchResponse()
+        for c in missing:
+            calList.addCalibrator(c, 0)
+        try:
+            calList.fetchQualities(maxFetches)
+        finally:
+            for ( c, found ) in zip(missing, calList.getAllCalibrators()):
+                c['qualities'] = found['calibrator'].getQuality()
+        return self
+
+    def numCalibrators(self):
+        return len(self.__calibrators)
+
+    def load(self, path=None):
+        # Add the calibrators from a catalogue export file, which is a JSON
+        # list of calibrator details.
+        if path is not None:
+            with open(path, 'r') as catFile:
+                for details in json.load(catFile):
+                    self.addCalibrator(details)
+        return self
+
+    def save(self, path=None):
+        # Write the catalogue to an export file that load can read.
+        if path is not None:
+            with open(path, 'w') as catFile:
+                json.dump(self.__calibrators, catFile)
+        return self
+
+    def __buildIndex(self):
+        # Work out the positions, and sort them by declination so only the
+        # band of declinations around a search position needs to be checked.
+        positions = np.array([ positionToRadians(c['rightAscension'], c['declination'])
+                               for c in self.__calibrators ]).reshape(-1, 2)
+        self.__order = np.argsort(positions[:, 1], kind="stable")
+        self.__rightAscensions = positions[self.__order, 0]
+        self.__declinations = positions[self.__order, 1]
+
+    def fluxDensity(self, index=None, frequency=None):
+        # Return the flux density of a calibrator at a frequency (MHz). Between
+        # the frequencies we know about we interpolate in log-log space; beyond
+        # them we use the nearest one.
+        return self.__fluxDensities([ index ], frequency)[0]
+
+    def __fluxDensities(self, indices=None, frequency=None):
+        # Return the flux densities of some calibrators at a frequency (MHz),
+        # as fluxDensity does. Interpolating in log-log space is a straight
+        # line model (in the same form as the database's models), so we make
+        # one for each calibrator that needs it and evaluate them all at once.
+        fluxes = [ None ] * len(indices)
+        models = []
+        modelled = []
+        for ( k, index ) in enumerate(indices):
+            fluxDensities = self.__calibrators[index]['fluxDensities']
+            if len(fluxDensities) == 0:
+                continue
+            frequencies = [ f['frequency'] for f in fluxDensities ]
+            i = int(np.searchsorted(frequencies, frequency))
+            if i < len(frequencies) and frequencies[i] == frequency:
+                fluxes[k] = fluxDensities[i]['fluxDensity']
+                continue
+            if i == 0:
+                fluxes[k] = fluxDensities[0]['fluxDensity']
+                continue
+            if i == len(frequencies):
+                fluxes[k] = fluxDensities[-1]['fluxDensity']
+                continue
+            ( lf, hf ) = ( fluxDensities[i - 1], fluxDensities[i] )
+            if lf['fluxDensity'] <= 0 or hf['fluxDensity'] <= 0:
+                # Can't go into log space, so interpolate linearly.
+                fluxes[k] = lf['fluxDensity'] + ((hf['fluxDensity'] - lf['fluxDensity']) *
+                                                 (frequency - lf['frequency']) / (hf['frequency'] - lf['frequency']))
+                continue
+            slope = (math.log10(hf['fluxDensity'] / lf['fluxDensity']) /
+                     math.log10(float(hf['frequency']) / lf['frequency']))
+            # The models are in log10 of the frequency in GHz, and their last
+            # parameter isn't used.
+            models.append([ math.log10(lf['fluxDensity']) - slope * math.log10(lf['frequency'] / 1000.0),
+                            slope, 0 ])
+            modelled.append(k)
+        if len(models) > 0:
+            for ( k, flux ) in zip(modelled, modelFluxDensities(models, [ frequency ])[:, 0].tolist()):
+                fluxes[k] = flux
+        return fluxes
+
+    def coneSearch(self, ra=None, dec=None, radius=None, fluxLimit=None, frequencies=None):
+        # Search the catalogue like calibrator_database.coneSearch, returning the
+        # calibrators within radius degrees of the position that are at least
+        # fluxLimit Jy at all the frequencies, nearest first. At the frequencies
+        # the catalogue was copied with, the flux densities are the ones the
+        # server gave; at any other frequency they are interpolated from those
+        # (see fluxDensity), so they won't be exactly what the server's models
+        # would give. If the catalogue has the qualities, choosing the best
+        # calibrator from the results doesn't need the server either.
+        if fluxLimit is None:
+            fluxLimit = 0.2
+        if frequencies is None:
+            frequencies = [ 5500, 9000 ]
+        frequencies = [ int(f) for f in frequencies ]
+        calList = calibratorSearchResponse()
+        if ra is None or dec is None or radius is None or len(self.__calibrators) == 0:
+            return calList
+        if self.__rightAscensions is None:
+            self.__buildIndex()
+        ( raRads, decRads ) = positionToRadians(ra, dec)
+        radiusRads = math.radians(float(radius))
+        # Only the calibrators in the declination band can be close enough.
+        low = np.searchsorted(self.__declinations, decRads - radiusRads, side="left")
+        high = np.searchsorted(self.__declinations, decRads + radiusRads, side="right")
+        distances = np.atleast_1d(angularSeparations(raRads, decRads, self.__rightAscensions[low:high],
+                                                     self.__declinations[low:high]))
+        inCone = np.flatnonzero(distances <= float(radius))
+        inCone = inCone[np.argsort(distances[inCone], kind="stable")]
+        indices = self.__order[low + inCone].tolist()
+        fluxTable = [ self.__fluxDensities(indices, f) for f in frequencies ]
+        for ( k, j ) in enumerate(inCone.tolist()):
+            index = indices[k]
+            fluxDensities = [ { 'frequency': f, 'fluxDensity': fluxTable[m][k] }
+                              for ( m, f ) in enumerate(frequencies) ]
+            if any([ f['fluxDensity'] is None or f['fluxDensity'] < fluxLimit for f in fluxDensities ]):
+                continue
+            cal = self.__calibrators[index]
+            calList.addCalibrator({ 'name': cal['name'], 'rightAscension': cal['rightAscension'],
+                                    'declination': cal['declination'], 'fluxDensities': fluxDensities,
+                                    'qualities': cal['qualities'] },
+                                  distances[j])
+        return calList
@@ -1,6 +1,9 @@
 # A library to handle dealing with v3 of the ATCA calibrator database.
-from requests import Session
+import cabb_scheduler.transport as transport
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 from xml.dom import minidom
+from xml.etree import ElementTree
 import json
 import numpy as np
 import cabb_scheduler.errors
@@ -11,6 +14,16 @@ arrayNames = { '6A': "6km", '6B': "6km", '6C': "6km", '6D': "6km",
                'EW367': "375m", 'EW352': "375m",
                'H214': "375m", 'H168': "375m", 'H75': "375m" }
 
+# The most quality requests that selectBest will have going at once.
+maxQualityFetches = 8
+
+# The errors we expect when a request to the server fails: the connection
+# failing or timing out, an error page, or a response we can't parse.
+fetchErrors = ( OSError, ValueError, EOFError, cabb_scheduler.errors.ServerError )
+
+# Where the calibrator database server is.
+serverUrl = "https://www.narrabri.atnf.csiro.au/cgi-bin/Calibrators/new/caldb_v3.pl"
+
 class calibrator:
     def __init__(self, details=None):
         # This is a single calibrator from the database.
@@ -20,7 +33,8 @@ class calibrator:
             'declination': "",
             'fluxDensities': [],
             'measurements': None,
-            'qualities': None
+            'qualities': None,
+            'collation': None
         }
         if details is not None:
             if 'name' in details:
@@ -33,6 +47,9 @@ class calibrator:
                 for i in range(0, len(details['fluxDensities'])):
                     self.addFluxDensity(details['fluxDensities'][i]['frequency'],
                                         details['fluxDensities'][i]['fluxDensity'])
+            if details.get('qualities') is not None:
+                # We already know the qualities (from a local catalogue).
+                self.setQualities(details['qualities'])
 
     def setName(self, name=None):
         if name is not None:
@@ -86,7 +103,17 @@ class calibrator:
             return self
         
         data = { 'action': "source_all_details", 'source': self.__calibratorDetails['name'] }
-        response = __communications(data, "json")
+        return self.__storeDetails(__communications(data, "json"))
+
+    async def aFetchDetails(self):
+        # The same as fetchDetails, for use with asyncio.
+        if self.__calibratorDetails['measurements'] is not None:
+            return self
+
+        data = { 'action': "source_all_details", 'source': self.__calibratorDetails['name'] }
+        return self.__storeDetails(await __aCommunications(data, "json"))
+
+    def __storeDetails(self, response=None):
         if response is not None and response['source_name'] == self.__calibratorDetails['name']:
             self.__calibratorDetails['measurements'] = response['measurements']
         return self
@@ -98,13 +125,33 @@ class calibrator:
             return self
 
         data = { 'action': "source_quality", 'source': self.__calibratorDetails['name'] }
-        response = __communications(data, "json")
+        return self.__storeQualities(__communications(data, "json"))
+
+    async def aFetchQualities(self):
+        # The same as fetchQualities, for use with asyncio.
+        if self.__calibratorDetails['qualities'] is not None:
+            return self
+
+        data = { 'action': "source_quality", 'source': self.__calibratorDetails['name'] }
+        return self.__storeQualities(await __aCommunications(data, "json"))
+
+    def __storeQualities(self, response=None):
         if response is not None and self.__calibratorDetails['name'] in response:
-            self.__calibratorDetails['qualities'] = response[self.__calibratorDetails['name']]
-            for a in self.__calibratorDetails['qualities']:
-                for b in self.__calibratorDetails['qualities'][a]:
-                    if self.__calibratorDetails['qualities'][a][b] is not None:
-                        self.__calibratorDetails['qualities'][a][b] = int(self.__calibratorDetails['qualities'][a][b])
+            self.setQualities(response[self.__calibratorDetails['name']])
+        return self
+
+    def setQualities(self, qualities=None):
+        # Set the quality of the calibrator in each band for each array, as
+        # the database gives them (like { '6km': { '4cm': 4 } }).
+        if qualities is not None:
+            self.__calibratorDetails['qualities'] = {}
+            for a in qualities:
+                self.__calibratorDetails['qualities'][a] = {}
+                for b in qualities[a]:
+                    quality = qualities[a][b]
+                    if quality is not None:
+                        quality = int(quality)
+                    self.__calibratorDetails['qualities'][a][b] = quality
         return self
 
     def getQuality(self, array=None, band=None):
@@ -129,59 +176,104 @@ class calibrator:
         # Go through all of the measurements.
         bandNames = [ "16cm", "4cm", "15mm", "7mm", "3mm" ]
         bandEvals = { "16cm": 2100, "4cm": 5500, "15mm": 17000, "7mm": 33000, "3mm": 93000 }
-        arraySpecs = {}
+        # Each (array, band) pair is a group, numbered in this order.
+        arrayClasses = []
         for a in arrayNames:
-            if arrayNames[a] not in arraySpecs:
-                arraySpecs[arrayNames[a]] = {}
-                for i in range(0, len(bandNames)):
-                    arraySpecs[arrayNames[a]][bandNames[i]] = {
-                        'closurePhases': [], 'defects': [],
-                        'fluxDensities': [],
-                        'closurePhaseMedian': None, 'defectMedian': None,
-                        'fluxDensityMedian': None, 'fluxDensityStdDev': None,
-                        'qualityFlag': None
-                    }
-        for i in range(0, len(self.__calibratorDetails['measurements'])):
-            # Work out closure phase and defect as a function of band and array.
-            r = self.__calibratorDetails['measurements'][i]
+            if arrayNames[a] not in arrayClasses:
+                arrayClasses.append(arrayNames[a])
+        groupNumbers = dict([ ( arr, dict([ ( bandNames[j], i * len(bandNames) + j )
+                                            for j in range(0, len(bandNames)) ]) )
+                              for ( i, arr ) in enumerate(arrayClasses) ])
+        nGroups = len(arrayClasses) * len(bandNames)
+        # Pull the values out of the measurements, with the group of each.
+        phaseGroups = []
+        phases = []
+        fluxGroups = []
+        fluxes = []
+        for r in self.__calibratorDetails['measurements']:
             a = r['array'].split()[0]
             b = r['frequency_band']
             if a in arrayNames:
                 arr = arrayNames[a]
-                for j in range(0, len(r['frequencies'])):
-                    r2 = r['frequencies'][j]
-                    for k in range(0, len(r2['closure_phases'])):
-                        r3 = r2['closure_phases'][k]
-                        arraySpecs[arr][b]['closurePhases'].append(float(r3['closure_phase_average']))
-                for j in range(0, len(r['fluxdensities'])):
-                    r2 = r['fluxdensities'][j]
-                    arraySpecs[arr][b]['defects'].append((float(r2['fluxdensity_scalar_averaged']) /
-                                                          float(r2['fluxdensity_vector_averaged'])) - 1)
-                    arraySpecs[arr][b]['fluxDensities'].append(__model2FluxDensity(r2['fluxdensity_fit_coeff'],
-                                                                                   bandEvals[b]))
+                cps = [ r3['closure_phase_average'] for r2 in r['frequencies'] for r3 in r2['closure_phases'] ]
+                if len(cps) > 0:
+                    phaseGroups += [ groupNumbers[arr][b] ] * len(cps)
+                    phases += cps
+                if len(r['fluxdensities']) > 0:
+                    fluxGroups += [ groupNumbers[arr][b] ] * len(r['fluxdensities'])
+                    fluxes += r['fluxdensities']
+        phases = list(map(float, phases))
+        scalars = list(map(float, [ r2['fluxdensity_scalar_averaged'] for r2 in fluxes ]))
+        vectors = list(map(float, [ r2['fluxdensity_vector_averaged'] for r2 in fluxes ]))
+        models = [ r2['fluxdensity_fit_coeff'] for r2 in fluxes ]
+        phaseRecords = np.zeros(len(phases), dtype=[ ( 'group', 'i4' ), ( 'closurePhase', 'f8' ) ])
+        phaseRecords['group'] = phaseGroups
+        phaseRecords['closurePhase'] = phases
+        fluxRecords = np.zeros(len(scalars), dtype=[ ( 'group', 'i4' ), ( 'defect', 'f8' ),
+                                                     ( 'fluxDensity', 'f8' ) ])
+        fluxRecords['group'] = fluxGroups
+        vectors = np.array(vectors, dtype=float)
+        if np.any(vectors == 0):
+            raise ZeroDivisionError("float division by zero")
+        fluxRecords['defect'] = (np.array(scalars, dtype=float) / vectors) - 1
+        bandFrequencies = [ bandEvals[b] for b in bandNames ]
+        fluxRecords['fluxDensity'] = __bandModelFluxDensities(models, fluxRecords['group'] % len(bandNames),
+                                                              bandFrequencies)
+        # Sort the records into their groups, keeping them in order.
+        phaseRecords = phaseRecords[np.argsort(phaseRecords['group'], kind="stable")]
+        fluxRecords = fluxRecords[np.argsort(fluxRecords['group'], kind="stable")]
+        groups = np.arange(0, nGroups + 1)
+        phaseBounds = np.searchsorted(phaseRecords['group'], groups)
+        fluxBounds = np.searchsorted(fluxRecords['group'], groups)
         # The collation is done, we make some evaluations.
-        for a in arraySpecs:
-            for b in bandNames:
-                r = arraySpecs[a][b]
+        arraySpecs = {}
+        stats = np.full(( 4, nGroups ), np.nan)
+        for ( i, arr ) in enumerate(arrayClasses):
+            arraySpecs[arr] = {}
+            for ( j, b ) in enumerate(bandNames):
+                g = i * len(bandNames) + j
+                r = {
+                    'closurePhases': phaseRecords['closurePhase'][phaseBounds[g]:phaseBounds[g + 1]],
+                    'defects': fluxRecords['defect'][fluxBounds[g]:fluxBounds[g + 1]],
+                    'fluxDensities': fluxRecords['fluxDensity'][fluxBounds[g]:fluxBounds[g + 1]],
+                    'closurePhaseMedian': None, 'defectMedian': None,
+                    'fluxDensityMedian': None, 'fluxDensityStdDev': None,
+                    'qualityFlag': None
+                }
                 if len(r['closurePhases']) > 0:
                     r['closurePhaseMedian'] = np.median(r['closurePhases'])
+                    stats[0, g] = r['closurePhaseMedian']
                 if len(r['defects']) > 0:
                     r['defectMedian'] = np.median(r['defects'])
-                if len(r['fluxDensities']) > 0:
                     r['fluxDensityMedian'] = np.median(r['fluxDensities'])
                     r['fluxDensityStdDev'] = np.std(r['fluxDensities'])
-                if (r['closurePhaseMedian'] is not None and r['defectMedian'] is not None and
-                    r['fluxDensityMedian'] is not None and r['fluxDensityStdDev'] is not None):
-                    r['qualityFlag'] = 4 # The maximum value.
-                    if r['closurePhaseMedian'] > 3:
-                        r['qualityFlag'] -= 1
-                    if r['closurePhaseMedian'] > 10:
-                        r['qualityFlag'] -= 1
-                    if r['defectMedian'] > 1.05:
-                        r['qualityFlag'] -= 1
-                    if r['fluxDensityStdDev'] > (r['fluxDensityMedian'] / 2):
-                        r['qualityFlag'] -= 1
+                    stats[1:, g] = [ r['defectMedian'], r['fluxDensityMedian'], r['fluxDensityStdDev'] ]
+                arraySpecs[arr][b] = r
+        # The quality flag starts at the maximum, 4, and loses one for each problem.
+        ( closurePhaseMedians, defectMedians, fluxDensityMedians, fluxDensityStdDevs ) = stats
+        complete = (np.concatenate(( [ phaseBounds[1:] > phaseBounds[:-1] ],
+                                     [ fluxBounds[1:] > fluxBounds[:-1] ] ))).all(axis=0)
+        qualityFlags = (4 - (closurePhaseMedians > 3).astype(int) - (closurePhaseMedians > 10).astype(int) -
+                        (defectMedians > 1.05).astype(int) -
+                        (fluxDensityStdDevs > (fluxDensityMedians / 2)).astype(int))
+        for g in np.flatnonzero(complete).tolist():
+            arraySpecs[arrayClasses[g // len(bandNames)]][bandNames[g % len(bandNames)]]['qualityFlag'] = int(qualityFlags[g])
+        self.__calibratorDetails['collation'] = arraySpecs
         return self
+
+    def getCollation(self, array=None, band=None):
+        # Return what collateDetails worked out, for all arrays and bands, or
+        # one array or one band in one array.
+        collation = self.__calibratorDetails['collation']
+        if collation is None or array is None:
+            return collation
+        if array in arrayNames:
+            array = arrayNames[array]
+        if array not in collation:
+            return None
+        if band is None:
+            return collation[array]
+        return collation[array].get(band)
         
 class calibratorSearchResponse:
     def __init__(self):
@@ -208,6 +300,52 @@ class calibratorSearchResponse:
     def getAllCalibrators(self):
         return self.__calibrators['list']
 
+    def __fetchQualities(self, cals=None, maxFetches=None):
+        # Get the qualities of the calibrators at the same time, and return
+        # the error for each one that failed in the way fetchErrors expects.
+        # Any other error is raised.
+        if maxFetches is None:
+            maxFetches = maxQualityFetches
+        failures = {}
+        if len(cals) == 0:
+            return failures
+        with ThreadPoolExecutor(max_workers=min(maxFetches, len(cals))) as pool:
+            fetches = [ pool.submit(c.fetchQualities) for c in cals ]
+            for ( c, f ) in zip(cals, fetches):
+                try:
+                    f.result()
+                except fetchErrors as e:
+                    failures[c] = e
+        return failures
+
+    def fetchQualities(self, maxFetches=None):
+        # Get the qualities of all the calibrators at the same time. Any that
+        # fail are left without qualities, and the first failure is raised
+        # once the rest have finished.
+        cals = [ c['calibrator'] for c in self.__calibrators['list'] if c['calibrator'] is not None ]
+        failures = self.__fetchQualities(cals, maxFetches)
+        for c in cals:
+            if c in failures:
+                raise failures[c]
+        return self
+
+    async def aFetchQualities(self, maxFetches=None):
+        # The same as fetchQualities, for use with asyncio.
+        if maxFetches is None:
+            maxFetches = maxQualityFetches
+        cals = [ c['calibrator'] for c in self.__calibrators['list'] if c['calibrator'] is not None ]
+        slots = asyncio.Semaphore(maxFetches)
+
+        async def fetch(cal):
+            async with slots:
+                await cal.aFetchQualities()
+
+        results = await asyncio.gather(*[ fetch(c) for c in cals ], return_exceptions=True)
+        for r in results:
+            if isinstance(r, BaseException):
+                raise r
+        return self
+
     def selectBest(self, array=None):
         # Choose the best calibrator from this list.
         # We do this by looking for the nearest calibrator with quality 4 in the
@@ -224,26 +362,32 @@ class calibratorSearchResponse:
                 array = arrayNames[tarray]
         
         # Work out the band first.
-        firstFrequency = self.__calibrators['list'][0]['calibrator'].getFluxDensities()[0]['frequency']
+        cals = self.__calibrators['list']
+        firstFrequency = cals[0]['calibrator'].getFluxDensities()[0]['frequency']
         bandName = __frequency2BandName(firstFrequency)
         desiredScore = 4
         calFound = False
         calFd = None
+        # Get the qualities of all the candidates at the same time before we
+        # look at them. A fetch that failed is only raised if we get to that
+        # candidate, as it would have been if we had asked one at a time.
+        failures = self.__fetchQualities([ c['calibrator'] for c in cals if c['calibrator'] is not None ])
         while (calFound == False and desiredScore > 1):
-            for i in range(0, len(self.__calibrators['list'])):
-                tcal = self.__calibrators['list'][i]['calibrator']
+            for i in range(0, len(cals)):
+                tcal = cals[i]['calibrator']
                 tFd = tcal.getFluxDensities(firstFrequency)[0]['fluxDensity']
                 if tcal is not None and (calFound == False or
                                          (calFound == True and tFd >= 2 * calFd and
-                                          self.__calibrators['list'][i]['distance'] < 10)):
-                    tcal.fetchQualities()
+                                          cals[i]['distance'] < 10)):
+                    if tcal in failures:
+                        raise failures[tcal]
                     tqual = tcal.getQuality(array, bandName)
                     if (tqual == desiredScore):
                         if self.__calibrators['bestIndex'] is None:
                             self.__calibrators['bestIndex'] = i
                             calFd = tFd
                             calFound = True
-                        elif (tFd >= (2 * calFd) and self.__calibrators['list'][i]['distance'] < 10):
+                        elif (tFd >= (2 * calFd) and cals[i]['distance'] < 10):
                             # We will accept a calibrator further away, if it is much brighter.
                             self.__calibrators['bestIndex'] = i
                             calFd = tFd
@@ -290,37 +434,160 @@ def __model2FluxDensity(model=None, frequency=None):
 
 def _calibrator__model2FluxDensity(model=None, frequency=None):
     return __model2FluxDensity(model, frequency)    
+
+def modelCoefficients(models=None):
+    # Take some flux density models (like the fluxdensity_fit_coeff of the
+    # measurements) and return an (N x T) array of the parameters that get
+    # used, with zeros after the end of the shorter ones. The models can be
+    # an (N x K) array, or a list of N models of any lengths. Like
+    # __model2FluxDensity, the last parameter of each model isn't used.
+    if isinstance(models, np.ndarray) and models.ndim == 2:
+        if models.shape[1] == 0:
+            raise IndexError("list index out of range")
+        return np.array(models[:, :max(1, models.shape[1] - 1)], dtype=float)
+    if len(models) == 0:
+        return np.zeros(( 0, 1 ))
+    lengths = np.array(list(map(len, models)))
+    coefficients = np.zeros(( len(models), max(1, int(lengths.max()) - 1) ))
+    for length in np.unique(lengths).tolist():
+        if length == 0:
+            raise IndexError("list index out of range")
+        rows = np.flatnonzero(lengths == length)
+        n = max(1, length - 1)
+        coefficients[rows, :n] = np.array([ models[i] for i in rows.tolist() ], dtype=float)[:, :n]
+    return coefficients
+
+def modelFluxDensities(models=None, frequencies=None):
+    # Evaluate N flux density models (as for modelCoefficients) at F
+    # frequencies (MHz) all at once, and return the (N x F) array of flux
+    # densities (Jy). These agree with __model2FluxDensity to within rounding.
+    coefficients = modelCoefficients(models)
+    logF = np.log10(np.atleast_1d(np.asarray(frequencies, dtype=float)) / 1000)
+    logPowers = logF[np.newaxis, :] ** np.arange(0, coefficients.shape[1])[:, np.newaxis]
+    return 10**(coefficients @ logPowers)
+
+def __bandModelFluxDensities(models=None, bands=None, bandFrequencies=None):
+    # Evaluate many models at once, each at the frequency of its band, where
+    # bands holds an index into bandFrequencies for each model. These agree
+    # with __model2FluxDensity to within rounding.
+    if len(models) == 0:
+        return np.zeros(0)
+    coefficients = modelCoefficients(models)
+    nTerms = coefficients.shape[1]
+    # There are only a few frequencies, so we work out the powers of each
+    # one the same way __model2FluxDensity does.
+    logPowers = np.ones(( len(bandFrequencies), nTerms ))
+    for ( b, frequency ) in enumerate(bandFrequencies):
+        logF = np.log10(float(frequency) / 1000)
+        for j in range(1, nTerms):
+            logPowers[b, j] = logF**j
+    logPowers = logPowers[bands]
+    logS = coefficients[:, 0].copy()
+    for j in range(1, nTerms):
+        logS += coefficients[:, j] * logPowers[:, j]
+    return np.power(10.0, logS)
+
+def _calibrator__bandModelFluxDensities(models=None, bands=None, bandFrequencies=None):
+    return __bandModelFluxDensities(models, bands, bandFrequencies)
     
-def __getValue(xmlNode=None, tagName=None):
-    if (xmlNode is not None and tagName is not None):
-        return xmlNode.getElementsByTagName(tagName)[0].childNodes[0].data
+# The cache of responses from the server, if one is being used.
+__cache = None
 
-def __communications(data=None, parseType=None):
-    serverName = "www.narrabri.atnf.csiro.au"
-    serverProtocol = "https://"
-    serverScript = "/cgi-bin/Calibrators/new/caldb_v3.pl"
+def setCache(cache=None):
+    # Keep the server responses in a cache (like a calibrator_cache.calibratorCache),
+    # or stop caching if cache is None.
+    global __cache
+    __cache = cache
 
-    if data is None:
-        return None
+def getCache():
+    return __cache
+
+# A local calibrator catalogue to search instead of the server, if set.
+__catalogue = None
 
-    session = Session()
-    postResponse = session.post(
-        url=serverProtocol + serverName + serverScript,
+def setCatalogue(catalogue=None):
+    # Answer cone searches from a calibrator_catalogue.calibratorCatalogue,
+    # or from the server again if catalogue is None.
+    global __catalogue
+    __catalogue = catalogue
+
+def getCatalogue():
+    return __catalogue
+
+def __responseText(response=None):
+    # When something goes wrong the server sends back an error page, which
+    # must not be used (or cached) as if it were an answer.
+    if response.status_code < 200 or response.status_code >= 300:
+        raise cabb_scheduler.errors.ServerError(
+            "The calibrator database server responded with status %d." % response.status_code)
+    return response.text
+
+def __fetchResponse(data=None):
+    # Ask the server, and return the text of its response.
+    postResponse = transport.post(
+        url=serverUrl,
         data=data
     )
+    return __responseText(postResponse)
+
+async def __aFetchResponse(data=None):
+    postResponse = await transport.aPost(url=serverUrl, data=data)
+    return __responseText(postResponse)
 
+def __parseResponse(responseText=None, parseType=None):
     response = {}
     if parseType is None or parseType == "json":
-        response = json.loads(postResponse.text)
+        response = json.loads(responseText)
     elif parseType == "xml":
-        response = minidom.parseString(postResponse.text)
+        response = minidom.parseString(responseText)
+    elif parseType == "text":
+        response = responseText
+    elif parseType == "cals":
+        response = __coneSearchResults(responseText)
     return response
 
+def __communications(data=None, parseType=None):
+    if data is None:
+        return None
+
+    # The response is parsed before it is cached, so one that can't be
+    # understood raises an error and is never kept.
+    parser = lambda responseText: __parseResponse(responseText, parseType)
+    if __cache is not None:
+        return __cache.fetch(data, __fetchResponse, parser)
+    return parser(__fetchResponse(data))
+
+async def __aCommunications(data=None, parseType=None):
+    # The same as __communications, for use with asyncio.
+    if data is None:
+        return None
+
+    parser = lambda responseText: __parseResponse(responseText, parseType)
+    if __cache is not None:
+        return await __cache.aFetch(data, __aFetchResponse, parser)
+    return parser(await __aFetchResponse(data))
+
 def _calibrator__communications(data=None, parseType=None):
     return __communications(data, parseType)
 
+def _calibrator__aCommunications(data=None, parseType=None):
+    return __aCommunications(data, parseType)
+
 # A routine to search for a calibrator, given an RA and Dec and a search radius.
 def coneSearch(ra=None, dec=None, radius=None, fluxLimit=None, frequencies=None):
+    if __catalogue is not None:
+        return __catalogue.coneSearch(ra, dec, radius, fluxLimit, frequencies)
+    data = __coneSearchRequest(ra, dec, radius, fluxLimit, frequencies)
+    return __communications(data, "cals")
+
+# The same as coneSearch, for use with asyncio.
+async def aConeSearch(ra=None, dec=None, radius=None, fluxLimit=None, frequencies=None):
+    if __catalogue is not None:
+        return __catalogue.coneSearch(ra, dec, radius, fluxLimit, frequencies)
+    data = __coneSearchRequest(ra, dec, radius, fluxLimit, frequencies)
+    return await __aCommunications(data, "cals")
+
+def __coneSearchRequest(ra=None, dec=None, radius=None, fluxLimit=None, frequencies=None):
     # Form the request to the calibrator database server.
     if fluxLimit is None:
         fluxLimit = 0.2
@@ -335,27 +602,47 @@ def coneSearch(ra=None, dec=None, radius=None, fluxLimit=None, frequencies=None)
         data['theta'] = radius
         data['frequencies'] = ",".join(frequencies)
         data['flimit'] = fluxLimit
-        
-    xmlresponse = __communications(data, "xml")
-    sourceList = xmlresponse.getElementsByTagName('source')
+    return data
+
+def __iterSources(responseText=None):
+    # Give back each source element in the order they appear (any sources
+    # inside another come after it, as they did with the DOM). The response
+    # is already all in memory, since it is cached as text.
+    return ElementTree.fromstring(responseText).iter("source")
+
+def __sourceValues(source=None):
+    # Return the text of the first element with each tag inside the source.
+    # Like the text of a DOM element's first child, this is None when the
+    # element is empty.
+    values = {}
+    for element in source.iter():
+        if element is not source and element.tag not in values:
+            values[element.tag] = element.text
+    return values
+
+def __sourceValue(values=None, tagName=None):
+    # Missing or empty elements are errors, as they were when we used the DOM.
+    if values.get(tagName) is None:
+        raise IndexError("no %s in the source" % tagName)
+    return values[tagName]
+
+def __coneSearchResults(responseText=None):
+    # Make the list of calibrators from the server's response.
     calList = calibratorSearchResponse()
-    for i in range(0, len(sourceList)):
-        distance = __getValue(sourceList[i], 'distance')
+    for source in __iterSources(responseText):
+        values = __sourceValues(source)
+        distance = __sourceValue(values, 'distance')
         j = 1
         fluxDensities = []
-        while (j > 0):
-            try:
-                freq = __getValue(sourceList[i], 'ffreq' + str(j))
-            except IndexError:
-                break
-
-            flux = __getValue(sourceList[i], 'fflux' + str(j))
+        while values.get('ffreq' + str(j)) is not None:
+            freq = values['ffreq' + str(j)]
+            flux = __sourceValue(values, 'fflux' + str(j))
             fluxDensities.append({ 'frequency': freq, 'fluxDensity': flux })
             j += 1
 
-        calDetails = { 'name': __getValue(sourceList[i], 'name'),
-                       'rightAscension': __getValue(sourceList[i], 'rightascension'),
-                       'declination': __getValue(sourceList[i], 'declination'),
+        calDetails = { 'name': __sourceValue(values, 'name'),
+                       'rightAscension': __sourceValue(values, 'rightascension'),
+                       'declination': __sourceValue(values, 'declination'),
                        'fluxDensities': fluxDensities
         }
         calList.addCalibrator(calDetails, distance)
@@ -19,3 +19,10 @@ class ZoomError(Exception):
     def __str__(self):
         return repr(self.value)
     
+
+class ServerError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
@@ -1,79 +1,121 @@
 # A frequency setup.
 from cabb_scheduler.zoom import zoom
 import cabb_scheduler.errors
+from array import array
+
+# The number of zoom bands available in each IF.
+nZoomBands = 16
+
+# The zoom channels of a setup with no zooms enabled.
+noZoomChannels = ( 0, ) * nZoomBands
+
+# The range of continuum centre frequencies (in MHz) usable in each band.
+bandRanges = ( ( "16cm", 1728, 2882 ), ( "4cm", 4928, 10928 ), ( "15mm", 16001, 25472 ),
+               ( "7mm", 30001, 49999 ), ( "3mm", 82501, 117699 ) )
+
+def frequencyToBand(cfreq=None):
+    # Return the band that would satisfy the specified continuum centre frequency.
+    if cfreq is not None:
+        for (band, lowFreq, highFreq) in bandRanges:
+            if (cfreq >= lowFreq and cfreq <= highFreq):
+                return band
+    return None
 
 class frequency_setup:
+    # We keep the setup in slots rather than a dictionary, since every scan has
+    # two of these.
+    __slots__ = ( '__parent', '__continuumCentre', '__channelBandwidth',
+                  '__zoomChannels', '__zoomEnabled', '__zoomGroups' )
+
     def __init__(self, parent):
         self.__parent = parent
         # Some valid and necessary defaults.
-        self.__setupDetails = { 'continuumCentre': 2100, 'channelBandwidth': 1,
-                                'zooms': [] }
-        # Assign all the zooms.
-        for i in range(0, 16):
-            self.__setupDetails['zooms'].append(zoom(self))
+        self.__continuumCentre = 2100
+        self.__channelBandwidth = 1
+        # The zooms are stored as a bitmask of which ones are enabled, and
+        # arrays of their channels and groups. Most setups never touch the
+        # zooms, so the arrays are only made when one gets changed; until then
+        # every zoom is on channel 1 in group -1.
+        self.__zoomEnabled = 0
+        self.__zoomChannels = None
+        self.__zoomGroups = None
 
     def __frequencyToBand(self, cfreq=None):
         # Return the band that would satisfy the specified continuum centre frequency.
         if cfreq is None:
-            cfreq = self.__setupDetails['continuumCentre']
-
-        if cfreq is not None:
-            if (cfreq >= 1728 and cfreq <= 2882):
-                return "16cm"
-            elif (cfreq >= 4928 and cfreq <= 10928):
-                return "4cm"
-            elif (cfreq >= 16001 and cfreq <= 25472):
-                return "15mm"
-            elif (cfreq >= 30001 and cfreq <= 49999):
-                return "7mm"
-            elif (cfreq >= 82501 and cfreq <= 117699):
-                return "3mm"
-        return None
+            cfreq = self.__continuumCentre
+        return frequencyToBand(cfreq)
 
     def getFrequencyBand(self):
         return self.__frequencyToBand()
-    
+
     def getFreq(self):
-        return self.__setupDetails['continuumCentre']
+        return self.__continuumCentre
 
     def getChannelWidth(self):
-        return self.__setupDetails['channelBandwidth']
+        return self.__channelBandwidth
 
     def getSideband(self):
         return self.__parent.getSideband()
-        
+
+    def zoomState(self, zoomnum=None):
+        # Return the channel, enabled state and group of a zoom (numbered from 1).
+        if ((zoomnum is None) or (zoomnum < 1) or (zoomnum > nZoomBands)):
+            raise cabb_scheduler.errors.ZoomError("Valid zoom number not supplied.")
+        channel = 1
+        group = -1
+        if self.__zoomChannels is not None:
+            channel = self.__zoomChannels[zoomnum - 1]
+            group = self.__zoomGroups[zoomnum - 1]
+        return (channel, (self.__zoomEnabled & (1 << (zoomnum - 1))) != 0, group)
+
+    def setZoomState(self, zoomnum=None, channel=None, enabled=None, group=None):
+        # Change the stored state of a zoom (numbered from 1). No checks are
+        # made on the values here; use the zoom object to do that.
+        if ((zoomnum is None) or (zoomnum < 1) or (zoomnum > nZoomBands)):
+            raise cabb_scheduler.errors.ZoomError("Valid zoom number not supplied.")
+        if (channel is not None or group is not None) and self.__zoomChannels is None:
+            self.__zoomChannels = array('i', [ 1 ] * nZoomBands)
+            self.__zoomGroups = array('i', [ -1 ] * nZoomBands)
+        # The arrays hold integers, but addZoom works its channels out by
+        # division, so they can arrive as whole-number floats.
+        if channel is not None:
+            self.__zoomChannels[zoomnum - 1] = int(channel)
+        if group is not None:
+            self.__zoomGroups[zoomnum - 1] = int(group)
+        if enabled == True:
+            self.__zoomEnabled |= (1 << (zoomnum - 1))
+        elif enabled == False:
+            self.__zoomEnabled &= ~(1 << (zoomnum - 1))
+        return self
+
     def getZoom(self, idx=None):
-        if idx is not None and idx >= 0 and idx < 16:
-            if (self.__setupDetails['zooms'][idx].isEnabled):
-                return self.__setupDetails['zooms'][idx]
+        if idx is not None and idx >= 0 and idx < nZoomBands:
+            return zoom(self, idx + 1)
         return None
 
     def getNZooms(self):
         # Return the number of zoom channels currently in use.
-        tw = 0
-        for i in range(0, len(self.__setupDetails['zooms'])):
-            if (self.__setupDetails['zooms'][i].isEnabled()):
-                tw += 1
-        return tw
+        return bin(self.__zoomEnabled).count("1")
 
     def getZoomGroups(self):
         # Return a list of all the zoom groups we have.
+        if self.__zoomGroups is None:
+            return [ -1 ]
         groups = []
-        for i in range(0, len(self.__setupDetails['zooms'])):
-            if (self.__setupDetails['zooms'][i].isEnabled):
-                g = self.__setupDetails['zooms'][i].getGroup()
-                if g not in groups:
-                    groups.append(g)
+        for g in self.__zoomGroups:
+            if g not in groups:
+                groups.append(g)
         return groups
 
     def setZoomChannel(self, zoomnum=None, chan=None):
         # We set a particular zoom to a particular channel.
         # This gets used a lot during load.
-        if (zoomnum is None or zoomnum < 1 or zoomnum > 16):
+        if (zoomnum is None or zoomnum < 1 or zoomnum > nZoomBands):
             raise ZoomError("Unable to set zoom information.")
         if (chan is None):
             raise ZoomError("Channel number not supplied while setting zoom info.")
-        z = self.__setupDetails['zooms'][zoomnum - 1]
+        z = zoom(self, zoomnum)
         if (chan == 0):
             # This means disable this zoom.
             z.disable()
@@ -82,23 +124,33 @@ class frequency_setup:
             z.enable()
 
     def getZoomChannel(self, zoomnum):
-        if ((zoomnum is not None) and (zoomnum >= 1) and (zoomnum <= 16)):
-            z = self.__setupDetails['zooms'][zoomnum - 1]
-            if (z.isEnabled()):
-                return self.__setupDetails['zooms'][zoomnum - 1].getChannel()
+        if ((zoomnum is not None) and (zoomnum >= 1) and (zoomnum <= nZoomBands)):
+            (channel, enabled, group) = self.zoomState(zoomnum)
+            if (enabled):
+                return channel
             else:
                 return 0
         else:
             raise ZoomError("Valid zoom number not supplied.")
-            
+
+    def getZoomChannels(self):
+        # Return the channels of all the zooms at once, with 0 for those
+        # not enabled, in the same way as getZoomChannel.
+        if self.__zoomEnabled == 0:
+            return noZoomChannels
+        channels = self.__zoomChannels
+        if channels is None:
+            channels = [ 1 ] * nZoomBands
+        return tuple([ channels[i] if (self.__zoomEnabled >> i) & 1 else 0 for i in range(0, nZoomBands) ])
+
     def getAllZooms(self):
         zobj = {}
-        for i in range(1, len(self.__setupDetails['zooms']) + 1):
+        for i in range(1, nZoomBands + 1):
             pz = self.getZoomChannel(i)
             if pz != 0:
                 zobj['zoom%d' % i] = pz
         return zobj
-    
+
     def addZoom(self, options=None):
         # Check we don't already have all the zooms.
         nZooms = self.getNZooms()
@@ -130,37 +182,59 @@ class frequency_setup:
         # Are we setting the frequency?
         if (options is not None) and ('freq' in options):
             achan = nZooms + (cchan - 1)
-            self.__setupDetails['zooms'][achan].setFreq(options['freq'])
+            czoom = zoom(self, achan + 1)
+            czoom.setFreq(options['freq'])
             # Now get the zoom channel number for this, and from this work out the
             # first zoom channel.
-            zchan = self.__setupDetails['zooms'][achan].getChannel() - (cchan - 1)
+            zchan = czoom.getChannel() - (cchan - 1)
         elif (options is not None) and ('chan' in options):
             zchan = options['chan'] - (cchan - 1)
         # Now go through all the zooms and set their channel number and group.
         for i in range(0, w):
             achan = nZooms + i
-            self.__setupDetails['zooms'][achan].setChannel(zchan + i)
-            self.__setupDetails['zooms'][achan].setGroup(ngroup)
-            self.__setupDetails['zooms'][achan].enable()
+            zoom(self, achan + 1).setChannel(zchan + i).setGroup(ngroup).enable()
         return self
-    
+
     def setFreq(self, cfreq=None):
         # Set the continuum centre-channel frequency, in MHz.
         # We also check whether the setting is valid.
         if cfreq is not None:
             if self.__frequencyToBand(cfreq) is not None:
                 # Valid frequency.
-                self.__setupDetails['continuumCentre'] = cfreq
+                self.__continuumCentre = cfreq
             else:
                 raise errors.FrequencyError("Specified continuum centre frequency is not achievable.")
         return self
 
+    def setFields(self, cfreq=None, bandw=None):
+        # Set the continuum centre frequency and channel width without any
+        # checks; the schedule's bulk loader checks them afterwards.
+        self.__continuumCentre = cfreq
+        self.__channelBandwidth = bandw
+        return self
+
+    def getZoomFields(self):
+        # Return the raw zoom storage: the enabled bitmask, and the channel and
+        # group arrays (both None if no zoom has been changed).
+        return ( self.__zoomEnabled, self.__zoomChannels, self.__zoomGroups )
+
+    def setZoomFields(self, enabled=0, channels=None, groups=None):
+        # Replace the raw zoom storage, without any checks.
+        self.__zoomEnabled = enabled
+        if channels is None or groups is None:
+            self.__zoomChannels = None
+            self.__zoomGroups = None
+        else:
+            self.__zoomChannels = array('i', channels)
+            self.__zoomGroups = array('i', groups)
+        return self
+
     def setChannelWidth(self, bandw=None):
         # Set the channel width of each continuum channel, in MHz.
         if bandw is not None:
             if bandw == 1 or bandw == 64:
                 # The only two supported widths.
-                self.__setupDetails['channelBandwidth'] = bandw
+                self.__channelBandwidth = bandw
             else:
                 raise errors.FrequencyError("Specified continuum channel width is unsupported.")
         return self
@@ -169,20 +243,20 @@ class frequency_setup:
         # Return a classification of this setup, to make it easy to
         # check if two IFs are compatible.
         c = { 'band': "", 'corrConfigs': [] }
-        c['band'] = self.__frequencyToBand(self.__setupDetails['continuumCentre'])
+        c['band'] = self.__frequencyToBand(self.__continuumCentre)
         # Add all the compatible CABB configurations.
         n = self.getNZooms()
-        if (self.__setupDetails['channelBandwidth'] == 1 and
+        if (self.__channelBandwidth == 1 and
             n == 0):
             # 1 MHz continuum, no zooms necessary.
             c['corrConfigs'].append("1M")
             c['corrConfigs'].append("1MZ")
             c['corrConfigs'].append("1M64MZ")
-        elif (self.__setupDetails['channelBandwidth'] == 1 and
+        elif (self.__channelBandwidth == 1 and
               n > 0):
             # 1 MHz continuum, zooms required.
             c['corrConfigs'].append("1MZ")
-        elif (self.__setupDetails['channelBandwidth'] == 64):
+        elif (self.__channelBandwidth == 64):
             # 64 MHz continuum, zooms required.
             c['corrConfigs'].append("64MZ")
             c['corrConfigs'].append("1M64MZ")
@@ -0,0 +1,141 @@
+# A read-only schedule that reads its scans from a file only when asked.
+from cabb_scheduler.schedule import schedule
+from array import array
+import mmap
+import re
+
+# Finds the line that starts each scan.
+scanStartPattern = re.compile(rb'^[ \t]*\$SCAN\*V5[ \t]*\r?$', re.M)
+
+class mappedSchedule:
+    # A scan in a schedule file only contains the lines that are different
+    # to the scan before it, so to make scan N we have to know what all the
+    # scans before it set. We remember that state every checkpointInterval
+    # scans, so no scan needs more than that many scans to be read again.
+
+    def __init__(self, name=None, checkpointInterval=256):
+        self.__file = None
+        self.__map = None
+        # The byte offset of the start of each scan.
+        self.__offsets = array('q')
+        self.__checkpointInterval = checkpointInterval
+        # The state before every checkpointInterval'th scan, as a tuple of
+        # the inherited options and enabled zooms.
+        self.__checkpoints = [ ( {}, {} ) ]
+        # The scans that have been asked for so far.
+        self.__scans = {}
+        # This is used to understand the lines and make the scans.
+        self.__maker = schedule()
+        self.__maker.disableAutoCalibrators()
+        if name is not None:
+            self.open(name)
+
+    def open(self, name=None):
+        # Map the schedule file and find where each scan starts.
+        self.close()
+        if name is not None:
+            self.__file = open(name, 'rb')
+            try:
+                self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file can't be mapped, and has no scans anyway.
+                self.__map = None
+            if self.__map is not None:
+                self.__offsets = array('q', [ m.start() for m in scanStartPattern.finditer(self.__map) ])
+        return self
+
+    def close(self):
+        if self.__map is not None:
+            self.__map.close()
+        if self.__file is not None:
+            self.__file.close()
+        self.__file = None
+        self.__map = None
+        self.__offsets = array('q')
+        self.__checkpoints = [ ( {}, {} ) ]
+        self.__scans = {}
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    def getNumberOfScans(self):
+        return len(self.__offsets)
+
+    def __scanLines(self, idx):
+        # Return the lines of the scan, without its start and end lines.
+        start = self.__offsets[idx]
+        end = self.__map.find(b"$SCANEND", start)
+        if end == -1:
+            end = len(self.__map)
+        return self.__map[start:end].decode().splitlines()[1:]
+
+    def __readScan(self, idx, inherited, zooms):
+        # Return the options that make the scan, and update the inherited
+        # options and zooms with what it sets.
+        own = {}
+        for line in self.__scanLines(idx):
+            lineOption = self.__maker.lineOption(line.strip())
+            if lineOption is None:
+                continue
+            ( option, value ) = lineOption
+            if option.startswith("zoom"):
+                if int(value) == 0:
+                    zooms.pop(option, None)
+                else:
+                    zooms[option] = value
+            else:
+                own[option] = value
+        options = dict(inherited)
+        options.update(own)
+        options.update(zooms)
+        options['nocopy'] = True
+        # Every property but the CalCode is passed on to the next scan.
+        own.pop("calCode", None)
+        inherited.update(own)
+        return options
+
+    def __makeScan(self, options):
+        self.__maker.clear()
+        return self.__maker.addScan(options)
+
+    def getScan(self, idx=None):
+        # Return the specified scan, reading only what we need to make it.
+        if idx is None:
+            return None
+        idx = range(len(self.__offsets))[idx]
+        if idx in self.__scans:
+            return self.__scans[idx]
+        checkpoint = idx // self.__checkpointInterval
+        # Get to the nearest checkpoint before the scan.
+        while len(self.__checkpoints) <= checkpoint:
+            ( inherited, zooms ) = self.__checkpoints[-1]
+            inherited = dict(inherited)
+            zooms = dict(zooms)
+            first = (len(self.__checkpoints) - 1) * self.__checkpointInterval
+            for i in range(first, first + self.__checkpointInterval):
+                self.__readScan(i, inherited, zooms)
+            self.__checkpoints.append(( inherited, zooms ))
+        ( inherited, zooms ) = self.__checkpoints[checkpoint]
+        inherited = dict(inherited)
+        zooms = dict(zooms)
+        for i in range(checkpoint * self.__checkpointInterval, idx):
+            self.__readScan(i, inherited, zooms)
+        self.__scans[idx] = self.__makeScan(self.__readScan(idx, inherited, zooms))
+        return self.__scans[idx]
+
+    def __iter__(self):
+        # Go through all the scans in order, reading each scan only once. The
+        # scans made here aren't kept, so this works for any size of file.
+        inherited = {}
+        zooms = {}
+        for i in range(0, len(self.__offsets)):
+            options = self.__readScan(i, inherited, zooms)
+            if i in self.__scans:
+                yield self.__scans[i]
+            else:
+                yield self.__makeScan(options)
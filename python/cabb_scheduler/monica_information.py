@@ -1,5 +1,5 @@
 # A library to handle dealing with ATCA MoniCA points.
-from requests import Session
+import cabb_scheduler.transport as transport
 import json
 import cabb_scheduler.errors
 
@@ -91,13 +91,10 @@ class monicaServer:
                     return self.points[i]
         return None
 
-    def __comms(self, data=None):
-        if data is None:
-            return None
+    def __url(self):
+        return self.protocol + "://" + self.webserverName + "/" + self.webserverPath
 
-        session = Session()
-        url = self.protocol + "://" + self.webserverName + "/" + self.webserverPath
-        postResponse = session.post( url=url, data=data )
+    def __parse(self, postResponse=None):
         # Try to convert to JSON first, in case it fails.
         try:
             jResponse = json.loads(postResponse.text)
@@ -105,11 +102,33 @@ class monicaServer:
             return None
         return json.loads(postResponse.text)
 
-    def updatePoints(self):
+    def __comms(self, data=None):
+        if data is None:
+            return None
+
+        postResponse = transport.post( url=self.__url(), data=data )
+        return self.__parse(postResponse)
+
+    async def __aComms(self, data=None):
+        if data is None:
+            return None
+
+        postResponse = await transport.aPost( url=self.__url(), data=data )
+        return self.__parse(postResponse)
+
+    def __pointsRequest(self):
         allPointNames = [ p.getPointName() for p in self.points ]
-        data = { 'action': "points", 'server': self.serverName,
+        return { 'action': "points", 'server': self.serverName,
                  'points': ";".join(allPointNames) }
-        response = self.__comms(data)
+
+    def updatePoints(self):
+        return self.__storePoints(self.__comms(self.__pointsRequest()))
+
+    async def aUpdatePoints(self):
+        # The same as updatePoints, for use with asyncio.
+        return self.__storePoints(await self.__aComms(self.__pointsRequest()))
+
+    def __storePoints(self, response=None):
         if response is not None and "pointData" in response:
             for i in range(0, len(response['pointData'])):
                 if response['pointData'][i]['pointName'] is not None:
@@ -0,0 +1,47 @@
+# Routines to work with the positions of sources on the sky.
+import numpy as np
+import math
+
+def positionToRadians(raString=None, decString=None):
+    # Turn sexagesimal right ascension and declination strings into radians.
+    raEls = raString.split(":")
+    decEls = decString.split(":")
+    raRads = (math.pi / 180.0) * 15.0 * (float(raEls[0]) + float(raEls[1]) / 60.0 +
+                                         float(raEls[2]) / 3600.0)
+    decSign = 1.0
+    if decString.startswith("-"):
+        decSign = -1.0
+    decRads = decSign * (math.pi / 180.0) * (decSign * float(decEls[0]) +
+                                             float(decEls[1]) / 60.0 + float(decEls[2]) / 3600.0)
+    return (raRads, decRads)
+
+def angularSeparations(rightAscensions=None, declinations=None,
+                       otherRightAscensions=None, otherDeclinations=None, elementwise=False):
+    # Return the angular distances (in degrees) between positions given in
+    # radians. With one set of N positions, this is the N x N matrix of the
+    # distances between each pair. With two sets of N and M positions it is
+    # the N x M matrix of distances from each of the first to each of the
+    # second, and if either set is a single position (not in an array) the
+    # distances from it to each of the others. If elementwise is True, the
+    # two sets must be the same size, and the distance from each position
+    # to its partner in the other set is returned instead. We use the
+    # Vincenty formula, which is accurate for every separation, from tiny
+    # to antipodal.
+    ras = np.asarray(rightAscensions, dtype=float)
+    decs = np.asarray(declinations, dtype=float)
+    if otherRightAscensions is None or otherDeclinations is None:
+        ( otherRas, otherDecs ) = ( ras, decs )
+    else:
+        otherRas = np.asarray(otherRightAscensions, dtype=float)
+        otherDecs = np.asarray(otherDeclinations, dtype=float)
+    if ras.ndim > 0 and otherRas.ndim > 0 and not elementwise:
+        ras = ras[..., np.newaxis]
+        decs = decs[..., np.newaxis]
+    deltaRas = otherRas - ras
+    ( sinDecs, cosDecs ) = ( np.sin(decs), np.cos(decs) )
+    ( sinOtherDecs, cosOtherDecs ) = ( np.sin(otherDecs), np.cos(otherDecs) )
+    cosDeltaRas = np.cos(deltaRas)
+    across = cosOtherDecs * np.sin(deltaRas)
+    along = cosDecs * sinOtherDecs - sinDecs * cosOtherDecs * cosDeltaRas
+    return np.degrees(np.arctan2(np.hypot(across, along),
+                                 sinDecs * sinOtherDecs + cosDecs * cosOtherDecs * cosDeltaRas))
@@ -1,132 +1,229 @@
 # A scan has several required fields.
 from cabb_scheduler.frequency_setup import frequency_setup
 from cabb_scheduler.errors import ScanError
+from cabb_scheduler.positions import positionToRadians
 import re
 import cabb_scheduler.calibrator_database as calibrator_database
-from random import choice
+from random import choices
 from string import ascii_uppercase
 
 idLength = 12
 
+# The values allowed for the enumerated properties.
+epochs = ( "J2000", "B1950", "AzEl", "Galactic" )
+calCodes = ( "", "C", "B" )
+scanTypes = ( "Normal", "Dwell", "Mosaic", "Point", "Paddle", "OTFMos" )
+pointings = ( "Global", "Offset", "Offpnt", "Refpnt", "Update" )
+timeCodes = ( "LST", "UTC" )
+wraps = ( "North", "South", "Closest" )
+
+# The patterns that TV channel and frequency configuration specifications
+# must match (if they aren't one of the special values).
+tvChannelsPattern = re.compile('^\d+\,\d+\,\d+\,\d+$')
+freqConfigPatterns = ( re.compile('^Master\d+$'), re.compile('^Slave-\d+$') )
+
+# The properties that getFields and setFields work with, in order. The date
+# isn't here because setDate doesn't change it.
+fieldNames = ( 'source', 'rightAscension', 'declination', 'epoch', 'calCode', 'scanLength',
+               'scanType', 'pointing', 'observer', 'project', 'time', 'timeCode',
+               'averaging', 'environment', 'pointingOffset1', 'pointingOffset2',
+               'tvChannels', 'command', 'catVel', 'freqConfig', 'comment', 'wrap',
+               'freq1', 'freq2', 'bw1', 'bw2' )
+
+def durationToSeconds(durString=None):
+    # Turn a HH:MM:SS scan length into a number of seconds.
+    durEls = durString.split(":")
+    return int(durEls[0]) * 3600 + int(durEls[1]) * 60 + int(durEls[2])
+
 class scan:
-    def __init__(self):
-        # We put all the properties of the scan in a dictionary, and store
-        # some necessary defaults.
-        self.__scanDetails = { 'source': "",
-                               'rightAscension': "00:00:00",
-                               'declination': "00:00:00",
-                               'epoch': "J2000",
-                               'calCode': "",
-                               'scanLength': "00:10:00",
-                               'scanType': "Normal",
-                               'pointing': "Global",
-                               'observer': "",
-                               'project': "C999",
-                               'time': "00:00:00",
-                               'timeCode': "LST",
-                               'date': "24/01/2017",
-                               'config': "null",
-                               'averaging': 1,
-                               'environment': 0,
-                               'pointingOffset1': 0,
-                               'pointingOffset2': 0,
-                               'tvChannels': "null",
-                               'command': "",
-                               'catVel': "",
-                               'freqConfig': "null",
-                               'comment': "",
-                               'wrap': "Closest",
-                               'id': ''.join(choice(ascii_uppercase) for i in range(idLength)),
-                               'setupF1': frequency_setup(self),
-                               'setupF2': frequency_setup(self) }
+    # A scan holds all its properties in slots rather than a dictionary, to
+    # keep the memory used by large schedules down.
+    __slots__ = ( '__parent', '__source', '__rightAscension', '__declination', '__epoch',
+                  '__calCode', '__scanLength', '__scanType', '__pointing', '__observer',
+                  '__project', '__time', '__timeCode', '__date', '__config',
+                  '__averaging', '__environment', '__pointingOffset1',
+                  '__pointingOffset2', '__tvChannels', '__command', '__catVel',
+                  '__freqConfig', '__comment', '__wrap', '__id', '__setupF1',
+                  '__setupF2', '__startDate', '__position', '__duration' )
+
+    def __init__(self, parent=None, scanId=None):
+        # The schedule this scan belongs to, if any; it needs to know when
+        # our ID changes.
+        self.__parent = parent
+        # Store some necessary defaults.
+        self.__source = ""
+        self.__rightAscension = "00:00:00"
+        self.__declination = "00:00:00"
+        # The position in radians, worked out when it's first asked for.
+        self.__position = None
+        self.__epoch = "J2000"
+        self.__calCode = ""
+        self.__scanLength = "00:10:00"
+        # The length in seconds, worked out when it's first asked for.
+        self.__duration = None
+        self.__scanType = "Normal"
+        self.__pointing = "Global"
+        self.__observer = ""
+        self.__project = "C999"
+        self.__time = "00:00:00"
+        self.__timeCode = "LST"
+        self.__date = "24/01/2017"
+        self.__config = "null"
+        self.__averaging = 1
+        self.__environment = 0
+        self.__pointingOffset1 = 0
+        self.__pointingOffset2 = 0
+        self.__tvChannels = "null"
+        self.__command = ""
+        self.__catVel = ""
+        self.__freqConfig = "null"
+        self.__comment = ""
+        self.__wrap = "Closest"
+        # A new scan gets a random ID, unless we're recreating a known scan.
+        if scanId is not None and len(scanId) == idLength:
+            self.__id = scanId
+        else:
+            self.__id = ''.join(choices(ascii_uppercase, k=idLength))
+        self.__setupF1 = frequency_setup(self)
+        self.__setupF2 = frequency_setup(self)
 
     def getId(self):
-        return self.__scanDetails['id']
+        return self.__id
 
     def setId(self, nId=None):
         if nId is not None and len(nId) == idLength:
-            self.__scanDetails['id'] = nId
+            oId = self.__id
+            self.__id = nId
+            if self.__parent is not None and oId != nId:
+                self.__parent.scanIdChanged(self, oId)
         return self
 
     def getSource(self):
-        return self.__scanDetails['source']
+        return self.__source
 
     def getRightAscension(self):
-        return self.__scanDetails['rightAscension']
+        return self.__rightAscension
 
     def getDeclination(self):
-        return self.__scanDetails['declination']
+        return self.__declination
+
+    def getPosition(self):
+        # Return the right ascension and declination in radians.
+        if self.__position is None:
+            self.__position = positionToRadians(self.__rightAscension, self.__declination)
+        return self.__position
 
     def getEpoch(self):
-        return self.__scanDetails['epoch']
+        return self.__epoch
 
     def getCalCode(self):
-        return self.__scanDetails['calCode']
+        return self.__calCode
 
     def getScanLength(self):
-        return self.__scanDetails['scanLength']
+        return self.__scanLength
+
+    def getDurationSeconds(self):
+        # Return the scan length in seconds.
+        if self.__duration is None:
+            self.__duration = durationToSeconds(self.__scanLength)
+        return self.__duration
 
     def getScanType(self):
-        return self.__scanDetails['scanType']
+        return self.__scanType
 
     def getPointing(self):
-        return self.__scanDetails['pointing']
+        return self.__pointing
 
     def getObserver(self):
-        return self.__scanDetails['observer']
+        return self.__observer
 
     def getProject(self):
-        return self.__scanDetails['project']
+        return self.__project
 
     def getTime(self):
-        return self.__scanDetails['time']
+        return self.__time
 
     def getTimeCode(self):
-        return self.__scanDetails['timeCode']
+        return self.__timeCode
 
     def getDate(self):
-        return self.__scanDetails['date']
+        return self.__date
 
     # We skip the config getter, it is not useful.
 
     def getAveraging(self):
-        return self.__scanDetails['averaging']
+        return self.__averaging
 
     def getEnvironment(self):
-        return self.__scanDetails['environment']
+        return self.__environment
 
     def getPointingOffset1(self):
-        return self.__scanDetails['pointingOffset1']
+        return self.__pointingOffset1
 
     def getPointingOffset2(self):
-        return self.__scanDetails['pointingOffset2']
+        return self.__pointingOffset2
 
     def getTvChannels(self):
-        return self.__scanDetails['tvChannels']
+        return self.__tvChannels
 
     def getCommand(self):
-        return self.__scanDetails['command']
+        return self.__command
 
     def getCatVel(self):
-        return self.__scanDetails['catVel']
+        return self.__catVel
 
     def getFreqConfig(self):
-        return self.__scanDetails['freqConfig']
+        return self.__freqConfig
 
     def getComment(self):
-        return self.__scanDetails['comment']
+        return self.__comment
 
     def getWrap(self):
-        return self.__scanDetails['wrap']
+        return self.__wrap
 
     def IF1(self):
-        return self.__scanDetails['setupF1']
+        return self.__setupF1
 
     def IF2(self):
-        return self.__scanDetails['setupF2']
+        return self.__setupF2
+
+    def getFields(self):
+        # Return all the properties named in fieldNames at once.
+        return ( self.__source, self.__rightAscension, self.__declination, self.__epoch,
+                 self.__calCode, self.__scanLength, self.__scanType, self.__pointing,
+                 self.__observer, self.__project, self.__time, self.__timeCode,
+                 self.__averaging, self.__environment, self.__pointingOffset1,
+                 self.__pointingOffset2, self.__tvChannels, self.__command, self.__catVel,
+                 self.__freqConfig, self.__comment, self.__wrap,
+                 self.__setupF1.getFreq(), self.__setupF2.getFreq(),
+                 self.__setupF1.getChannelWidth(), self.__setupF2.getChannelWidth() )
+
+    def setFields(self, fields=None):
+        # Set all the properties named in fieldNames at once. This does none
+        # of the checks the individual setters do, so the values must already
+        # be known to be good, or be checked afterwards.
+        if fields is not None:
+            oldTiming = ( self.__scanLength, self.__rightAscension, self.__declination )
+            ( self.__source, self.__rightAscension, self.__declination, self.__epoch,
+              self.__calCode, self.__scanLength, self.__scanType, self.__pointing,
+              self.__observer, self.__project, self.__time, self.__timeCode,
+              self.__averaging, self.__environment, self.__pointingOffset1,
+              self.__pointingOffset2, self.__tvChannels, self.__command, self.__catVel,
+              self.__freqConfig, self.__comment, self.__wrap,
+              freq1, freq2, bw1, bw2 ) = fields
+            self.__position = None
+            self.__duration = None
+            if self.__parent is not None:
+                if oldTiming[0] != self.__scanLength:
+                    self.__parent.scanTimingChanged(self)
+                elif oldTiming[1:] != ( self.__rightAscension, self.__declination ):
+                    self.__parent.scanTimingChanged(self, slewOnly=True)
+            self.__setupF1.setFields(freq1, bw1)
+            self.__setupF2.setFields(freq2, bw2)
+        return self
 
     def getSideband(self):
-        fband = self.__scanDetails['setupF1'].getFrequencyBand()
+        fband = self.__setupF1.getFrequencyBand()
         if fband == "16cm":
             return -1
         elif fband == "4cm":
@@ -134,13 +231,13 @@ class scan:
         elif fband == "15mm":
             return -1
         elif fband == "7mm":
-            if self.__scanDetails['setupF1'].getFreq() < 40673:
+            if self.__setupF1.getFreq() < 40673:
                 return -1
             else:
                 return 1
         elif fband == "3mm":
-            f1 = self.__scanDetails['setupF1'].getFreq()
-            f2 = self.__scanDetails['setupF2'].getFreq()
+            f1 = self.__setupF1.getFreq()
+            f2 = self.__setupF2.getFreq()
             hif = f2
             lof = f1
             if (f2 < f1):
@@ -159,84 +256,93 @@ class scan:
         if source_name is not None:
             # Check for maximum length.
             if len(source_name) <= 10:
-                self.__scanDetails['source'] = source_name
+                self.__source = source_name
             else:
                 raise ScanError("Specified source name is too long.")
         return self
 
     def setRightAscension(self, ra=None):
         if ra is not None:
-            self.__scanDetails['rightAscension'] = ra
+            self.__rightAscension = ra
+            self.__position = None
+            if self.__parent is not None:
+                self.__parent.scanTimingChanged(self, slewOnly=True)
         return self
 
     def setDeclination(self, dec=None):
         if dec is not None:
-            self.__scanDetails['declination'] = dec
+            self.__declination = dec
+            self.__position = None
+            if self.__parent is not None:
+                self.__parent.scanTimingChanged(self, slewOnly=True)
         return self
 
     def setEpoch(self, epoch=None):
         if epoch is not None:
-            if epoch == "J2000" or epoch == "B1950" or epoch == "AzEl" or epoch == "Galactic":
-                self.__scanDetails['epoch'] = epoch
+            if epoch in epochs:
+                self.__epoch = epoch
             else:
                 raise ScanError("Unrecognised epoch specified.")
         return self
 
     def setCalCode(self, calCode=None):
         if calCode is not None:
-            if calCode == "" or calCode == "C" or calCode == "B":
-                self.__scanDetails['calCode'] = calCode
+            if calCode in calCodes:
+                self.__calCode = calCode
             else:
                 raise ScanError("Unrecognised CalCode specified.")
         return self
 
     def setScanLength(self, scanLength=None):
         if scanLength is not None:
-            self.__scanDetails['scanLength'] = scanLength
+            self.__scanLength = scanLength
+            self.__duration = None
+            if self.__parent is not None:
+                self.__parent.scanTimingChanged(self)
         return self
 
     def setScanType(self, scanType=None):
         if scanType is not None:
-            if scanType == "Normal" or scanType == "Dwell" or scanType == "Mosaic" or scanType == "Point" or scanType == "Paddle" or scanType == "OTFMos":
-                self.__scanDetails['scanType'] = scanType
+            if scanType in scanTypes:
+                self.__scanType = scanType
             else:
                 raise ScanError("Unrecognised ScanType specified.")
         return self
 
     def setPointing(self, pointing=None):
         if pointing is not None:
-            if pointing == "Global" or pointing == "Offset" or pointing == "Offpnt" or pointing == "Refpnt" or pointing == "Update":
-                self.__scanDetails['pointing'] = pointing
+            if pointing in pointings:
+                self.__pointing = pointing
             else:
                 raise ScanError("Unrecognised Pointing specified.")
         return self
 
     def setObserver(self, observer=None):
         if observer is not None:
-            self.__scanDetails['observer'] = observer
+            self.__observer = observer
         return self
 
     def setProject(self, project=None):
         if project is not None:
-            self.__scanDetails['project'] = project
+            self.__project = project
         return self
 
     def setTime(self, intTime=None):
         if intTime is not None:
-            self.__scanDetails['time'] = intTime
+            self.__time = intTime
         return self
 
     def setTimeCode(self, timeCode=None):
         if timeCode is not None:
-            if timeCode == "LST" or timeCode == "UTC":
-                self.__scanDetails['timeCode'] = timeCode
+            if timeCode in timeCodes:
+                self.__timeCode = timeCode
             else:
                 raise ScanError("Unrecognised TimeCode specified.")
         return self
 
     def setDate(self, startDate=None):
         if startDate is not None:
-            self.__scanDetails['startDate'] = startDate
+            self.__startDate = startDate
         return self
 
     def setAveraging(self, averaging=None):
@@ -244,7 +350,7 @@ class scan:
             # Ensure we look at integers.
             averaging = int(averaging)
             if averaging > 0:
-                self.__scanDetails['averaging'] = averaging
+                self.__averaging = averaging
             else:
                 raise ScanError("Averaging must be a positive, non-zero number.")
         return self
@@ -252,59 +358,57 @@ class scan:
     def setEnvironment(self, environment=None):
         if environment is not None:
             if environment >= 0 and environment < 128:
-                self.__scanDetails['environment'] = environment
+                self.__environment = environment
             else:
                 raise ScanError("Environment must be an integer between 0 and 127 inclusive.")
         return self
 
     def setPointingOffset1(self, offset=None):
         if offset is not None:
-            self.__scanDetails['pointingOffset1'] = offset
+            self.__pointingOffset1 = offset
         return self
 
     def setPointingOffset2(self, offset=None):
         if offset is not None:
-            self.__scanDetails['pointingOffset2'] = offset
+            self.__pointingOffset2 = offset
         return self
 
     def setTvChannels(self, tvchan=None):
         if tvchan is not None:
-            r = re.compile('^\d+\,\d+\,\d+\,\d+$')
-            if (r.match(tvchan) is not None) or (tvchan == 'default') or (tvchan == '') or (tvchan == 'null'):
-                self.__scanDetails['tvChannels'] = tvchan
+            if (tvChannelsPattern.match(tvchan) is not None) or (tvchan == 'default') or (tvchan == '') or (tvchan == 'null'):
+                self.__tvChannels = tvchan
             else:
                 raise ScanError("TV Channel specification is incorrect.")
         return self
 
     def setCommand(self, cmd=None):
         if cmd is not None:
-            self.__scanDetails['command'] = cmd
+            self.__command = cmd
         return self
 
     def setCatVel(self, vel=None):
         if vel is not None:
-            self.__scanDetails['catVel'] = vel
+            self.__catVel = vel
         return self
 
     def setFreqConfig(self, config=None):
         if config is not None:
-            r1 = re.compile('^Master\d+$')
-            r2 = re.compile('^Slave-\d+$')
-            if (r1.match(config) is not None) or (r2.match(config) is not None) or (config == "null"):
-                self.__scanDetails['freqConfig'] = config
+            if ((freqConfigPatterns[0].match(config) is not None) or
+                (freqConfigPatterns[1].match(config) is not None) or (config == "null")):
+                self.__freqConfig = config
             else:
                 raise ScanError("Frequency configuration is incorrectly specified.")
         return self
 
     def setComment(self, comment=None):
         if comment is not None:
-            self.__scanDetails['comment'] = comment
+            self.__comment = comment
         return self
 
     def setWrap(self, wrap=None):
         if wrap is not None:
-            if (wrap == "North") or (wrap == "South") or (wrap == "Closest"):
-                self.__scanDetails['wrap'] = wrap
+            if wrap in wraps:
+                self.__wrap = wrap
             else:
                 raise ScanError("Wrap is incorrectly specified.")
         return self
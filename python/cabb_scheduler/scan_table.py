@@ -0,0 +1,332 @@
+# A table of scans, stored column by column. This is an export format for
+# analysing a whole schedule at once (bands, durations, positions and slews
+# as array operations); it is a detached copy, and a schedule always keeps
+# its scans as scan objects. Changes made to a table only get back into a
+# schedule through schedule.loadScanTable.
+from cabb_scheduler.scan import scan, durationToSeconds, epochs, calCodes, scanTypes, pointings, timeCodes, wraps
+from cabb_scheduler.frequency_setup import bandRanges, frequencyToBand, nZoomBands
+from cabb_scheduler.positions import positionToRadians, angularSeparations
+import cabb_scheduler.calibrator_database as calibrator_database
+import cabb_scheduler.errors
+import numpy as np
+
+class scanTable:
+    # The columns we keep, as (name, scan getter, scan setter, kind). Columns
+    # of kind "category" are stored as small integer codes into the list of
+    # allowed values, and "text" columns are kept as Python strings.
+    columns = (
+        ( 'source', "getSource", "setSource", "text" ),
+        ( 'rightAscension', "getRightAscension", "setRightAscension", "text" ),
+        ( 'declination', "getDeclination", "setDeclination", "text" ),
+        ( 'epoch', "getEpoch", "setEpoch", "category" ),
+        ( 'calCode', "getCalCode", "setCalCode", "category" ),
+        ( 'scanLength', "getScanLength", "setScanLength", "text" ),
+        ( 'scanType', "getScanType", "setScanType", "category" ),
+        ( 'pointing', "getPointing", "setPointing", "category" ),
+        ( 'observer', "getObserver", "setObserver", "text" ),
+        ( 'project', "getProject", "setProject", "text" ),
+        ( 'time', "getTime", "setTime", "text" ),
+        ( 'timeCode', "getTimeCode", "setTimeCode", "category" ),
+        ( 'date', "getDate", "setDate", "text" ),
+        ( 'averaging', "getAveraging", "setAveraging", "integer" ),
+        ( 'environment', "getEnvironment", "setEnvironment", "integer" ),
+        ( 'pointingOffset1', "getPointingOffset1", "setPointingOffset1", "float" ),
+        ( 'pointingOffset2', "getPointingOffset2", "setPointingOffset2", "float" ),
+        ( 'tvChannels', "getTvChannels", "setTvChannels", "text" ),
+        ( 'command', "getCommand", "setCommand", "text" ),
+        ( 'catVel', "getCatVel", "setCatVel", "text" ),
+        ( 'freqConfig', "getFreqConfig", "setFreqConfig", "text" ),
+        ( 'comment', "getComment", "setComment", "text" ),
+        ( 'wrap', "getWrap", "setWrap", "category" ),
+        ( 'id', "getId", "setId", "text" )
+    )
+
+    categories = { 'epoch': epochs, 'calCode': calCodes, 'scanType': scanTypes,
+                   'pointing': pointings, 'timeCode': timeCodes, 'wrap': wraps }
+
+    __dtypes = { 'text': object, 'category': np.int8, 'integer': np.int64, 'float': np.float64 }
+
+    def __init__(self, scans=None):
+        self.__size = 0
+        self.__capacity = 0
+        self.__kinds = {}
+        for (name, getter, setter, kind) in self.columns:
+            self.__kinds[name] = kind
+        self.__data = {}
+        # The continuum frequencies and channel widths, indexed by [scan, IF].
+        self.__freqs = None
+        self.__channelWidths = None
+        # The zoom channels, indexed by [scan, IF, zoom]; 0 means disabled.
+        self.__zooms = None
+        # Columns derived from the text ones, so we only parse them once.
+        self.__durations = None
+        self.__rightAscensions = None
+        self.__declinations = None
+        self.__allocate(16)
+        # A scan used to check and tidy values before they go in the table, so
+        # a view enforces exactly the same rules as a real scan.
+        self.__checker = scan()
+        if scans is not None:
+            self.appendScans(scans)
+
+    def __allocate(self, capacity):
+        # Make room for capacity scans, keeping what is already stored.
+        def grow(old, shape, dtype, fill):
+            new = np.full(shape, fill, dtype=dtype)
+            if old is not None:
+                new[:self.__size] = old[:self.__size]
+            return new
+        for (name, getter, setter, kind) in self.columns:
+            self.__data[name] = grow(self.__data.get(name), capacity, self.__dtypes[kind], 0)
+        self.__freqs = grow(self.__freqs, (capacity, 2), np.int64, 0)
+        self.__channelWidths = grow(self.__channelWidths, (capacity, 2), np.int64, 0)
+        self.__zooms = grow(self.__zooms, (capacity, 2, nZoomBands), np.int32, 0)
+        self.__durations = grow(self.__durations, capacity, np.int64, 0)
+        self.__rightAscensions = grow(self.__rightAscensions, capacity, np.float64, 0)
+        self.__declinations = grow(self.__declinations, capacity, np.float64, 0)
+        self.__capacity = capacity
+
+    def getNumberOfScans(self):
+        return self.__size
+
+    def appendScan(self, nscan=None):
+        # Copy a scan into the end of the table.
+        if nscan is not None:
+            if self.__size == self.__capacity:
+                self.__allocate(self.__capacity * 2)
+            idx = self.__size
+            self.__size += 1
+            for (name, getter, setter, kind) in self.columns:
+                self.__setColumnValue(name, idx, getattr(nscan, getter)())
+            for (i, setup) in enumerate(( nscan.IF1(), nscan.IF2() )):
+                self.__freqs[idx, i] = setup.getFreq()
+                self.__channelWidths[idx, i] = setup.getChannelWidth()
+                for z in range(0, nZoomBands):
+                    self.__zooms[idx, i, z] = setup.getZoomChannel(z + 1)
+        return self
+
+    def appendScans(self, scans=[]):
+        if (self.__size + len(scans)) > self.__capacity:
+            self.__allocate(max(self.__capacity * 2, self.__size + len(scans)))
+        for s in scans:
+            self.appendScan(s)
+        return self
+
+    def getScan(self, idx=None):
+        # Return a view of one row of the table, which reads and writes the
+        # table's columns. It is not a scan: use toScans to get real ones.
+        if idx is not None:
+            return scanView(self, range(self.__size)[idx])
+
+    def toScans(self, parent=None):
+        # Make a list of real scans from the table.
+        scans = []
+        for idx in range(0, self.__size):
+            nscan = scan(parent)
+            for (name, getter, setter, kind) in self.columns:
+                getattr(nscan, setter)(self.getValue(name, idx))
+            for (i, setup) in enumerate(( nscan.IF1(), nscan.IF2() )):
+                setup.setFreq(int(self.__freqs[idx, i]))
+                setup.setChannelWidth(int(self.__channelWidths[idx, i]))
+                for z in range(0, nZoomBands):
+                    if self.__zooms[idx, i, z] != 0:
+                        setup.setZoomChannel(z + 1, int(self.__zooms[idx, i, z]))
+            scans.append(nscan)
+        return scans
+
+    def getValue(self, name=None, idx=None):
+        # Return the value of one of the columns for the specified scan.
+        value = self.__data[name][idx]
+        kind = self.__kinds[name]
+        if kind == "category":
+            return self.categories[name][value]
+        elif kind == "integer":
+            return int(value)
+        elif kind == "float":
+            return float(value)
+        return value
+
+    def setValue(self, name=None, idx=None, value=None):
+        # Change the value of one of the columns for the specified scan, with
+        # the same checks a scan would make.
+        if value is not None:
+            for (cname, getter, setter, kind) in self.columns:
+                if cname == name:
+                    # This raises the same error as the scan would on a bad value,
+                    # and leaves the current value alone if the scan would ignore it.
+                    getattr(self.__checker, setter)(self.getValue(name, idx))
+                    getattr(self.__checker, setter)(value)
+                    self.__setColumnValue(name, idx, getattr(self.__checker, getter)())
+                    break
+        return self
+
+    def __setColumnValue(self, name, idx, value):
+        if self.__kinds[name] == "category":
+            value = self.categories[name].index(value)
+        self.__data[name][idx] = value
+        if name == "scanLength":
+            self.__durations[idx] = durationToSeconds(value)
+        elif name == "rightAscension" or name == "declination":
+            (self.__rightAscensions[idx], self.__declinations[idx]) = positionToRadians(
+                self.__data['rightAscension'][idx] or "00:00:00",
+                self.__data['declination'][idx] or "00:00:00")
+
+    def getFreq(self, idx=None, ifNum=1):
+        return int(self.__freqs[idx, ifNum - 1])
+
+    def setFreq(self, idx=None, ifNum=1, cfreq=None):
+        if cfreq is not None:
+            getattr(self.__checker, "IF%d" % ifNum)().setFreq(cfreq)
+            self.__freqs[idx, ifNum - 1] = cfreq
+        return self
+
+    def getChannelWidth(self, idx=None, ifNum=1):
+        return int(self.__channelWidths[idx, ifNum - 1])
+
+    def setChannelWidth(self, idx=None, ifNum=1, bandw=None):
+        if bandw is not None:
+            getattr(self.__checker, "IF%d" % ifNum)().setChannelWidth(bandw)
+            self.__channelWidths[idx, ifNum - 1] = bandw
+        return self
+
+    def getZoomChannel(self, idx=None, ifNum=1, zoomnum=None):
+        if ((zoomnum is None) or (zoomnum < 1) or (zoomnum > nZoomBands)):
+            raise cabb_scheduler.errors.ZoomError("Valid zoom number not supplied.")
+        return int(self.__zooms[idx, ifNum - 1, zoomnum - 1])
+
+    def setZoomChannel(self, idx=None, ifNum=1, zoomnum=None, chan=None):
+        setup = getattr(self.__checker, "IF%d" % ifNum)()
+        setup.setChannelWidth(self.getChannelWidth(idx, ifNum))
+        setup.setZoomChannel(zoomnum, chan)
+        self.__zooms[idx, ifNum - 1, zoomnum - 1] = chan
+        return self
+
+    def getFrequencyBands(self, ifNum=1):
+        # Return the band of each scan's IF, or None if it is not in a band.
+        freqs = self.__freqs[:self.__size, ifNum - 1]
+        conditions = [ (freqs >= lowFreq) & (freqs <= highFreq) for (band, lowFreq, highFreq) in bandRanges ]
+        choices = [ band for (band, lowFreq, highFreq) in bandRanges ]
+        return np.select(conditions, choices, default=None)
+
+    def getNZooms(self, ifNum=1):
+        # Return the number of zooms in use in each scan's IF.
+        return np.count_nonzero(self.__zooms[:self.__size, ifNum - 1], axis=1)
+
+    def getDurations(self):
+        # Return the length of each scan, in seconds.
+        return self.__durations[:self.__size].copy()
+
+    def getTotalDuration(self):
+        # Return the length of all the scans together, in seconds.
+        return int(self.__durations[:self.__size].sum())
+
+    def getPosition(self, idx=None):
+        # Return the right ascension and declination of one scan, in radians.
+        idx = range(self.__size)[idx]
+        return (float(self.__rightAscensions[idx]), float(self.__declinations[idx]))
+
+    def getPositions(self):
+        # Return the right ascension and declination of each scan, in radians.
+        return (self.__rightAscensions[:self.__size].copy(), self.__declinations[:self.__size].copy())
+
+    def getAngularDistances(self, rightAscension=None, declination=None):
+        # Return the angular distance (in degrees) from the specified position
+        # (in radians) to each scan.
+        return angularSeparations(rightAscension, declination, self.__rightAscensions[:self.__size],
+                                  self.__declinations[:self.__size])
+
+    def getSlewDistances(self):
+        # Return the angular distance (in degrees) from each scan to the next.
+        ras = self.__rightAscensions[:self.__size]
+        decs = self.__declinations[:self.__size]
+        return angularSeparations(ras[:-1], decs[:-1], ras[1:], decs[1:], elementwise=True)
+
+class frequencyView:
+    # One IF of a row in a table. It only has the parts of the frequency_setup
+    # API that the table's columns hold: the frequency, channel width and
+    # zoom channels.
+    __slots__ = ( '__table', '__idx', '__ifNum' )
+
+    def __init__(self, table, idx, ifNum):
+        self.__table = table
+        self.__idx = idx
+        self.__ifNum = ifNum
+
+    def getFrequencyBand(self):
+        return frequencyToBand(self.getFreq())
+
+    def getFreq(self):
+        return self.__table.getFreq(self.__idx, self.__ifNum)
+
+    def setFreq(self, cfreq=None):
+        self.__table.setFreq(self.__idx, self.__ifNum, cfreq)
+        return self
+
+    def getChannelWidth(self):
+        return self.__table.getChannelWidth(self.__idx, self.__ifNum)
+
+    def setChannelWidth(self, bandw=None):
+        self.__table.setChannelWidth(self.__idx, self.__ifNum, bandw)
+        return self
+
+    def getZoomChannel(self, zoomnum):
+        return self.__table.getZoomChannel(self.__idx, self.__ifNum, zoomnum)
+
+    def setZoomChannel(self, zoomnum=None, chan=None):
+        self.__table.setZoomChannel(self.__idx, self.__ifNum, zoomnum, chan)
+
+    def getNZooms(self):
+        n = 0
+        for z in range(1, nZoomBands + 1):
+            if self.getZoomChannel(z) != 0:
+                n += 1
+        return n
+
+    def getAllZooms(self):
+        zobj = {}
+        for i in range(1, nZoomBands + 1):
+            pz = self.getZoomChannel(i)
+            if pz != 0:
+                zobj['zoom%d' % i] = pz
+        return zobj
+
+class scanView:
+    # A row in a table. It has the getters and setters of a scan for each of
+    # the table's columns (they are added below), and everything lives in the
+    # table. Anything else a scan can do needs a real scan from toScans.
+    __slots__ = ( '__table', '__idx' )
+
+    def __init__(self, table, idx):
+        self.__table = table
+        self.__idx = idx
+
+    def getIndex(self):
+        return self.__idx
+
+    def getTable(self):
+        return self.__table
+
+    def getPosition(self):
+        return self.__table.getPosition(self.__idx)
+
+    def IF1(self):
+        return frequencyView(self.__table, self.__idx, 1)
+
+    def IF2(self):
+        return frequencyView(self.__table, self.__idx, 2)
+
+    def findCalibrator(self, distance=20):
+        # Search the ATCA calibrator database for a nearby calibrator.
+        return calibrator_database.coneSearch(self.getRightAscension(), self.getDeclination(), distance)
+
+def __makeViewAccessors(name, getter, setter):
+    def getValue(self):
+        return self.getTable().getValue(name, self.getIndex())
+    def setValue(self, value=None):
+        self.getTable().setValue(name, self.getIndex(), value)
+        return self
+    setattr(scanView, getter, getValue)
+    setattr(scanView, setter, setValue)
+
+for (name, getter, setter, kind) in scanTable.columns:
+    __makeViewAccessors(name, getter, setter)
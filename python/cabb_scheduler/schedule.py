@@ -1,8 +1,16 @@
 # A schedule is a collection of scans, so the schedule class
 # doesn't do much. But we do keep track of certain constants.
-from cabb_scheduler.scan import scan
-import re
-import math
+from cabb_scheduler.scan import scan, fieldNames, epochs, calCodes, scanTypes, pointings, timeCodes, wraps, tvChannelsPattern, freqConfigPatterns
+from cabb_scheduler.scan_table import scanTable
+from cabb_scheduler.positions import angularSeparations
+import cabb_scheduler.binary_schedule as binary_schedule
+import cabb_scheduler.timeline as timeline
+from cabb_scheduler.frequency_setup import nZoomBands, bandRanges
+from cabb_scheduler.errors import ScanError, FrequencyError, ZoomError
+import numpy as np
+import bisect
+import itertools
+from contextlib import contextmanager
 
 class schedule:
     # A list of all the fields we need to know about.
@@ -77,6 +85,18 @@ class schedule:
                   'object': "IF2", 'option': "bw2" }
     }
 
+    # The function that turns scans into schedule lines, made from the
+    # handlers above the first time it is needed.
+    __serializer = None
+
+    # For the trusted loader, the position in scan.fieldNames and format of
+    # each option, and the IF and zoom number of each zoom option.
+    __fieldLoaders = None
+    __zoomLoaders = None
+
+    # The option set by each key that can appear in a schedule file.
+    __lineOptions = None
+
     def __init__(self):
         # This is the list of scans, in order.
         self.scans = []
@@ -98,14 +118,269 @@ class schedule:
         self.delayScans = False
         # The lowest frequency band nominated to use pointing scans.
         self.pointingLowBand = "7mm"
+        # The index of scan IDs to the positions of the scans with that ID.
+        # Only the first __idIndexValid scans are guaranteed to be indexed; any
+        # edit in the middle of the list drops the part of the index after it,
+        # and it gets rebuilt the next time a lookup misses.
+        self.__idIndex = {}
+        self.__idIndexValid = 0
+        # The edits queued up while a batch is open, or None.
+        self.__batch = None
+        # How fast (in degrees per second) the telescope moves between scans,
+        # for estimating the slew times; None to leave them out.
+        self.slewSpeed = None
+        # The timeline: the length of each scan and the time (in seconds from
+        # the start of the schedule) at which it starts, for the first
+        # __timelineValid scans. Like the ID index, edits drop the part after
+        # them, and it gets brought up to date when it is next needed.
+        self.__timelineDurations = np.zeros(0)
+        self.__timelineStarts = np.zeros(0)
+        self.__timelineTotal = 0.0
+        self.__timelineValid = 0
+        # The scans whose timing has changed since the timeline was updated.
+        self.__timelineChanged = set()
         return None
 
     def clear(self):
         # Clear the schedule.
         self.scans = []
         self.calibratorAssociations = {}
+        self.__idIndex = {}
+        self.__idIndexValid = 0
+        self.__invalidateTimeline(0)
+        if self.__batch is not None:
+            # Anything queued referred to the scans we just threw away.
+            self.__batch = self.__newBatch()
         return self
 
+    @contextmanager
+    def batch(self):
+        # Open a batch of edits. While the batch is open, scans added with
+        # addScan or copyScans and scans removed with deleteScan are only
+        # queued, and all positions refer to the list as it was when the
+        # batch was opened. When the batch closes, the queued edits are all
+        # applied at once. Batches can be nested; the edits are applied when
+        # the outermost batch closes, and discarded if an exception is raised.
+        if self.__batch is not None:
+            yield self
+            return
+        self.__batch = self.__newBatch()
+        try:
+            yield self
+        except BaseException:
+            # Whatever went wrong (even an interrupt), the queued edits are
+            # thrown away rather than half applied.
+            self.__batch = None
+            raise
+        self.__applyBatch()
+
+    def __newBatch(self):
+        lastScan = None
+        if len(self.scans) > 0:
+            lastScan = self.scans[-1]
+        # The inserts are kept as lists of scans, keyed by the position of the
+        # scan they go before.
+        return { 'inserts': {}, 'deletes': set(), 'lastScan': lastScan, 'calCheck': False }
+
+    def __applyBatch(self):
+        # Build the new list of scans from the queued edits.
+        edits = self.__batch
+        self.__batch = None
+        # The positions where the list changes.
+        cuts = sorted(set(edits['inserts']) | edits['deletes'])
+        if len(cuts) > 0 and cuts[0] == len(self.scans):
+            # Only new scans at the end.
+            for nscan in edits['inserts'][cuts[0]]:
+                self.__appendScan(nscan)
+        elif len(cuts) > 0:
+            # Nothing before the first change moves.
+            self.__invalidateIdIndex(cuts[0])
+            self.__invalidateTimeline(cuts[0])
+            newScans = self.scans[:cuts[0]]
+            prev = cuts[0]
+            for c in cuts:
+                newScans.extend(self.scans[prev:c])
+                if c in edits['inserts']:
+                    newScans.extend(edits['inserts'][c])
+                prev = c
+                if c in edits['deletes']:
+                    prev = c + 1
+            newScans.extend(self.scans[prev:])
+            self.scans = newScans
+        if edits['calCheck'] == True:
+            self.checkCalibrators()
+
+    def __rebuildIdIndex(self):
+        # Index every scan in the schedule.
+        self.__idIndex = {}
+        for i in range(0, len(self.scans)):
+            self.__idIndex.setdefault(self.scans[i].getId(), []).append(i)
+        self.__idIndexValid = len(self.scans)
+
+    def __invalidateIdIndex(self, pos):
+        # The scans from pos onwards are about to move, so we stop trusting
+        # their positions. This must be called before the list changes.
+        for i in range(pos, self.__idIndexValid):
+            tId = self.scans[i].getId()
+            if tId not in self.__idIndex:
+                # Already dropped when we saw an earlier scan with this ID.
+                continue
+            positions = self.__idIndex[tId]
+            while len(positions) > 0 and positions[-1] >= pos:
+                positions.pop()
+            if len(positions) == 0:
+                del self.__idIndex[tId]
+        if pos < self.__idIndexValid:
+            self.__idIndexValid = pos
+
+    def scanIdChanged(self, changedScan=None, oldId=None):
+        # Called by a scan in this schedule when its ID gets changed.
+        if changedScan is None:
+            return
+        positions = self.__idIndex.get(oldId, [])
+        for i in range(0, len(positions)):
+            if self.scans[positions[i]] is changedScan:
+                pos = positions.pop(i)
+                if len(positions) == 0:
+                    del self.__idIndex[oldId]
+                bisect.insort(self.__idIndex.setdefault(changedScan.getId(), []), pos)
+                return
+        # Otherwise the scan isn't in the indexed part of the schedule, so
+        # there is nothing to update.
+
+    def scanTimingChanged(self, changedScan=None, slewOnly=False):
+        # Called by a scan in this schedule when its length (or, if slewOnly
+        # is True, its position, which only matters for slews) gets changed.
+        if changedScan is None or (slewOnly and self.slewSpeed is None):
+            return
+        if self.__timelineValid == 0:
+            # None of the timeline has been worked out yet.
+            return
+        if self.__idIndexValid >= self.__timelineValid:
+            # The ID index tells us straight away if the scan is in the part
+            # of the timeline that has been worked out; if it isn't, it is
+            # either later on or not in the list at all (like the copies made
+            # while completing the schedule), and there is nothing to do.
+            for pos in self.__idIndex.get(changedScan.getId(), []):
+                if pos < self.__timelineValid and self.scans[pos] is changedScan:
+                    self.__invalidateTimeline(pos)
+                    return
+            return
+        # Otherwise we find where it is the next time we need the timeline.
+        self.__timelineChanged.add(changedScan)
+
+    def __invalidateTimeline(self, pos):
+        # The scans from pos onwards have moved or changed.
+        if pos < self.__timelineValid:
+            self.__timelineValid = pos
+        if pos == 0:
+            # It will all be worked out again, so the changes don't matter.
+            self.__timelineChanged = set()
+
+    def __findScan(self, findScan):
+        # Return the position of this scan in the list, or None if it isn't there.
+        for pos in self.__idIndex.get(findScan.getId(), []):
+            if self.scans[pos] is findScan:
+                return pos
+        for pos in range(self.__idIndexValid, len(self.scans)):
+            if self.scans[pos] is findScan:
+                return pos
+        return None
+
+    def __updateTimeline(self):
+        # Bring the timeline up to date, working out only the part after the
+        # first scan that has changed.
+        if len(self.__timelineChanged) > 0 and self.__idIndexValid < len(self.scans):
+            # Index the whole list once, rather than searching it for each scan.
+            self.__rebuildIdIndex()
+        for changedScan in self.__timelineChanged:
+            pos = self.__findScan(changedScan)
+            if pos is not None:
+                self.__invalidateTimeline(pos)
+        self.__timelineChanged = set()
+        nScans = len(self.scans)
+        valid = min(self.__timelineValid, nScans)
+        if valid == nScans and len(self.__timelineStarts) == nScans:
+            return
+        durations = np.concatenate(( self.__timelineDurations[:valid],
+                                     np.array([ s.getDurationSeconds() for s in self.scans[valid:] ],
+                                              dtype=float) ))
+        starts = np.zeros(nScans)
+        if nScans > 0:
+            # The time from the start of each scan to the start of the next.
+            first = max(valid - 1, 0)
+            starts[:valid] = self.__timelineStarts[:valid]
+            steps = durations[first:(nScans - 1)]
+            if self.slewSpeed is not None and len(steps) > 0:
+                positions = np.array([ s.getPosition() for s in self.scans[first:] ])
+                steps = steps + (angularSeparations(positions[:-1, 0], positions[:-1, 1], positions[1:, 0],
+                                                    positions[1:, 1], elementwise=True) / self.slewSpeed)
+            starts[first:] = np.cumsum(np.concatenate(( [ starts[first] ], steps )))
+        self.__timelineDurations = durations
+        self.__timelineStarts = starts
+        self.__timelineTotal = 0.0
+        if nScans > 0:
+            self.__timelineTotal = float(starts[-1] + durations[-1])
+        self.__timelineValid = nScans
+
+    def setSlewSpeed(self, speed=None):
+        # Include slews between the scans in the timeline, assuming the
+        # telescope moves at speed degrees per second, or leave them out if
+        # speed is None.
+        self.slewSpeed = speed
+        self.__invalidateTimeline(0)
+        return self
+
+    def getSlewSpeed(self):
+        return self.slewSpeed
+
+    def scanStartOffset(self, idx=None):
+        # Return the time (in seconds from the start of the schedule) at which
+        # the specified scan starts.
+        if idx is not None:
+            self.__updateTimeline()
+            return float(self.__timelineStarts[range(0, len(self.scans))[idx]])
+
+    def scanAt(self, offset=None):
+        # Return the index of the scan that is running (or being slewed to)
+        # at this time (in seconds from the start of the schedule), or None if
+        # the schedule isn't running then.
+        if offset is not None:
+            self.__updateTimeline()
+            if offset < 0 or offset >= self.__timelineTotal:
+                return None
+            return int(np.searchsorted(self.__timelineStarts, offset, side="right")) - 1
+        return None
+
+    def getTotalDuration(self):
+        # Return how long (in seconds) the whole schedule takes.
+        self.__updateTimeline()
+        return self.__timelineTotal
+
+    def getTimeline(self):
+        # Return arrays of the start time and length of each scan, in seconds.
+        self.__updateTimeline()
+        return ( self.__timelineStarts.copy(), self.__timelineDurations.copy() )
+
+    def getScanTimes(self, startTimes=None, date=None):
+        # Return the LST and UTC start and end of every scan, as arrays in a
+        # dictionary (see timeline.scanTimes). The schedule starts at the time
+        # and date of the first scan, in its time code; startTimes can instead
+        # be one or more start times (in hours, or as HH:MM:SS strings) to try.
+        if len(self.scans) == 0:
+            return None
+        firstScan = self.scans[0]
+        if startTimes is None:
+            startTimes = firstScan.getTime()
+        if isinstance(startTimes, str):
+            startTimes = timeline.timeToHours(startTimes)
+        elif isinstance(startTimes, ( list, tuple )):
+            startTimes = [ timeline.timeToHours(t) if isinstance(t, str) else t for t in startTimes ]
+        if date is None:
+            date = firstScan.getDate()
+        ( starts, durations ) = self.getTimeline()
+        return timeline.scanTimes(starts, durations, startTimes, firstScan.getTimeCode(), date)
+
     def setLooping(self, looping=None):
         # This flag lets the library know whether the schedule will be looping in caobs.
         # This will change the way the library writes out the schedule, to make sure a
@@ -189,11 +464,46 @@ class schedule:
     
     def addScan(self, options={}):
         # Add a scan to the schedule.
-        scan_new = scan()
+        scan_old = None
+        if self.__batch is not None:
+            scan_old = self.__batch['lastScan']
+        elif len(self.scans) > 0:
+            scan_old = self.scans[-1]
+        scan_new = self.__makeScan(options, scan_old)
+        # Wherever it goes, the timeline will be updated from there on.
+        self.__timelineChanged.discard(scan_new)
+
+        # Add the scan to the list.
+        if self.__batch is not None:
+            # Queue it up until the batch is applied.
+            pos = len(self.scans)
+            if ('insertIndex' in options and options['insertIndex'] >= 0 and
+                options['insertIndex'] < len(self.scans)):
+                pos = options['insertIndex']
+            else:
+                self.__batch['lastScan'] = scan_new
+            self.__batch['inserts'].setdefault(pos, []).append(scan_new)
+        elif ('insertIndex' in options and options['insertIndex'] >= 0):
+            # We have been asked to insert the scan at a particular position.
+            # Check if the insertIndex is too large.
+            if (options['insertIndex'] >= len(self.scans)):
+                self.__appendScan(scan_new)
+            else:
+                self.__invalidateIdIndex(options['insertIndex'])
+                self.__invalidateTimeline(options['insertIndex'])
+                self.scans.insert(options['insertIndex'], scan_new)
+        else:
+            self.__appendScan(scan_new)
+            
+        return scan_new
+
+    def __makeScan(self, options={}, scan_old=None):
+        # Make a new scan for this schedule from the options, without putting
+        # it in the list.
+        scan_new = scan(self)
         
         # By default, we copy the details from the previous scan.
-        if (not ('nocopy' in options and options['nocopy'] == True)) and (len(self.scans) > 0):
-            scan_old = self.scans[-1]
+        if (not ('nocopy' in options and options['nocopy'] == True)) and (scan_old is not None):
             for f in self.__scanHandlers:
                 # We don't copy the CalCode.
                 if (f != "CalCode"):
@@ -221,20 +531,135 @@ class schedule:
                 if (option in options):
                     val = self.__prepareValue(options[option], "integer")
                     getattr(getattr(scan_new, freqObject)(), "setZoomChannel")(z, val)
-                
-        # Add the scan to the list.
-        if ('insertIndex' in options and options['insertIndex'] >= 0):
-            # We have been asked to insert the scan at a particular position.
-            # Check if the insertIndex is too large.
-            if (options['insertIndex'] >= len(self.scans)):
-                self.scans.append(scan_new)
-            else:
-                self.scans.insert(options['insertIndex'], scan_new)
+
+        return scan_new
+
+    def __makeTrustedLoaders(self):
+        fieldLoaders = {}
+        for handlers in ( self.__scanHandlers, self.__freqHandlers ):
+            for h in handlers:
+                if handlers[h]['option'] in fieldNames:
+                    fieldLoaders[handlers[h]['option']] = ( fieldNames.index(handlers[h]['option']),
+                                                            handlers[h]['format'] )
+        # The averaging setter turns its value into an integer itself.
+        fieldLoaders['averaging'] = ( fieldNames.index('averaging'), "integer" )
+        zoomLoaders = {}
+        for f in range(1, 3):
+            for z in range(1, nZoomBands + 1):
+                zoomLoaders["zoom%d-%d" % (z, f)] = ( "IF%d" % f, z )
+        type(self).__fieldLoaders = fieldLoaders
+        type(self).__zoomLoaders = zoomLoaders
+
+    def __makeTrustedScan(self, options={}, scan_old=None):
+        # Make a new scan like __makeScan does, copying from the previous scan
+        # and applying the options, but without going through the setters and
+        # their checks. Use validateScans to check the result.
+        if self.__fieldLoaders is None:
+            self.__makeTrustedLoaders()
+        scan_new = scan(self)
+        if (not ('nocopy' in options and options['nocopy'] == True)) and (scan_old is not None):
+            fields = list(scan_old.getFields())
+            # We don't copy the CalCode.
+            fields[self.__fieldLoaders['calCode'][0]] = ""
         else:
-            self.scans.append(scan_new)
-            
+            fields = list(scan_new.getFields())
+        zooms = []
+        for option in options:
+            if options[option] is None:
+                continue
+            if option in self.__fieldLoaders:
+                ( idx, vtype ) = self.__fieldLoaders[option]
+                fields[idx] = self.__prepareValue(options[option], vtype)
+            elif option in self.__zoomLoaders:
+                zooms.append(option)
+        scan_new.setFields(fields)
+        for option in zooms:
+            ( freqObject, z ) = self.__zoomLoaders[option]
+            chan = self.__prepareValue(options[option], "integer")
+            if chan != 0:
+                getattr(scan_new, freqObject)().setZoomState(z, channel=chan, enabled=True)
         return scan_new
 
+    def loadScans(self, optionsList=[], validate=True):
+        # Add many scans to the end of the schedule quickly. Each options
+        # object is treated as it would be by addScan (without insertIndex),
+        # but the values are only checked once all the scans have been made,
+        # and only if validate is True. Return the new scans.
+        if self.__batch is not None:
+            raise ScanError("Cannot load scans in bulk while a batch is open.")
+        first = len(self.scans)
+        scan_old = None
+        if first > 0:
+            scan_old = self.scans[-1]
+        for options in optionsList:
+            scan_old = self.__makeTrustedScan(options, scan_old)
+            self.__appendScan(scan_old)
+        if validate == True:
+            self.validateScans(first)
+        return self.scans[first:]
+
+    def validateScans(self, start=0):
+        # Check the scans from start onwards, one property at a time across all
+        # the scans. The first bad value found raises the same error its setter
+        # would have, with the scan number added.
+        checkScans = self.scans[start:]
+        if len(checkScans) == 0:
+            return self
+        columns = dict(zip(fieldNames, zip(*[ s.getFields() for s in checkScans ])))
+
+        def check(bad, error, message):
+            badScans = np.flatnonzero(bad)
+            if len(badScans) > 0:
+                raise error("%s (scan %d)" % (message, start + badScans[0]))
+
+        def checkPatterns(values, patterns, allowed):
+            # Only look at each different value once.
+            badValues = [ v for v in set(values) if v not in allowed and
+                          all(p.match(v) is None for p in patterns) ]
+            return np.isin(np.array(values, dtype=object), np.array(badValues, dtype=object))
+
+        check(np.char.str_len(np.array(columns['source'], dtype=str)) > 10,
+              ScanError, "Specified source name is too long.")
+        for ( name, allowed, message ) in ( ( 'epoch', epochs, "Unrecognised epoch specified." ),
+                                            ( 'calCode', calCodes, "Unrecognised CalCode specified." ),
+                                            ( 'scanType', scanTypes, "Unrecognised ScanType specified." ),
+                                            ( 'pointing', pointings, "Unrecognised Pointing specified." ),
+                                            ( 'timeCode', timeCodes, "Unrecognised TimeCode specified." ),
+                                            ( 'wrap', wraps, "Wrap is incorrectly specified." ) ):
+            check(~np.isin(np.array(columns[name], dtype=str), allowed), ScanError, message)
+        check(np.array(columns['averaging']) <= 0,
+              ScanError, "Averaging must be a positive, non-zero number.")
+        environment = np.array(columns['environment'])
+        check((environment < 0) | (environment >= 128),
+              ScanError, "Environment must be an integer between 0 and 127 inclusive.")
+        check(checkPatterns(columns['tvChannels'], ( tvChannelsPattern, ), ( 'default', '', 'null' )),
+              ScanError, "TV Channel specification is incorrect.")
+        check(checkPatterns(columns['freqConfig'], freqConfigPatterns, ( 'null', )),
+              ScanError, "Frequency configuration is incorrectly specified.")
+        zooms = np.array([ ( s.IF1().getZoomChannels(), s.IF2().getZoomChannels() ) for s in checkScans ])
+        for f in range(1, 3):
+            freqs = np.array(columns['freq%d' % f])
+            inBand = np.zeros(len(freqs), dtype=bool)
+            for ( band, lowFreq, highFreq ) in bandRanges:
+                inBand |= (freqs >= lowFreq) & (freqs <= highFreq)
+            check(~inBand, FrequencyError, "Specified continuum centre frequency is not achievable.")
+            widths = np.array(columns['bw%d' % f])
+            check((widths != 1) & (widths != 64),
+                  FrequencyError, "Specified continuum channel width is unsupported.")
+            maxChannel = ((2048 / widths) * 2) + 1
+            fzooms = zooms[:, f - 1, :]
+            check(np.any((fzooms != 0) & ((fzooms < 1) | (fzooms > maxChannel[:, None])), axis=1),
+                  ZoomError, "Specified zoom channel is not in the band.")
+        return self
+
+    def __appendScan(self, nscan):
+        # Put a scan at the end of the list, keeping the ID index up to date.
+        if self.__idIndexValid == len(self.scans):
+            self.__idIndex.setdefault(nscan.getId(), []).append(len(self.scans))
+            self.__idIndexValid += 1
+        self.__timelineChanged.discard(nscan)
+        self.scans.append(nscan)
+
     def addCalibrator(self, calibrator=None, refScan=None, options={}):
         # Add a calibrator database calibrator to the schedule.
         if calibrator is None or refScan is None:
@@ -272,25 +697,41 @@ class schedule:
         # We place the calibrator scan before each of the matched scans.
         # Or afterwards if we don't want to get to the calibrator first.
         nscan = None
-        for i in range(0, len(matchedScans)):
-            # Remember, the index of the matched scan will go up by one every time
-            # we put a new scan in before it.
-            ni = i + matchedScans[i]
-            noptions['insertIndex'] = ni
-            if self.calFirst == False:
-                noptions['insertIndex'] = ni + 1
-            nscan = self.addScan(noptions)
-            if i == 0:
-                # Associate the calibrator to the scan.
-                self.calibratorAssociations[refScan.getId()] = nscan.getId()
-            else:
-                # Put the same ID on all the calibrators.
-                nscan.setId(self.calibratorAssociations[refScan.getId()])
+        with self.batch():
+            for i in range(0, len(matchedScans)):
+                noptions['insertIndex'] = matchedScans[i]
+                if self.calFirst == False:
+                    noptions['insertIndex'] = matchedScans[i] + 1
+                nscan = self.addScan(noptions)
+                if i == 0:
+                    # Associate the calibrator to the scan.
+                    self.calibratorAssociations[refScan.getId()] = nscan.getId()
+                else:
+                    # Put the same ID on all the calibrators.
+                    nscan.setId(self.calibratorAssociations[refScan.getId()])
         return nscan
     
     def deleteScan(self, idx=None):
         # Delete a scan from the schedule, using the Python del indexing standard.
         if idx is not None:
+            # Work out the first position affected, raising IndexError the
+            # same way del would.
+            positions = range(0, len(self.scans))[idx]
+            if self.__batch is not None:
+                # Just remember which ones to leave out when the batch is applied.
+                if isinstance(idx, slice):
+                    self.__batch['deletes'].update(positions)
+                else:
+                    self.__batch['deletes'].add(positions)
+                return
+            if isinstance(idx, slice):
+                if len(positions) == 0:
+                    return
+                self.__invalidateIdIndex(min(positions))
+                self.__invalidateTimeline(min(positions))
+            else:
+                self.__invalidateIdIndex(positions)
+                self.__invalidateTimeline(positions)
             del self.scans[idx]
 
     def getScan(self, idx=None):
@@ -301,11 +742,29 @@ class schedule:
     def getScanById(self, id=None):
         # Return the scan specified.
         if id is not None:
-            for i in range(0, len(self.scans)):
-                if self.scans[i].getId() == id:
-                    return self.scans[i]
+            if id not in self.__idIndex and self.__idIndexValid < len(self.scans):
+                # The scan may be in the part of the schedule that isn't indexed.
+                self.__rebuildIdIndex()
+            if id in self.__idIndex:
+                return self.scans[self.__idIndex[id][0]]
         return None
 
+    def getScanTable(self):
+        # Export a column-oriented copy of the scans, for fast whole-schedule
+        # calculations. The copy is detached: the schedule's own operations
+        # all work on its scans, and changes to the table don't get back
+        # here unless it is loaded with loadScanTable.
+        return scanTable(self.scans)
+
+    def loadScanTable(self, table=None):
+        # Replace the scans in this schedule with new ones made from a scan
+        # table.
+        if table is not None:
+            if self.__batch is not None:
+                raise ScanError("Cannot load a scan table while a batch is open.")
+            self.__replaceScans(table.toScans(self))
+        return self
+
     def scanToOptions(self, scan=None):
         # Turn a scan into an options object.
         oopts = {}
@@ -323,27 +782,36 @@ class schedule:
     
     def copyScans(self, ids=[], pos=None, calCheck=True, keepId=True):
         # Copy the scans specified by their IDs and put the copies beginning at
-        # the nominated position (or at the end by default).
+        # the nominated position (or at the end by default). The new scans are
+        # returned in a list.
         if len(ids) == 0:
             return None
         # Try to find the scans.
-        j = 0
-        for i in range(0, len(ids)):
-            cscan = self.getScanById(ids[i])
-            if cscan is not None:
-                copts = self.scanToOptions(cscan)
-                copts['nocopy'] = True
-                if pos is not None and pos >= 0 and pos < len(self.scans):
-                    copts['insertIndex'] = pos + j
-                nscan = self.addScan(copts)
-                if keepId:
-                    # Set its ID.
-                    nscan.setId(cscan.getId())
-                # We do this because j only increments when a scan is found.
-                j += 1
+        nscans = []
+        with self.batch():
+            for i in range(0, len(ids)):
+                cscan = self.getScanById(ids[i])
+                if cscan is not None:
+                    nscans.append(self.__copyScan(cscan, pos, keepId))
         if calCheck == True:
             # Now run the calibrator assignment checks.
             self.checkCalibrators()
+        return nscans
+
+    def __copyScan(self, cscan, pos=None, keepId=True):
+        # Add a copy of a scan at the nominated position (or at the end).
+        # When scans share an ID, copies are always made from the first of
+        # them (the one getScanById finds), so callers need to pass that one
+        # rather than whichever scan they happen to be looking at.
+        copts = self.scanToOptions(cscan)
+        copts['nocopy'] = True
+        if pos is not None and pos >= 0 and pos < len(self.scans):
+            copts['insertIndex'] = pos
+        nscan = self.addScan(copts)
+        if keepId:
+            # Set its ID.
+            nscan.setId(cscan.getId())
+        return nscan
 
     def checkCalibrators(self):
         # Check that a calibrator scan is assigned to each of the associated
@@ -351,52 +819,126 @@ class schedule:
         if self.autoCals == False:
             # The user doesn't want us to do this.
             return
-        i = 0
-        while (i < len(self.scans)):
-            # We loop like this because the length of the array may change as
-            # we go through.
-            tId = self.scans[i].getId()
+        if self.__batch is not None:
+            # We can't check until the list is complete, so we do this once
+            # the batch has been applied.
+            self.__batch['calCheck'] = True
+            return
+        if len(self.calibratorAssociations) == 0:
+            # Nothing can need a calibrator.
+            return
+        # Rather than inserting calibrator scans into the list one at a time,
+        # we walk through the scans once and build the new list as we go.
+        # Calibrator scans that get added after a source are examined like
+        # any other scan, so they are kept on a stack ahead of the rest of
+        # the original scans.
+        oldScans = self.scans
+        newScans = []
+        pending = []
+        calTemplates = {}
+        nextIdx = 0
+        added = 0
+        while len(pending) > 0 or nextIdx < len(oldScans):
+            if len(pending) > 0:
+                tScan = pending.pop()
+            else:
+                tScan = oldScans[nextIdx]
+                nextIdx += 1
+            tId = tScan.getId()
             # Check if this is a source with an associated calibrator.
             if tId in self.calibratorAssociations:
+                cId = self.calibratorAssociations[tId]
                 # It is. Check if there is a calibrator scan before it.
                 if self.calFirst == True:
-                    if i == 0:
-                        # Nope, first scan, we add a calibrator scan.
-                        self.copyScans([ self.calibratorAssociations[tId] ], 0, False)
-                    else:
-                        pId = self.scans[i - 1].getId()
-                        if pId != self.calibratorAssociations[tId]:
-                            # Nope, the scan before this one is not the calibrator.
-                            self.copyScans([ self.calibratorAssociations[tId] ], i, False)
+                    if len(newScans) == 0 or newScans[-1].getId() != cId:
+                        # Nope, we add a calibrator scan.
+                        cScan = self.__copyCalibratorScan(cId, calTemplates)
+                        if cScan is not None:
+                            newScans.append(cScan)
+                            added += 1
+                            # We have to look at this source again now it
+                            # has a calibrator before it.
+                            pending.append(tScan)
+                            continue
                     # Otherwise it is the calibrator scan.
                 # Check if there needs to be a calibrator scan after it.
-                if i == (len(self.scans) - 1):
+                if len(pending) == 0 and nextIdx == len(oldScans):
                     # We're at the end of the list.
+                    needCal = False
                     if self.looping == False or self.calFirst == False:
                         # We do need a cal scan at the end, because it won't go around, or when
                         # it does there won't be a calibrator there.
-                        self.copyScans([ self.calibratorAssociations[tId] ], (i + 1), False)
+                        needCal = True
                     else:
                         # Check that the first scan is a calibrator scan.
-                        pId = self.scans[0].getId()
-                        if pId != self.calibratorAssociations[tId]:
+                        pId = tId
+                        if len(newScans) > 0:
+                            pId = newScans[0].getId()
+                        if pId != cId:
                             # The first scan is not a calibrator scan, so we add one here.
-                            self.copyScans([ self.calibratorAssociations[tId] ], (i + 1), False)
+                            needCal = True
                         # Otherwise, it will loop back around to the calibrator.
                 else:
                     # Check the ID of the next scan.
-                    nId = self.scans[i + 1].getId()
-                    if nId != self.calibratorAssociations[tId] and nId != tId:
-                        # There is another scan after us, but it isn't the same as us, and
-                        # it isn't our calibrator. We add a cal scan.
-                        self.copyScans([ self.calibratorAssociations[tId] ], (i + 1), False)
-            i += 1
+                    if len(pending) > 0:
+                        nId = pending[-1].getId()
+                    else:
+                        nId = oldScans[nextIdx].getId()
+                    # If there is another scan after us, but it isn't the same as us, and
+                    # it isn't our calibrator, we add a cal scan.
+                    needCal = (nId != cId and nId != tId)
+                if needCal:
+                    cScan = self.__copyCalibratorScan(cId, calTemplates)
+                    if cScan is not None:
+                        # This calibrator scan is the next one to be examined.
+                        pending.append(cScan)
+                        added += 1
+            newScans.append(tScan)
+        if added > 0:
+            self.__replaceScans(newScans)
         return
 
+    def __copyCalibratorScan(self, cId, calTemplates):
+        # Make a copy of the calibrator scan with the specified ID, for
+        # checkCalibrators. The options for each calibrator are only worked
+        # out once.
+        if cId not in calTemplates:
+            cscan = self.getScanById(cId)
+            copts = None
+            if cscan is not None:
+                copts = self.scanToOptions(cscan)
+                copts['nocopy'] = True
+            calTemplates[cId] = copts
+        if calTemplates[cId] is None:
+            return None
+        return self.__makeScan(calTemplates[cId]).setId(cId)
+
+    def __replaceScans(self, newScans):
+        # Swap in a whole new list of scans; the ID index is rebuilt the next
+        # time it is needed.
+        self.scans = newScans
+        self.__idIndex = {}
+        self.__idIndexValid = 0
+        self.__invalidateTimeline(0)
+
     def completeSchedule(self):
         # Go through the schedule and make the schedule "work".
+        if len(self.scans) == 0:
+            return
+        # Each of the checks below works on the scans that come out of the check
+        # before it, so we stream the scans through all of them in one go and
+        # collect the completed schedule at the end. The band of each scan is
+        # only worked out once, and travels along with the scan. Any scan we
+        # add is a copy of the first scan with the same ID, which need not be
+        # in the same band as the scan that caused it, so each copy gets the
+        # band of its own frequencies.
+        bands = [ s.IF1().getFrequencyBand() for s in self.scans ]
         # First, we work out if the schedule wants more than one band.
-        observedBands = self.getObservedBands()
+        observedBands = []
+        for b in bands:
+            if b not in observedBands:
+                observedBands.append(b)
+        stream = zip(self.scans, bands)
         # Check 1: If we're looping, we may need to add a focus scan at the start.
         # But first, we don't need to do a prep focus scan if we're also doing delay calibration
         # scans.
@@ -404,137 +946,191 @@ class schedule:
             self.prepScans = False
         
         if self.looping or self.prepScans:
-            tband = self.scans[0].IF1().getFrequencyBand()
-            nband = self.scans[len(self.scans) - 1].IF1().getFrequencyBand()
+            tband = bands[0]
+            nband = bands[-1]
             if (tband != nband and (tband == "4cm" or nband == "4cm")) or self.prepScans:
-                nscanId = self.scans[0].getId()
-                self.copyScans(ids=[nscanId], pos=0, calCheck=False, keepId=False)
-                self.scans[0].setSource("focus")
-                self.scans[0].setCommand("focus default")
-                self.scans[0].setScanType("Normal")
-                self.scans[0].setScanLength("00:01:30")
+                fscan = self.__cloneScan(self.scans[0])
+                fscan.setSource("focus")
+                fscan.setCommand("focus default")
+                fscan.setScanType("Normal")
+                fscan.setScanLength("00:01:30")
+                stream = itertools.chain([ (fscan, fscan.IF1().getFrequencyBand()) ], stream)
 
         # Check 2: If we've been asked, we put automatic calibration scans before each
         # frequency's first instance.
         if self.delayScans:
-            # We start by putting calibration scans in.
-            insertCalScans = True
-            i = 0
-            # Keep track of which frequency setups have been configured already.
-            configured = []
-            while i < len(self.scans):
-                # Do a check to see if scans should go here.
-                if i > 0:
-                    tband1 = self.scans[i].IF1().getFreq()
-                    tband2 = self.scans[i].IF2().getFreq()
-                    lband1 = self.scans[i - 1].IF1().getFreq()
-                    lband2 = self.scans[i - 1].IF2().getFreq()
-                    if tband1 != lband1 or tband2 != lband2:
-                        insertCalScans = True
-                        # Check the configurations already done.
-                        for j in range(0, len(configured)):
-                            if configured[j][0] == tband1 and configured[j][1] == tband2:
-                                # Already done.
-                                insertCalScans = False
-                                break
-                    else:
-                        insertCalScans = False
-                if insertCalScans:
-                    tscanId = self.scans[i].getId()
-                    # Ideally, we'd check that this is a calibrator with sufficient flux
-                    # density, but we will have to rely on the user to ensure this is
-                    # the case.
-                    # What we do depends on which CABB mode we are in.
-                    cWidth = self.scans[i].IF1().getChannelWidth()
-                    tband1 = self.scans[i].IF1().getFreq()
-                    tband2 = self.scans[i].IF2().getFreq()
-                    configured.append([ tband1, tband2 ])
-                    if cWidth == 1:
-                        # We insert 4 scans to do the calibration.
-                        # Scan 1.
-                        self.copyScans(ids=[tscanId], pos=i, calCheck=False, keepId=False)
-                        self.scans[i].setSource("delscan1")
-                        self.scans[i].setScanType("Normal")
-                        # We need 9 cycles, assuming 10s cycles for the 00:01:30.
-                        self.scans[i].setScanLength("00:01:30")
-                        self.scans[i].setCommand("foc def;set ref ca03;cor tvmed on on;cor tatts 20;wait 2;cor atts on")
-                        # Scan 2.
-                        self.copyScans(ids=[tscanId], pos=(i + 1), calCheck=False, keepId=False)
-                        self.scans[i + 1].setSource("delscan2")
-                        self.scans[i + 1].setScanType("Normal")
-                        # We need 4 cycles.
-                        self.scans[i + 1].setScanLength("00:00:40")
-                        self.scans[i + 1].setCommand("cor atts off;wait 2;cor reset delays;cor delavg 1;cor tvch 1140 1220 1140 1220")
-                        # Scan 3.
-                        self.copyScans(ids=[tscanId], pos=(i + 2), calCheck=False, keepId=False)
-                        self.scans[i + 2].setSource("delscan3")
-                        self.scans[i + 2].setScanType("Dwell")
-                        # We need 4 cycles, and need the antennas on source for the next scan.
-                        self.scans[i + 2].setScanLength("00:00:40")
-                        self.scans[i + 2].setCommand("cor fflag f1 def;cor fflag f2 def;cor fflag f1 birdies;cor fflag f2 birdies")
-                        # Scan 4.
-                        self.copyScans(ids=[tscanId], pos=(i + 3), calCheck=False, keepId=False)
-                        self.scans[i + 3].setSource("delscan4")
-                        self.scans[i + 3].setScanType("Dwell")
-                        # We need 21 cycles.
-                        self.scans[i + 3].setScanLength("00:03:30")
-                        self.scans[i + 3].setCommand("wait 7;cor dcal;wait 11;cor tvch def;wait 12;cor delavg 64;wait 17;cor dcal")
-                        i += 4
-                    elif cWidth == 64:
-                        # We insert 4 scans to do the calibration.
-                        # Scan 1.
-                        self.copyScans(ids=[tscanId], pos=i, calCheck=False, keepId=False)
-                        self.scans[i].setSource("delscan1")
-                        self.scans[i].setScanType("Normal")
-                        # We need 4 cycles, assuming 10s cycles for the 00:00:40.
-                        self.scans[i].setScanLength("00:00:40")
-                        self.scans[i].setCommand("foc def;set ref ca03;cor tvmed on on;cor tatts 20;wait 2;cor atts on")
-                        # Scan 2.
-                        self.copyScans(ids=[tscanId], pos=(i + 1), calCheck=False, keepId=False)
-                        # We need to set up a width-1 zoom band in this scan which will be used for initial
-                        # delay calibration. Using channel 56 normally works fine.
-                        # But first we get rid of any zooms that are configured.
-                        for j in range(1, 16):
-                            self.scans[i + 1].IF1().setZoomChannel(zoomnum=j, chan=0)
-                            self.scans[i + 1].IF2().setZoomChannel(zoomnum=j, chan=0)
-                        self.scans[i + 1].IF1().setZoomChannel(zoomnum=1, chan=56)
-                        self.scans[i + 1].IF2().setZoomChannel(zoomnum=1, chan=56)
-                        self.scans[i + 1].setSource("delscan2")
-                        self.scans[i + 1].setScanType("Dwell")
-                        # We need 5 cycles, and need the antennas on source for the next scan.
-                        self.scans[i + 1].setScanLength("00:00:50")
-                        self.scans[i + 1].setCommand("cor calband z z;cor reset delays;wait 1;cor delavg 8;wait 4;cor atts off")
-                        # We want to now copy this scan with its zoom configuration for the next scans.
-                        tscanId = self.scans[i + 1].getId()
-                        # Scan 3.
-                        self.copyScans(ids=[tscanId], pos=(i + 2), calCheck=False, keepId=False)
-                        self.scans[i + 2].setSource("delscan3")
-                        self.scans[i + 2].setScanType("Dwell")
-                        # We need 12 cycles for the dcal.
-                        self.scans[i + 2].setScanLength("00:02:00")
-                        self.scans[i + 2].setCommand("cor tvch def;wait 7;cor dcal;wait 12;cor calband f f")
-                        # Scan 4.
-                        self.copyScans(ids=[tscanId], pos=(i + 3), calCheck=False, keepId=False)
-                        self.scans[i + 3].setSource("delscan4")
-                        self.scans[i + 3].setScanType("Dwell")
-                        # We need 21 cycles.
-                        self.scans[i + 3].setScanLength("00:03:30")
-                        self.scans[i + 3].setCommand("cor tvch def;wait 1;cor delavg 1;wait 7;cor dcal;wait 13;cor acal;wait 16;cor pcal")
-                        i += 4
-                i += 1
+            stream = self.__delayCalibrationScans(stream)
 
         # Check 3: add pointing scans when required and change the pointing type for the
         # scans that need it.
-        i = 0
-        lastBand = None
-        lastPointings = {}
-        while i < len(self.scans):
+        stream = self.__pointingScans(stream)
+
+        # Check 4: add focus scans when the frequency configuration changes.
+        # We will only need to do focus scans if we change to or from 4cm.
+        if len(observedBands) > 1 and "4cm" in observedBands:
+            stream = self.__bandChangeFocusScans(stream)
+
+        self.__replaceScans([ s for (s, b) in stream ])
+
+    def __cloneScan(self, cscan):
+        # Make a copy of the first scan with the same ID as this one (the same
+        # scan copyScans copies, see __copyScan), with a new ID, but don't put
+        # it in the list.
+        fscan = self.getScanById(cscan.getId())
+        if fscan is None:
+            # This scan isn't in the list yet.
+            fscan = cscan
+        copts = self.scanToOptions(fscan)
+        copts['nocopy'] = True
+        return self.__makeScan(copts)
+
+    def __delayCalibrationScans(self, stream):
+        # Put the delay calibration scans before each frequency's first instance.
+        # We start by putting calibration scans in.
+        insertCalScans = True
+        # Keep track of which frequency setups have been configured already.
+        configured = set()
+        # The pointing check comes after this one, but as the scans stream
+        # through it can change the pointing of a scan before we copy it here,
+        # so we remember the pointing each ID had when it first came through.
+        idPointings = {}
+        lScan = None
+        for (tScan, tBand) in stream:
+            tPointing = idPointings.setdefault(tScan.getId(), tScan.getPointing())
+            # Do a check to see if scans should go here.
+            tband1 = tScan.IF1().getFreq()
+            tband2 = tScan.IF2().getFreq()
+            if lScan is not None:
+                lband1 = lScan.IF1().getFreq()
+                lband2 = lScan.IF2().getFreq()
+                if tband1 != lband1 or tband2 != lband2:
+                    # Check the configurations already done.
+                    insertCalScans = (tband1, tband2) not in configured
+                else:
+                    insertCalScans = False
+            lScan = tScan
+            if insertCalScans:
+                # Ideally, we'd check that this is a calibrator with sufficient flux
+                # density, but we will have to rely on the user to ensure this is
+                # the case.
+                # What we do depends on which CABB mode we are in.
+                cWidth = tScan.IF1().getChannelWidth()
+                configured.add((tband1, tband2))
+                if cWidth == 1:
+                    # We insert 4 scans to do the calibration.
+                    # Scan 1.
+                    dscan = self.__cloneScan(tScan).setPointing(tPointing)
+                    dscan.setSource("delscan1")
+                    dscan.setScanType("Normal")
+                    # We need 9 cycles, assuming 10s cycles for the 00:01:30.
+                    dscan.setScanLength("00:01:30")
+                    dscan.setCommand("foc def;set ref ca03;cor tvmed on on;cor tatts 20;wait 2;cor atts on")
+                    yield (dscan, dscan.IF1().getFrequencyBand())
+                    # Scan 2.
+                    dscan = self.__cloneScan(tScan).setPointing(tPointing)
+                    dscan.setSource("delscan2")
+                    dscan.setScanType("Normal")
+                    # We need 4 cycles.
+                    dscan.setScanLength("00:00:40")
+                    dscan.setCommand("cor atts off;wait 2;cor reset delays;cor delavg 1;cor tvch 1140 1220 1140 1220")
+                    yield (dscan, dscan.IF1().getFrequencyBand())
+                    # Scan 3.
+                    dscan = self.__cloneScan(tScan).setPointing(tPointing)
+                    dscan.setSource("delscan3")
+                    dscan.setScanType("Dwell")
+                    # We need 4 cycles, and need the antennas on source for the next scan.
+                    dscan.setScanLength("00:00:40")
+                    dscan.setCommand("cor fflag f1 def;cor fflag f2 def;cor fflag f1 birdies;cor fflag f2 birdies")
+                    yield (dscan, dscan.IF1().getFrequencyBand())
+                    # Scan 4.
+                    dscan = self.__cloneScan(tScan).setPointing(tPointing)
+                    dscan.setSource("delscan4")
+                    dscan.setScanType("Dwell")
+                    # We need 21 cycles.
+                    dscan.setScanLength("00:03:30")
+                    dscan.setCommand("wait 7;cor dcal;wait 11;cor tvch def;wait 12;cor delavg 64;wait 17;cor dcal")
+                    yield (dscan, dscan.IF1().getFrequencyBand())
+                elif cWidth == 64:
+                    # We insert 4 scans to do the calibration.
+                    # Scan 1.
+                    dscan = self.__cloneScan(tScan).setPointing(tPointing)
+                    dscan.setSource("delscan1")
+                    dscan.setScanType("Normal")
+                    # We need 4 cycles, assuming 10s cycles for the 00:00:40.
+                    dscan.setScanLength("00:00:40")
+                    dscan.setCommand("foc def;set ref ca03;cor tvmed on on;cor tatts 20;wait 2;cor atts on")
+                    yield (dscan, dscan.IF1().getFrequencyBand())
+                    # Scan 2.
+                    zscan = self.__cloneScan(tScan).setPointing(tPointing)
+                    # We need to set up a width-1 zoom band in this scan which will be used for initial
+                    # delay calibration. Using channel 56 normally works fine.
+                    # But first we get rid of any zooms that are configured.
+                    for j in range(1, 16):
+                        zscan.IF1().setZoomChannel(zoomnum=j, chan=0)
+                        zscan.IF2().setZoomChannel(zoomnum=j, chan=0)
+                    zscan.IF1().setZoomChannel(zoomnum=1, chan=56)
+                    zscan.IF2().setZoomChannel(zoomnum=1, chan=56)
+                    zscan.setSource("delscan2")
+                    zscan.setScanType("Dwell")
+                    # We need 5 cycles, and need the antennas on source for the next scan.
+                    zscan.setScanLength("00:00:50")
+                    zscan.setCommand("cor calband z z;cor reset delays;wait 1;cor delavg 8;wait 4;cor atts off")
+                    yield (zscan, zscan.IF1().getFrequencyBand())
+                    # We want to now copy this scan with its zoom configuration for the next scans.
+                    # Scan 3.
+                    dscan = self.__cloneScan(zscan)
+                    dscan.setSource("delscan3")
+                    dscan.setScanType("Dwell")
+                    # We need 12 cycles for the dcal.
+                    dscan.setScanLength("00:02:00")
+                    dscan.setCommand("cor tvch def;wait 7;cor dcal;wait 12;cor calband f f")
+                    yield (dscan, dscan.IF1().getFrequencyBand())
+                    # Scan 4.
+                    dscan = self.__cloneScan(zscan)
+                    dscan.setSource("delscan4")
+                    dscan.setScanType("Dwell")
+                    # We need 21 cycles.
+                    dscan.setScanLength("00:03:30")
+                    dscan.setCommand("cor tvch def;wait 1;cor delavg 1;wait 7;cor dcal;wait 13;cor acal;wait 16;cor pcal")
+                    yield (dscan, dscan.IF1().getFrequencyBand())
+            yield (tScan, tBand)
+
+    def __pointingScans(self, stream):
+        # Add pointing scans when required and change the pointing type for the
+        # scans that need it.
+        # We remember the position of the last pointing scan on each source,
+        # and the time (in seconds from the start) at which it began. These
+        # are kept in arrays (with a row for each source, in the order they
+        # were first pointed on), so each scan can be checked against all of
+        # them at once.
+        pointingRows = {}
+        pointingRas = np.zeros(0)
+        pointingDecs = np.zeros(0)
+        pointingStarts = np.zeros(0)
+
+        def rememberPointing(pscan, start):
+            nonlocal pointingRas, pointingDecs, pointingStarts
+            row = pointingRows.setdefault(pscan.getSource(), len(pointingRows))
+            if row == len(pointingStarts):
+                pointingRas = np.append(pointingRas, 0.0)
+                pointingDecs = np.append(pointingDecs, 0.0)
+                pointingStarts = np.append(pointingStarts, 0.0)
+            ( pointingRas[row], pointingDecs[row] ) = pscan.getPosition()
+            pointingStarts[row] = start
+
+        elapsed = 0
+        stream = iter(stream)
+        current = next(stream, None)
+        following = next(stream, None)
+        while current is not None:
+            (tScan, currentBand) = current
             # Don't do anything for delscan scans.
-            if "delscan" in self.scans[i].getSource():
-                i += 1
+            if "delscan" in tScan.getSource():
+                yield current
+                current = following
+                following = next(stream, None)
                 continue
             # Find a transition to a band that requires pointing corrections.
-            currentBand = self.scans[i].IF1().getFrequencyBand()
             needsPointing = False
             bandNeedsPointing = False
             if self.needsPointing(band=currentBand):
@@ -542,108 +1138,136 @@ class schedule:
                 bandNeedsPointing = True
             if needsPointing:
                 # Check this scan isn't already a pointing scan.
-                if self.scans[i].getScanType() == "Point":
+                if tScan.getScanType() == "Point":
                     needsPointing = False
-            if needsPointing:
-                # Check if we've recently had a pointing scan.
-                pointingChecks = []
-                for s in lastPointings:
-                    pointCheck = False
-                    # Check that this scan is within a certain distance of the pointing scan.
-                    angDist = self.__angularDistance(scanOrig=lastPointings[s]["scan"],
-                                                     scanDest=i)
-                    if angDist > 20.0:
-                        # Too far away.
-                        pointCheck = True
-                    # Check if it has been too long since that scan.
-                    if lastPointings[s]["timeDelta"] > (70 * 60):
-                        # Too long ago.
-                        pointCheck = True
-                    pointingChecks.append(pointCheck)
-                if False in pointingChecks:
-                    # At least one pointing should be usable for this scan.
+            if needsPointing and len(pointingStarts) > 0:
+                # Check if we've recently had a pointing scan. A pointing scan is
+                # usable if it's within a certain distance of this scan, and it
+                # hasn't been too long since it.
+                ( ra, dec ) = tScan.getPosition()
+                usable = ((angularSeparations(ra, dec, pointingRas, pointingDecs) <= 20.0) &
+                          ((elapsed - pointingStarts) <= (70 * 60)))
+                if usable.any():
                     needsPointing = False
             if needsPointing:
                 # We add a pointing scan, if we are looking at a calibrator.
-                if self.scans[i].getCalCode() == "C":
+                if tScan.getCalCode() == "C":
                     # This is a calibrator, but we check that its associated
                     # source is next in the schedule.
-                    if i < (len(self.scans) - 1):
-                        nscanId = self.scans[i + 1].getId()
+                    if following is not None:
+                        nscanId = following[0].getId()
                         if ((nscanId in self.calibratorAssociations and
-                             self.calibratorAssociations[nscanId] == self.scans[i].getId()) or
+                             self.calibratorAssociations[nscanId] == tScan.getId()) or
                             (nscanId not in self.calibratorAssociations)):
                             # Pointing will actually be useful here.
-                            self.copyScans(ids=[self.scans[i].getId()], pos=i, calCheck=False, keepId=False)
-                            self.scans[i].setScanType("Point")
-                            self.scans[i].setPointing("Update")
-                            self.scans[i].setScanLength("00:02:00")
-                            lastPointings[self.scans[i].getSource()] = { "scan": i, "timeDelta": 0 }
+                            pscan = self.__cloneScan(tScan)
+                            pscan.setScanType("Point")
+                            pscan.setPointing("Update")
+                            pscan.setScanLength("00:02:00")
+                            rememberPointing(pscan, elapsed)
+                            yield (pscan, pscan.IF1().getFrequencyBand())
+                            elapsed += pscan.getDurationSeconds()
+                            # Now we look at this scan again, with the pointing scan
+                            # before it.
+                            continue
             elif bandNeedsPointing:
                 # Check this isn't a pointing already.
-                if self.scans[i].getScanType == "Point":
+                if tScan.getScanType == "Point":
                     # We just update the pointing  dictionary.
-                    lastPointings[self.scans[i].getSource()] = { "scan": i, "timeDelta": 0 }
+                    rememberPointing(tScan, elapsed)
                 else:
                     # We change this scan to use "OffPnt" pointing type.
-                    self.scans[i].setPointing("Offpnt")
+                    tScan.setPointing("Offpnt")
+            yield current
             # Increment the time since last pointing.
-            for j in lastPointings:
-                lastPointings[j]['timeDelta'] += self.__durationSeconds(scan=i)
-            i += 1
-                
-                        
-        
-        # Check 4: add focus scans when the frequency configuration changes.
-        # We will only need to do focus scans if we change to or from 4cm.
-        if len(observedBands) > 1 and "4cm" in observedBands:
-            # Find the transition points.
-            i = 1
-            while i < len(self.scans):
-                #print("[completeSchedule] schedule now has %d scans" % len(self.scans))
-                tband = self.scans[i - 1].IF1().getFrequencyBand()
-                nband = self.scans[i].IF1().getFrequencyBand()
-                if tband != nband and (tband == "4cm" or nband == "4cm"):
-                    #print("[completeSchedule] found band change between %d and %d" % ((i - 1), i))
-                    #pscan = self.scans[i - 1]
-                    #nscan = self.scans[i]
-                    #print("[completeSchedule] scan %d: %s %d/%d <%s> [%s] '%s'" % ((i - 1), pscan.getSource(),
-                    #                                                               pscan.IF1().getFreq(),
-                    #                                                               pscan.IF2().getFreq(),
-                    #                                                               pscan.getId(), pscan.getCommand(),
-                    #                                                               pscan.getComment()))
-                    #print("[completeSchedule] scan %d: %s %d/%d <%s> [%s] '%s'" % (i, nscan.getSource(),
-                    #                                                               nscan.IF1().getFreq(),
-                    #                                                               nscan.IF2().getFreq(),
-                    #                                                               nscan.getId(), nscan.getCommand(),
-                    #                                                               nscan.getComment()))
-                    
-                    # Check first to see if a focus command is already present.
-                    ncmd = self.scans[i].getCommand()
-                    #print("[completeSchedule] command in current scan [%s]" % ncmd)
-                    if "foc" not in ncmd:
-                        # Add a focus scan after this scan.
-                        # We have to keep the frequencies here, because of the way IDs work.
-                        nf1 = self.scans[i].IF1().getFreq()
-                        nf2 = self.scans[i].IF2().getFreq()
-                        nscanId = self.scans[i].getId()
-                        #print("[completeSchedule] copying scan %d" % i)
-                        self.copyScans(ids=[nscanId], pos=i, calCheck=False, keepId=False)
-                        # Change the name of this scan and add a focus command.
-                        self.scans[i].setSource("focus")
-                        self.scans[i].setCommand("focus default")
-                        # Ensure the right frequencies.
-                        self.scans[i].IF1().setFreq(nf1)
-                        self.scans[i].IF2().setFreq(nf2)
-                        # Change it to be 90 seconds long and a Normal type.
-                        self.scans[i].setScanType("Normal")
-                        self.scans[i].setPointing("Global")
-                        self.scans[i].setScanLength("00:01:30")
-                        #self.scans[i].setComment("bandchange")
-                i += 1
+            elapsed += tScan.getDurationSeconds()
+            current = following
+            following = next(stream, None)
 
+    def __bandChangeFocusScans(self, stream):
+        # Add focus scans where the band changes to or from 4cm.
+        tband = None
+        for (tScan, nband) in stream:
+            if tband is not None and tband != nband and (tband == "4cm" or nband == "4cm"):
+                # Check first to see if a focus command is already present.
+                ncmd = tScan.getCommand()
+                if "foc" not in ncmd:
+                    # Add a focus scan before this scan.
+                    # We have to keep the frequencies here, because of the way IDs work.
+                    nf1 = tScan.IF1().getFreq()
+                    nf2 = tScan.IF2().getFreq()
+                    fscan = self.__cloneScan(tScan)
+                    # Change the name of this scan and add a focus command.
+                    fscan.setSource("focus")
+                    fscan.setCommand("focus default")
+                    # Ensure the right frequencies.
+                    fscan.IF1().setFreq(nf1)
+                    fscan.IF2().setFreq(nf2)
+                    # Change it to be 90 seconds long and a Normal type.
+                    fscan.setScanType("Normal")
+                    fscan.setPointing("Global")
+                    fscan.setScanLength("00:01:30")
+                    yield (fscan, nband)
+            yield (tScan, nband)
+            tband = nband
+
+    def __compileSerializer(self):
+        # Write a function that serializes a range of scans, with one block of
+        # code for each line a scan can produce. A line is only output when its
+        # value differs from the previous scan's, exactly as
+        # __prepareScheduleLine would decide.
+        fields = []
+        for h in self.__scanHandlers:
+            fields.append(( "s", self.__scanHandlers[h]['get'],
+                            h + "=" + self.__formatSpecifier(self.__scanHandlers[h]['format']) ))
+        for h in self.__freqHandlers:
+            fields.append(( "f%s" % self.__freqHandlers[h]['object'][-1], self.__freqHandlers[h]['get'],
+                            h + "=" + self.__formatSpecifier(self.__freqHandlers[h]['format']) ))
+        loads = [ "f1 = s.IF1()", "f2 = s.IF2()" ]
+        for i in range(0, len(fields)):
+            loads.append("v%d = %s.%s()" % (i, fields[i][0], fields[i][1]))
+        loads.append("z1 = f1.getZoomChannels()")
+        loads.append("z2 = f2.getZoomChannels()")
+        code = [ "def serializeScans(scans, start, end, lines):",
+                 "    append = lines.append",
+                 "    if start > 0:",
+                 "        s = scans[start - 1]" ]
+        code += [ "        " + l for l in loads ]
+        code.append("    else:")
+        # Nothing compares equal to a new object, so every line of the first
+        # scan gets output.
+        code.append("        v0 = object()")
+        for i in range(1, len(fields)):
+            code.append("        v%d = v0" % i)
+        code.append("        z1 = z2 = ( v0, ) * %d" % nZoomBands)
+        code.append("    for i in range(start, end):")
+        code.append("        s = scans[i]")
+        code.append("        append(\"$SCAN*V5\")")
+        for i in range(0, len(fields)):
+            code.append("        p%d = v%d" % (i, i))
+        code.append("        pz1 = z1")
+        code.append("        pz2 = z2")
+        code += [ "        " + l for l in loads ]
+        for i in range(0, len(fields)):
+            code.append("        if v%d != p%d:" % (i, i))
+            code.append("            append(%r %% v%d)" % (fields[i][2], i))
+        for f in range(1, 3):
+            code.append("        if z%d != pz%d:" % (f, f))
+            code.append("            for j in range(0, %d):" % nZoomBands)
+            code.append("                if z%d[j] != pz%d[j]:" % (f, f))
+            code.append("                    append(\"Zoom%%d-%d=%s\" %% (j + 1, z%d[j]))" %
+                        (f, self.__formatSpecifier("integer"), f))
+        code.append("        append(\"$SCANEND\")")
+        namespace = {}
+        exec("\n".join(code) + "\n", namespace)
+        return namespace['serializeScans']
+
+    def __serializeScans(self, start, end, lines):
+        # Append the schedule lines for the scans from start to end.
+        if type(self).__serializer is None:
+            type(self).__serializer = staticmethod(self.__compileSerializer())
+        type(self).__serializer(self.scans, start, end, lines)
 
-    
     def __outputScheduleLine(self, s, o, p, fn, fm):
         # Generic checker for line output to schedule.
         if (p is None) or (getattr(o, fn)() !=
@@ -680,145 +1304,191 @@ class schedule:
         # Check we have all our calibrator scans.
         self.checkCalibrators()
         outputStrings = []
-        for i in range(0, len(self.scans)):
-            # Every scan starts the same way.
-            outputStrings.append("$SCAN*V5")
-            for h in self.__scanHandlers:
-                outf = h + "=" + self.__formatSpecifier(self.__scanHandlers[h]['format'])
-                prevScan = None
-                if i > 0:
-                    prevScan = self.scans[i - 1]
-                nString = self.__prepareScheduleLine(self.scans[i], prevScan,
-                                                    self.__scanHandlers[h]['get'], outf)
-                if nString is not None:
-                    outputStrings.append(nString)
-            for h in self.__freqHandlers:
-                outf = h + "=" + self.__formatSpecifier(self.__freqHandlers[h]['format'])
-                prevScan = None
-                if i > 0:
-                    prevScan = getattr(self.scans[i - 1], self.__freqHandlers[h]['object'])()
-                nString = self.__prepareScheduleLine(getattr(self.scans[i], self.__freqHandlers[h]['object'])(),
-                                                     prevScan, self.__freqHandlers[h]['get'], outf)
-                if nString is not None:
-                    outputStrings.append(nString)
-            for f in range(1, 3):
-                freqObject = "IF%d" % f
-                for z in range(1, 17):
-                    outf = "Zoom%d-%d=" % (z, f)
-                    outf += self.__formatSpecifier("integer")
-                    prevScan = None
-                    if i > 0:
-                        prevScan = getattr(self.scans[i - 1], freqObject)()
-                    nString = self.__prepareScheduleLine(getattr(self.scans[i], freqObject)(),
-                                                         prevScan, "getZoomChannel", outf, z)
-                    if nString is not None:
-                        outputStrings.append(nString)
-            # And every scan ends the same way.
-            outputStrings.append("$SCANEND")
+        self.__serializeScans(0, len(self.scans), outputStrings)
         # Make the output string by joining the elements with the newline character.
         return "\n".join(outputStrings) + "\n"
-        
-    def write(self, name=None):
-        # Write out the schedule to disk.
+
+    def __iterLineChunks(self, chunkScans=500):
+        # Generate lists of the schedule lines, chunkScans scans at a time.
+        self.checkCalibrators()
+        for start in range(0, len(self.scans), chunkScans):
+            outputStrings = []
+            self.__serializeScans(start, min(start + chunkScans, len(self.scans)), outputStrings)
+            yield outputStrings
+
+    def iterLines(self, chunkScans=500):
+        # Generate the lines of the schedule string (without their newlines),
+        # without ever holding the whole text in memory.
+        for outputStrings in self.__iterLineChunks(chunkScans):
+            for line in outputStrings:
+                yield line
+
+    def write(self, name=None, chunkScans=500):
+        # Write out the schedule to disk. The name can be a file name, or
+        # any open file object (like sys.stdout or a pipe), which is written
+        # to a chunk at a time; the result is the same as toString.
         if name is not None:
-            with open(name, 'w') as schedFile:
-                schedFile.write(self.toString())
+            if hasattr(name, "write"):
+                schedFile = name
+            else:
+                schedFile = open(name, 'w')
+            try:
+                written = False
+                for outputStrings in self.__iterLineChunks(chunkScans):
+                    outputStrings.append("")
+                    schedFile.write("\n".join(outputStrings))
+                    written = True
+                if not written:
+                    # An empty schedule is still a single (blank) line.
+                    schedFile.write("\n")
+            finally:
+                if schedFile is not name:
+                    schedFile.close()
         return self
 
-    def parse(self, string=None):
+    def parse(self, string=None, trusted=False):
         # Take a schedule represented in string form (with \n as the line
         # separator) and return the scans.
-        scanDetails = {}
         if string is not None:
             # Reset our current scans.
             self.clear()
-            stringLines = [ s.strip() for s in string.splitlines() ]
-            if len(stringLines) > 0:
-                for i in range(0, len(stringLines)):
-                    line = stringLines[i]
-                    if line == "$SCAN*V5":
-                        # A new scan.
-                        scanDetails = {}
-                    elif line == "$SCANEND":
-                        # Make the new scan.
-                        self.addScan(scanDetails)
+            for nscan in self.iterParse(string.splitlines(), trusted):
+                pass
+        return self.getNumberOfScans()
+
+    def iterParse(self, fileobj=None, trusted=False, validate=True):
+        # Read a schedule from an open file object (or any other source of
+        # lines), adding each scan to this schedule and yielding it as soon
+        # as its $SCANEND is seen. If trusted is True, the scans are made
+        # without checking each value as it is set; instead the new scans are
+        # all checked together once the file is finished (if validate is True).
+        if fileobj is None:
+            return
+        if trusted == True and self.__batch is not None:
+            raise ScanError("Cannot load scans in bulk while a batch is open.")
+        first = len(self.scans)
+        # Zoom lines are only written when the zoom changes, so we remember
+        # the enabled zooms from one scan to the next.
+        zoomDetails = {}
+        scanDetails = {}
+        for line in fileobj:
+            line = line.strip()
+            if line == "$SCAN*V5":
+                # A new scan.
+                scanDetails = {}
+            elif line == "$SCANEND":
+                # Make the new scan.
+                scanDetails.update(zoomDetails)
+                if trusted == True:
+                    scan_old = None
+                    if len(self.scans) > 0:
+                        scan_old = self.scans[-1]
+                    nscan = self.__makeTrustedScan(scanDetails, scan_old)
+                    self.__appendScan(nscan)
+                    yield nscan
+                else:
+                    yield self.addScan(scanDetails)
+            else:
+                # Add to the scan options object.
+                lineOption = self.lineOption(line)
+                if lineOption is None:
+                    continue
+                ( option, value ) = lineOption
+                if option.startswith("zoom"):
+                    if int(value) == 0:
+                        zoomDetails.pop(option, None)
                     else:
-                        # Add to the scan options object.
-                        els = line.split("=")
-                        if els[0] in self.__scanHandlers:
-                            scanDetails[self.__scanHandlers[els[0]]['option']] = els[1]
-                        elif els[0] in self.__freqHandlers:
-                            scanDetails[self.__freqHandlers[els[0]]['option']] = els[1]
+                        zoomDetails[option] = value
+                else:
+                    scanDetails[option] = value
+        if trusted == True and validate == True:
+            self.validateScans(first)
+
+    def lineOption(self, line=None):
+        # Return the option name and value set by a (stripped) line of a
+        # schedule file, or None if it doesn't set one. Zoom options are
+        # named like "zoom3-1" for zoom 3 of IF1, as addScan expects.
+        if line is None:
+            return None
+        if self.__lineOptions is None:
+            lineOptions = {}
+            for h in self.__scanHandlers:
+                lineOptions[h] = self.__scanHandlers[h]['option']
+            for h in self.__freqHandlers:
+                lineOptions[h] = self.__freqHandlers[h]['option']
+            for f in range(1, 3):
+                for z in range(1, nZoomBands + 1):
+                    lineOptions["Zoom%d-%d" % (z, f)] = "zoom%d-%d" % (z, f)
+            type(self).__lineOptions = lineOptions
+        els = line.split("=")
+        if els[0] in self.__lineOptions:
+            return ( self.__lineOptions[els[0]], els[1] )
+        return None
+
+    def read(self, name=None, trusted=False):
+        # Read in a schedule file, which can be a file name or an open file.
+        if name is not None:
+            self.clear()
+            if hasattr(name, "read"):
+                for nscan in self.iterParse(name, trusted):
+                    pass
+            else:
+                with open(name, 'r') as schedFile:
+                    for nscan in self.iterParse(schedFile, trusted):
+                        pass
         return self.getNumberOfScans()
-                    
-    
-    def read(self, name=None):
-        # Read in a schedule file.
+
+    def toBinary(self):
+        # Return the schedule, its calibrator associations and settings in
+        # the compact binary form.
+        return binary_schedule.scheduleToBinary(self)
+
+    def fromBinary(self, data=None):
+        # Replace this schedule with one in the compact binary form.
+        if data is not None:
+            if self.__batch is not None:
+                raise ScanError("Cannot load a binary schedule while a batch is open.")
+            ( scans, settings ) = binary_schedule.binaryToScans(data, self)
+            self.clear()
+            for n in settings:
+                setattr(self, n, settings[n])
+            self.__replaceScans(scans)
+        return self.getNumberOfScans()
+
+    def writeBinary(self, name=None):
+        # Write out the schedule in the compact binary form, to a file name
+        # or an open binary file.
+        if name is not None:
+            if hasattr(name, "write"):
+                name.write(self.toBinary())
+            else:
+                with open(name, 'wb') as schedFile:
+                    schedFile.write(self.toBinary())
+        return self
+
+    def readBinary(self, name=None):
+        # Read in a schedule in the compact binary form, from a file name or
+        # an open binary file.
         if name is not None:
-            with open(name, 'r') as schedFile:
-                self.parse(schedFile.read())
+            if hasattr(name, "read"):
+                return self.fromBinary(name.read())
+            with open(name, 'rb') as schedFile:
+                return self.fromBinary(schedFile.read())
         return self.getNumberOfScans()
 
-    def __durationSeconds(self, scan=None):
-        # Return the duration of the nominated scan in seconds.
-        durSeconds = 0
-        if scan is not None and scan >= 0 and scan < len(self.scans):
-            durString = self.scans[scan].getScanLength()
-            durEls = durString.split(":")
-            durSeconds = int(durEls[0]) * 3600 + int(durEls[1]) * 60 + int(durEls[2])
-        return durSeconds
-
-    def __angleRadians(self, scan=None):
-        # Return the right ascension and declination as radian angles.
-        if scan is not None and scan >= 0 and scan < len(self.scans):
-            raString = self.scans[scan].getRightAscension()
-            decString = self.scans[scan].getDeclination()
-            raEls = raString.split(":")
-            decEls = decString.split(":")
-            raRads = (math.pi / 180.0) * 15.0 * (float(raEls[0]) + float(raEls[1]) / 60.0 +
-                                                 float(raEls[2]) / 3600.0)
-            decSign = 1.0
-            decPattern = re.compile("^\-")
-            if decPattern.match(decString):
-                decSign = -1.0
-            decRads = decSign * (math.pi / 180.0) * (decSign * float(decEls[0]) +
-                                                     float(decEls[1]) / 60.0 + float(decEls[2]) / 3600.0)
-            return { "rightAscension": raRads, "declination": decRads }
-        return { "rightAscension": None, "declination": None }
-
-    def __angularDistance(self, scanOrig=None, scanDest=None):
-        # Return the angular distance between the original scan and the destination
-        # scan, in degrees.
-        if (scanOrig is not None and scanOrig >= 0 and scanOrig < len(self.scans) and
-            scanDest is not None and scanDest >= 0 and scanDest < len(self.scans)):
-            # We don't need to be particularly sophisticated in our approach here,
-            # because we just need a rough estimate of the distance.
-            if scanOrig == scanDest:
-                # Obviously 0.
-                return 0
-            scanOrigCoord = self.__angleRadians(scan=scanOrig)
-            scanDestCoord = self.__angleRadians(scan=scanDest)
-            if (scanOrigCoord["rightAscension"] is not None and
-                scanDestCoord["rightAscension"] is not None):
-                try:
-                    angDist = math.acos(math.sin(scanOrigCoord["declination"]) *
-                                        math.sin(scanDestCoord["declination"]) +
-                                        math.cos(scanOrigCoord["declination"]) *
-                                        math.cos(scanDestCoord["declination"]) *
-                                        math.cos(scanDestCoord["rightAscension"] -
-                                                 scanOrigCoord["rightAscension"]))
-                except ValueError as e:
-                    print ("got value error")
-                    print ("original coordinates RA = %.4f (%s) Dec = %.4f (%s)" %
-                           (scanOrigCoord["rightAscension"], self.scans[scanOrig].getRightAscension(),
-                            scanOrigCoord["declination"], self.scans[scanOrig].getDeclination()))
-                    print ("destination coordinates RA = %.4f (%s) Dec = %.4f (%s)" %
-                           (scanDestCoord["rightAscension"], self.scans[scanDest].getRightAscension(),
-                            scanDestCoord["declination"], self.scans[scanDest].getDeclination()))
-                    angDist = 0.0
-                return angDist * 180.0 / math.pi
-        return None
-    
+    def getPositions(self):
+        # Return arrays of the right ascension and declination of each scan, in radians.
+        positions = np.array([ s.getPosition() for s in self.scans ], dtype=float).reshape(-1, 2)
+        return ( positions[:, 0], positions[:, 1] )
+
+    def getSeparations(self, rightAscension=None, declination=None):
+        # Return the angular distances (in degrees) between every pair of scans,
+        # or from a position (in radians) to every scan.
+        ( ras, decs ) = self.getPositions()
+        if rightAscension is None or declination is None:
+            return angularSeparations(ras, decs)
+        return angularSeparations(rightAscension, declination, ras, decs)
+
     def needsPointing(self, band=None):
         # Return indication of whether the specified band needs a pointing in this
         # schedule.
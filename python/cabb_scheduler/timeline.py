@@ -0,0 +1,90 @@
+# Routines to work out when the scans in a schedule happen, in both local
+# sidereal time (LST) and UTC, for many possible start times at once.
+import numpy as np
+import datetime
+
+# Where the ATCA is, in degrees (east longitude).
+atcaLongitude = 149.56394
+atcaLatitude = -30.31498
+
+# The length of a solar second in sidereal seconds, and the other way round.
+siderealPerSolar = 1.00273790935
+solarPerSidereal = 1.0 / siderealPerSolar
+
+# The MJD of the J2000 epoch, 2000-01-01 12:00 UTC.
+mjdJ2000 = 51544.5
+
+def timeToHours(timeString=None):
+    # Turn a HH:MM:SS (or HH:MM) time into decimal hours.
+    timeEls = timeString.split(":")
+    hours = float(timeEls[0]) + float(timeEls[1]) / 60.0
+    if len(timeEls) > 2:
+        hours += float(timeEls[2]) / 3600.0
+    return hours
+
+def hoursToTime(hours=None):
+    # Turn decimal hours into a HH:MM:SS time, wrapped into a day.
+    seconds = int(round((hours % 24.0) * 3600.0)) % 86400
+    return "%02d:%02d:%02d" % ( seconds // 3600, (seconds // 60) % 60, seconds % 60 )
+
+def dateToMjd(dateString=None):
+    # Turn a DD/MM/YYYY schedule date into the MJD at the start of that day.
+    ( day, month, year ) = [ int(d) for d in dateString.split("/") ]
+    return float((datetime.date(year, month, day) - datetime.date(1858, 11, 17)).days)
+
+def mjdToDatetime(mjd=None):
+    # Turn an MJD into a datetime (in UTC).
+    return datetime.datetime(1858, 11, 17) + datetime.timedelta(days=float(mjd))
+
+def mjdToLst(mjd=None, longitude=atcaLongitude):
+    # Return the LST (in hours) at the ATCA (or the east longitude given in
+    # degrees) at each UTC MJD. The whole days are taken out before
+    # multiplying by the sidereal rate, so no precision is lost.
+    days = np.asarray(mjd, dtype=float) - mjdJ2000
+    gmst = 18.697374558 + 0.06570982441908 * days + 24.0 * (days % 1.0)
+    return (gmst + longitude / 15.0) % 24.0
+
+def lstToMjd(lst=None, mjdAfter=None, longitude=atcaLongitude):
+    # Return the first UTC MJD at or after mjdAfter when the LST (in hours)
+    # is lst.
+    mjdAfter = np.asarray(mjdAfter, dtype=float)
+    siderealHours = (np.asarray(lst, dtype=float) - mjdToLst(mjdAfter, longitude)) % 24.0
+    return mjdAfter + siderealHours * solarPerSidereal / 24.0
+
+def __addHours(times, hours):
+    # Add each of the hours to each of the times (both 0 - 24), and wrap the
+    # results back into a day. Wrapping the two small arrays first means the
+    # big result only needs a subtraction, which is much quicker than %.
+    result = np.add(times, hours % 24.0)
+    np.subtract(result, 24.0, out=result, where=(result >= 24.0))
+    return result
+
+def scanTimes(starts=None, durations=None, startTimes=None, timeCode="LST", date=None,
+              longitude=atcaLongitude):
+    # Work out the LST and UTC start and end of each scan. The scans start
+    # at starts seconds (of ordinary time) from the beginning of the schedule
+    # and last durations seconds. The schedule begins at startTimes (in
+    # hours), which are either LSTs or UTCs depending on timeCode, on the
+    # date (DD/MM/YYYY) given; an LST start is the first time after 0 UTC on
+    # that date with that LST. startTimes can be one time, or an array of C
+    # possible times, in which case each result is a (C x N) array with a row
+    # for each start time. The LSTs are returned in hours (0 - 24), the UTCs
+    # as MJDs.
+    starts = np.asarray(starts, dtype=float)
+    durations = np.asarray(durations, dtype=float)
+    startTimes = np.asarray(startTimes, dtype=float)
+    dayMjd = dateToMjd(date)
+    if timeCode == "UTC":
+        utcZero = dayMjd + startTimes / 24.0
+        lstZero = mjdToLst(utcZero, longitude)
+    else:
+        lstZero = startTimes % 24.0
+        utcZero = lstToMjd(lstZero, dayMjd, longitude)
+    # Put the start times down the first axis, and the scans along the last.
+    utcZero = utcZero[..., np.newaxis]
+    lstZero = lstZero[..., np.newaxis]
+    ends = starts + durations
+    return { 'lstStart': __addHours(lstZero, starts * siderealPerSolar / 3600.0),
+             'lstEnd': __addHours(lstZero, ends * siderealPerSolar / 3600.0),
+             'utcStart': utcZero + starts / 86400.0,
+             'utcEnd': utcZero + ends / 86400.0 }
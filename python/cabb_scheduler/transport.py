@@ -0,0 +1,331 @@
+# The HTTP connection used for all the requests to the ATCA web services.
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit, urlencode
+import threading
+import asyncio
+import queue
+import ssl
+
+class httpTransport:
+    def __init__(self, poolSize=10, timeout=( 10, 60 ), retries=3, backoff=0.5,
+                 retryStatuses=( 500, 502, 503, 504 )):
+        # Connections are kept open for reuse, up to poolSize per server.
+        # Each request gets timeout seconds (or a (connect, read) pair), and
+        # connection errors and the retryStatuses are retried up to retries
+        # times, waiting backoff, 2 * backoff, 4 * backoff... seconds between.
+        # The requests we make only ask for information, so it is safe to
+        # retry them even though they are POSTs.
+        self.poolSize = poolSize
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retryStatuses = retryStatuses
+        # A session can't safely be used by two threads at once, so we keep
+        # the idle sessions here and each request borrows one. No more than
+        # poolSize requests are sent at once (the rest wait their turn), so
+        # there are never more than poolSize sessions.
+        self.__idle = queue.LifoQueue()
+        self.__slots = threading.BoundedSemaphore(poolSize)
+        self.__lock = threading.Lock()
+        self.__sessions = []
+        # How many requests are being sent, and whether to close the sessions
+        # once they have all finished.
+        self.__active = 0
+        self.__closing = False
+
+    def __makeSession(self):
+        session = Session()
+        retry = Retry(total=self.retries, backoff_factor=self.backoff,
+                      status_forcelist=self.retryStatuses,
+                      allowed_methods=frozenset([ "GET", "POST" ]),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.poolSize, pool_maxsize=self.poolSize,
+                              max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        with self.__lock:
+            self.__sessions.append(session)
+        return session
+
+    def post(self, url=None, data=None):
+        # Send a POST request and return the response.
+        with self.__slots:
+            with self.__lock:
+                self.__active += 1
+            try:
+                try:
+                    session = self.__idle.get_nowait()
+                except queue.Empty:
+                    session = self.__makeSession()
+                try:
+                    return session.post(url=url, data=data, timeout=self.timeout)
+                finally:
+                    self.__idle.put(session)
+            finally:
+                self.__finished()
+
+    def __finished(self):
+        with self.__lock:
+            self.__active -= 1
+            drained = self.__closing and self.__active == 0
+        if drained:
+            self.close()
+
+    def numSessions(self):
+        with self.__lock:
+            return len(self.__sessions)
+
+    def close(self):
+        # Close all the sessions.
+        with self.__lock:
+            for session in self.__sessions:
+                session.close()
+            self.__sessions = []
+            self.__idle = queue.LifoQueue()
+        return self
+
+    def closeWhenIdle(self):
+        # Close all the sessions once the requests using them have finished,
+        # or now if there aren't any.
+        with self.__lock:
+            self.__closing = True
+            idle = self.__active == 0
+        if idle:
+            self.close()
+        return self
+
+# The transport shared by everything in the library.
+__transport = None
+__transportLock = threading.Lock()
+
+def getTransport():
+    global __transport
+    with __transportLock:
+        if __transport is None:
+            __transport = httpTransport()
+        return __transport
+
+def setTransport(transport=None):
+    # Use a different transport (like an httpTransport with other settings),
+    # or go back to the default one if transport is None. Other threads may
+    # still be sending requests with the old transport, so it is only closed
+    # once they have finished; a transport that isn't an httpTransport is
+    # left for whoever made it to close.
+    global __transport
+    with __transportLock:
+        ( oldTransport, __transport ) = ( __transport, transport )
+    if (oldTransport is not None and oldTransport is not transport and
+        isinstance(oldTransport, httpTransport)):
+        oldTransport.closeWhenIdle()
+
+def configure(**settings):
+    # Replace the shared transport with one using these httpTransport settings.
+    setTransport(httpTransport(**settings))
+    return getTransport()
+
+def post(url=None, data=None):
+    return getTransport().post(url, data)
+
+class asyncResponse:
+    def __init__(self, status=None, headers={}, content=b""):
+        # The parts of a response that we use, named as in a requests Response.
+        self.status_code = status
+        self.headers = headers
+        self.content = content
+        charset = "utf-8"
+        for part in headers.get("content-type", "").split(";")[1:]:
+            ( name, _, value ) = part.strip().partition("=")
+            if name.lower() == "charset" and value != "":
+                charset = value.strip('"')
+        self.text = content.decode(charset, errors="replace")
+
+class asyncHttpTransport:
+    # The same as httpTransport, but for use with asyncio. Connections are
+    # only kept for the event loop they were made in.
+    def __init__(self, poolSize=10, timeout=( 10, 60 ), retries=3, backoff=0.5,
+                 retryStatuses=( 500, 502, 503, 504 )):
+        self.poolSize = poolSize
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retryStatuses = retryStatuses
+        # The event loop, the idle connections to each server, and the
+        # semaphore that stops us having more than poolSize requests at once.
+        self.__loop = None
+        self.__idle = {}
+        self.__slots = None
+
+    def __timeouts(self):
+        if isinstance(self.timeout, ( tuple, list )):
+            return self.timeout
+        return ( self.timeout, self.timeout )
+
+    def __loopState(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.__loop:
+            # We can't use connections from another loop.
+            self.close()
+            self.__loop = loop
+            self.__slots = asyncio.Semaphore(self.poolSize)
+        return self.__slots
+
+    async def __connect(self, server):
+        ( scheme, host, port ) = server
+        sslContext = None
+        if scheme == "https":
+            sslContext = ssl.create_default_context()
+        return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=sslContext),
+                                      self.__timeouts()[0])
+
+    async def __readHead(self, reader):
+        # Read the status line and headers.
+        statusLine = await reader.readline()
+        if statusLine == b"":
+            raise ConnectionResetError("The server closed the connection.")
+        status = int(statusLine.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in ( b"\r\n", b"\n", b"" ):
+                break
+            ( name, _, value ) = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return ( status, headers )
+
+    async def __readResponse(self, reader, method="POST"):
+        # Read the status line, headers and body. Returns the response, and
+        # whether the connection can be used again.
+        ( status, headers ) = await self.__readHead(reader)
+        while 100 <= status < 200 and status != 101:
+            # An interim response (like 100 Continue) has no body, and the
+            # real response follows it.
+            ( status, headers ) = await self.__readHead(reader)
+        reusable = headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in ( 101, 204, 304 ):
+            # These never have a body, whatever the headers say.
+            content = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Skip any trailers.
+                    while (await reader.readline()) not in ( b"\r\n", b"\n", b"" ):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            content = b"".join(chunks)
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        else:
+            content = await reader.read()
+            reusable = False
+        return ( asyncResponse(status, headers, content), reusable )
+
+    async def __request(self, server, request):
+        # Send the request on an idle connection if there is one, or a new one.
+        # A connection that has been idle may have been closed by the server,
+        # so if it is reset or ends early we try again on a new connection.
+        # Anything else (including a timeout, which is also an OSError) is
+        # left for post to deal with.
+        idle = self.__idle.setdefault(server, [])
+        while True:
+            reused = len(idle) > 0
+            if reused:
+                ( reader, writer ) = idle.pop()
+            else:
+                ( reader, writer ) = await self.__connect(server)
+            try:
+                writer.write(request)
+                await writer.drain()
+                ( response, reusable ) = await asyncio.wait_for(self.__readResponse(reader),
+                                                                self.__timeouts()[1])
+            except asyncio.TimeoutError:
+                writer.close()
+                raise
+            except ( ConnectionError, asyncio.IncompleteReadError ):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if reusable and len(idle) < self.poolSize:
+                idle.append(( reader, writer ))
+            else:
+                writer.close()
+            return response
+
+    async def post(self, url=None, data=None):
+        # Send a POST request and return the response.
+        parts = urlsplit(url)
+        port = parts.port
+        if port is None:
+            port = 443 if parts.scheme == "https" else 80
+        server = ( parts.scheme, parts.hostname, port )
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        body = urlencode(data or {}, doseq=True).encode("utf-8")
+        request = ("POST %s HTTP/1.1\r\nHost: %s\r\n"
+                   "Content-Type: application/x-www-form-urlencoded\r\n"
+                   "Content-Length: %d\r\nAccept-Encoding: identity\r\n"
+                   "Connection: keep-alive\r\n\r\n" % ( path, parts.netloc, len(body) )).encode("latin-1") + body
+        slots = self.__loopState()
+        attempt = 0
+        while True:
+            try:
+                async with slots:
+                    response = await self.__request(server, request)
+                if response.status_code not in self.retryStatuses or attempt >= self.retries:
+                    return response
+            except ( OSError, asyncio.IncompleteReadError, asyncio.TimeoutError ):
+                if attempt >= self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2**attempt)
+            attempt += 1
+
+    def close(self):
+        # Close all the idle connections.
+        for server in self.__idle:
+            for ( reader, writer ) in self.__idle[server]:
+                try:
+                    writer.close()
+                except RuntimeError:
+                    # Its event loop has already gone.
+                    pass
+        self.__idle = {}
+        return self
+
+# The transport used by the asyncio routines.
+__asyncTransport = None
+
+def getAsyncTransport():
+    global __asyncTransport
+    with __transportLock:
+        if __asyncTransport is None:
+            __asyncTransport = asyncHttpTransport()
+        return __asyncTransport
+
+def setAsyncTransport(transport=None):
+    # Use a different asyncio transport, which can be anything with a
+    # coroutine post(url, data) that returns something with the response
+    # in its text, or go back to the default one if transport is None.
+    global __asyncTransport
+    with __transportLock:
+        if (__asyncTransport is not None and __asyncTransport is not transport and
+            hasattr(__asyncTransport, "close")):
+            __asyncTransport.close()
+        __asyncTransport = transport
+
+def configureAsync(**settings):
+    # Replace the asyncio transport with one using these asyncHttpTransport settings.
+    setAsyncTransport(asyncHttpTransport(**settings))
+    return getAsyncTransport()
+
+async def aPost(url=None, data=None):
+    return await getAsyncTransport().post(url, data)
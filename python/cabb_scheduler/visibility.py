@@ -0,0 +1,92 @@
+# Routines to work out when sources are above the horizon (or any other
+# elevation limit) at the ATCA, for many sources and limits at once.
+from cabb_scheduler.positions import positionToRadians
+from cabb_scheduler.timeline import atcaLatitude, solarPerSidereal
+import numpy as np
+import functools
+
+def hourAngleLimits(declinations=None, elevationLimits=12.0, latitude=atcaLatitude):
+    # Return the hour angle (in hours) at which sources at the declinations
+    # (in radians) go below each elevation limit (in degrees), at the
+    # latitude (in degrees). The result has a row for each declination and a
+    # column for each elevation limit (or just one value per declination if
+    # there is a single limit). A source that never goes below the limit
+    # gets 12, and one that never gets above it gets 0, so a source spends
+    # twice this many sidereal hours above the limit every day.
+    decs = np.asarray(declinations, dtype=float)
+    elevations = np.radians(np.asarray(elevationLimits, dtype=float))
+    if elevations.ndim > 0:
+        decs = decs[..., np.newaxis]
+    latR = np.radians(latitude)
+    cosHas = ((np.sin(elevations) - np.sin(latR) * np.sin(decs)) /
+              (np.cos(decs) * np.cos(latR)))
+    return np.degrees(np.arccos(np.clip(cosHas, -1.0, 1.0))) / 15.0
+
+def riseSetLsts(rightAscensions=None, declinations=None, elevationLimits=12.0,
+                latitude=atcaLatitude):
+    # Return the LSTs (in hours, 0 - 24) at which the sources at the positions
+    # (in radians) rise above and set below each elevation limit (in degrees),
+    # shaped like hourAngleLimits, along with the hour angle limits. The LSTs
+    # are NaN for sources that never rise or never set.
+    haLimits = hourAngleLimits(declinations, elevationLimits, latitude)
+    ras = np.degrees(np.asarray(rightAscensions, dtype=float)) / 15.0
+    if haLimits.ndim > ras.ndim:
+        ras = ras[..., np.newaxis]
+    crosses = (haLimits > 0) & (haLimits < 12)
+    return { 'rise': np.where(crosses, (ras - haLimits) % 24.0, np.nan),
+             'set': np.where(crosses, (ras + haLimits) % 24.0, np.nan),
+             'hourAngle': haLimits }
+
+def elevations(rightAscensions=None, declinations=None, lsts=None, latitude=atcaLatitude):
+    # Return the elevation (in degrees) of each of the sources at the
+    # positions (in radians) at each of the LSTs (in hours), as an array with
+    # a row for each source and a column for each LST.
+    ras = np.asarray(rightAscensions, dtype=float)
+    decs = np.asarray(declinations, dtype=float)
+    lsts = np.asarray(lsts, dtype=float)
+    if lsts.ndim > 0:
+        ras = ras[..., np.newaxis]
+        decs = decs[..., np.newaxis]
+    hourAngles = np.radians(lsts * 15.0) - ras
+    latR = np.radians(latitude)
+    sinEls = np.sin(latR) * np.sin(decs) + np.cos(latR) * np.cos(decs) * np.cos(hourAngles)
+    return np.degrees(np.arcsin(np.clip(sinEls, -1.0, 1.0)))
+
+def isUp(rightAscensions=None, declinations=None, lsts=None, elevationLimit=12.0,
+         latitude=atcaLatitude):
+    # Return whether each source is above the elevation limit at each LST,
+    # shaped like elevations.
+    return elevations(rightAscensions, declinations, lsts, latitude) >= elevationLimit
+
+def hoursUntil(fromLsts=None, toLsts=None):
+    # Return how many hours (of ordinary time) it is from each of fromLsts to
+    # the next time it is each of toLsts.
+    return ((np.asarray(toLsts, dtype=float) - np.asarray(fromLsts, dtype=float)) % 24.0) * solarPerSidereal
+
+# How many windows lstWindow remembers; the ones used least recently are
+# forgotten first.
+maxWindows = 4096
+
+@functools.lru_cache(maxsize=maxWindows)
+def __window(rightAscension, declination, elevationLimit, latitude):
+    ( raRads, decRads ) = positionToRadians(rightAscension, declination)
+    times = riseSetLsts(raRads, decRads, elevationLimit, latitude)
+    if np.isnan(times['rise']):
+        return ( None, None )
+    return ( float(times['rise']), float(times['set']) )
+
+def lstWindow(rightAscension=None, declination=None, elevationLimit=12.0, latitude=atcaLatitude):
+    # Return the LSTs (in hours) at which the source at the sexagesimal
+    # position rises above and sets below the elevation limit, as a
+    # dictionary with 'rise' and 'set', which are both None if the source
+    # never rises or never sets. Each window is only worked out once (until
+    # maxWindows others have been used since), so this can be called as often
+    # as needed for the calibrators.
+    if rightAscension is None or declination is None:
+        return None
+    ( rise, set ) = __window(rightAscension, declination, float(elevationLimit), float(latitude))
+    return { 'rise': rise, 'set': set }
+
+def clearWindows():
+    # Forget all the windows lstWindow has worked out.
+    __window.cache_clear()
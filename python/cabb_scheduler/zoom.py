@@ -2,31 +2,35 @@
 import cabb_scheduler.errors
 
 class zoom:
-    def __init__(self, parent):
+    # The zoom settings themselves are kept by the frequency setup; this is
+    # just a handle on one of its zooms, numbered from 1.
+    __slots__ = ( '__parent', '__zoomnum' )
+
+    def __init__(self, parent, zoomnum=1):
         self.__parent = parent
-        self.__details = { 'channel': 1, 'enabled': False, 'group': -1 }
+        self.__zoomnum = zoomnum
 
     def isEnabled(self):
-        return self.__details['enabled']
+        return self.__parent.zoomState(self.__zoomnum)[1]
 
     def enable(self):
-        self.__details['enabled'] = True
+        self.__parent.setZoomState(self.__zoomnum, enabled=True)
         return self
 
     def disable(self):
-        self.__details['enabled'] = False
+        self.__parent.setZoomState(self.__zoomnum, enabled=False)
         return self
 
     def getGroup(self):
-        return self.__details['group']
+        return self.__parent.zoomState(self.__zoomnum)[2]
 
     def setGroup(self, group=None):
         if group is not None:
-            self.__details['group'] = group
+            self.__parent.setZoomState(self.__zoomnum, group=group)
         return self
-    
+
     def getChannel(self):
-        return self.__details['channel']
+        return self.__parent.zoomState(self.__zoomnum)[0]
 
     def setChannel(self, chan=None):
         channelWidth = self.__parent.getChannelWidth()
@@ -35,9 +39,9 @@ class zoom:
             if (chan < 1) or (chan > (nChannels * 2) + 1):
                 raise ZoomError("Specified zoom channel is not in the band.")
             else:
-                self.__details['channel'] = chan
+                self.__parent.setZoomState(self.__zoomnum, channel=chan)
         return self
-    
+
     def setFreq(self, freq=None):
         sideband = self.__parent.getSideband()
         channelWidth = self.__parent.getChannelWidth()
@@ -0,0 +1,124 @@
+# This program checks that completeSchedule makes the same schedules as
+# another copy of the library (like an older checkout), for random schedules
+# where some of the scans are copies that share an ID with another scan, and
+# some of those copies have been moved to another band.
+# Run it as:
+#   python compare_schedules.py /path/to/other/python [number of schedules]
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+
+# The frequency pairs the scans can have, in each band.
+frequencies = [ ( 2100, 2100 ), ( 5500, 9000 ), ( 17000, 19000 ), ( 33000, 35000 ),
+                ( 43000, 45000 ), ( 93000, 95000 ) ]
+
+class calibrator:
+    # Enough of a calibrator for schedule.addCalibrator.
+    def __init__(self, name, rightAscension, declination):
+        self.name = name
+        self.rightAscension = rightAscension
+        self.declination = declination
+
+    def getName(self):
+        return self.name
+
+    def getRightAscension(self):
+        return self.rightAscension
+
+    def getDeclination(self):
+        return self.declination
+
+def randomPosition(rng):
+    return ( "%02d:%02d:%02d" % ( rng.randrange(24), rng.randrange(60), rng.randrange(60) ),
+             "%s%02d:%02d:%02d" % ( rng.choice("-+"), rng.randrange(90), rng.randrange(60),
+                                    rng.randrange(60) ) )
+
+def randomSchedule(cabb, seed):
+    # Make a random schedule, with the same scans for the same seed.
+    rng = random.Random(seed)
+    sched = cabb.schedule()
+    sched.setLooping(rng.random() < 0.5)
+    if rng.random() < 0.3:
+        sched.enablePrepScans()
+    if rng.random() < 0.5:
+        sched.enableDelayCal()
+    sched.setPointingLowBand(rng.choice([ "16cm", "4cm", "15mm", "7mm", "3mm" ]))
+    sources = []
+    for i in range(0, rng.randrange(1, 5)):
+        ( ra, dec ) = randomPosition(rng)
+        if len(sources) > 0 and rng.random() < 0.4:
+            # Put it near another source.
+            ( ra, dec ) = sources[-1][1:]
+        sources.append(( "src%d" % i, ra, dec ))
+    for i in range(0, rng.randrange(1, 25)):
+        source = rng.choice(sources)
+        freqs = rng.choice(frequencies)
+        options = { 'source': source[0], 'rightAscension': source[1], 'declination': source[2],
+                    'freq1': freqs[0], 'freq2': freqs[1],
+                    'scanLength': "00:%02d:%02d" % ( rng.randrange(60), rng.randrange(60) ) }
+        if rng.random() < 0.3:
+            options['bw1'] = 64
+            options['bw2'] = 64
+        if rng.random() < 0.2:
+            options['pointing'] = "Offset"
+        if rng.random() < 0.2:
+            options['calCode'] = "C"
+        nscan = sched.addScan(options)
+        if rng.random() < 0.3:
+            ( ra, dec ) = randomPosition(rng)
+            sched.addCalibrator(calibrator("cal%d" % rng.randrange(5), ra, dec), nscan,
+                                { 'scanLength': "00:02:00" })
+    # Copy some scans (keeping their IDs), and move some of the copies to
+    # another band.
+    for i in range(0, rng.randrange(1, 6)):
+        cscan = sched.getScan(idx=rng.randrange(sched.getNumberOfScans()))
+        sched.copyScans([ cscan.getId() ], rng.randrange(sched.getNumberOfScans() + 1))
+        firstScans = {}
+        copies = [ s for s in sched.scans if firstScans.setdefault(s.getId(), s) is not s ]
+        if len(copies) > 0 and rng.random() < 0.8:
+            freqs = rng.choice(frequencies)
+            copied = rng.choice(copies)
+            copied.IF1().setFreq(freqs[0])
+            copied.IF2().setFreq(freqs[1])
+    if rng.random() < 0.5:
+        # Copy a few scans at once, some of which may share an ID.
+        ids = [ sched.getScan(idx=rng.randrange(sched.getNumberOfScans())).getId()
+                for i in range(0, rng.randrange(1, 4)) ]
+        sched.copyScans(ids, rng.randrange(-1, sched.getNumberOfScans() + 1),
+                        keepId=(rng.random() < 0.5))
+    return sched
+
+def completedSchedules(libraryPath, nSchedules):
+    # Complete the random schedules with the library at libraryPath, in a
+    # separate process so the two libraries don't get mixed up.
+    output = subprocess.run([ sys.executable, "-W", "ignore", __file__, "--complete",
+                              libraryPath, str(nSchedules) ],
+                            capture_output=True, text=True, check=True)
+    return json.loads(output.stdout)
+
+if len(sys.argv) > 2 and sys.argv[1] == "--complete":
+    sys.path.insert(0, sys.argv[2])
+    import cabb_scheduler as cabb
+    schedules = []
+    for seed in range(0, int(sys.argv[3])):
+        sched = randomSchedule(cabb, seed)
+        # Some versions print as they go, which we don't want mixed in.
+        with contextlib.redirect_stdout(io.StringIO()):
+            sched.completeSchedule()
+            schedules.append(sched.toString())
+    print(json.dumps(schedules))
+elif len(sys.argv) > 1:
+    nSchedules = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    ours = completedSchedules(os.path.dirname(os.path.abspath(__file__)), nSchedules)
+    theirs = completedSchedules(os.path.abspath(sys.argv[1]), nSchedules)
+    differences = [ i for i in range(0, nSchedules) if ours[i] != theirs[i] ]
+    print("%d of %d schedules differ" % ( len(differences), nSchedules ))
+    if len(differences) > 0:
+        print("  seeds: %s" % " ".join([ str(i) for i in differences[:20] ]))
+        sys.exit(1)
+else:
+    print("Usage: python compare_schedules.py /path/to/other/python [number of schedules]")
@@ -0,0 +1,68 @@
+# example5.py
+# Part of the ATCA scheduler Python library.
+
+# This example makes the same schedules as example4, but lets the library's
+# schedule builder do the work that example4 shows step by step.
+# Example 5:
+# Suppose an event trigger has been received for a flaring magnetar at
+# coordinates RA = 01:00:43.1, Dec = -23:11:33.8.
+# You send a request to the 2022 ATCA rapid response system, asking for
+# observations of this magnetar at 4cm and 15mm.
+# The builder times things a little more carefully than example4 does: it
+# converts between LST and ordinary time with the exact sidereal rate
+# (example4 uses 0.9972222), works out when 1934-638 rises and sets instead
+# of using fixed LSTs, and makes every scan length a whole number of
+# seconds. It also looks for calibrators at the frequencies of each band,
+# where example4 always looks at 5500 and 9000 MHz. Given the same
+# calibrators, the schedules for this request come out the same.
+
+# Include the library.
+import cabb_scheduler as cabb
+
+
+if __name__ == "__main__":
+    # Set up the dictionary for the request.
+    requestDict = {
+        "source": "magnetar", "rightAscension": "01:00:43.1",
+        "declination": "-23:11:33.8", "project": "C006",
+        "maxExposureLength": "12:00:00", "minExposureLength": "03:00:00",
+        "4cm": { "use": True, "exposureLength": "00:30:00",
+                 "freq1": 5500, "freq2": 9000 },
+        "15mm": { "use": True, "exposureLength": "00:30:00",
+                  "freq1": 17000, "freq2": 19000 }
+    }
+
+    # The builder does all the work: it decides how long to make each scan,
+    # how many times to visit the source in each band, when to go to the
+    # flux density calibrator, and which calibrator to use for each band.
+    # We will assume a 6km array for convenience. The builder remembers the
+    # calibrators it finds, so the later schedules don't look them up again.
+    builder = cabb.scheduleBuilder(array="6A", pointingLowBand="15mm")
+
+    # We will make several schedules to illustrate how the schedule will
+    # be generated in different circumstances.
+
+    # First, the easiest circumstance. The source is above the horizon and
+    # CABB is in 1 MHz continuum mode. We start just after the source rises
+    # at 19:10.
+    schedule1 = builder.build(requestDict, "19:10:00")
+    schedule1.write(name="c006_magnetar_example5_test1.sch")
+
+    # Next, the source is setting, and CABB is in 1 MHz continuum mode. We
+    # start just after the source transits at 01:10.
+    schedule2 = builder.build(requestDict, "01:10:00")
+    schedule2.write(name="c006_magnetar_example5_test2.sch")
+
+    # Now we start just 3 hours before the source sets.
+    schedule3 = builder.build(requestDict, "03:50:00")
+    schedule3.write(name="c006_magnetar_example5_test3.sch")
+
+    # Lastly we repeat the first example but now we have CABB in 64 MHz zoom
+    # mode, so we need the delay calibration scans too.
+    schedule4 = builder.build(requestDict, "19:10:00", cabb64=True, delayCal=True)
+    schedule4.write(name="c006_magnetar_example5_test4.sch")
+
+    # How long did each part of that last build take?
+    timings = builder.getTimings()
+    for phase in timings:
+        print("%s: %.1f ms" % ( phase, timings[phase] * 1000 ))
@@ -0,0 +1,83 @@
+# Tests that the schedule builder makes the same schedules as the step by
+# step method in example4. The plans in the data directory were made by
+# example4, with the calibrator database answering from the same responses
+# that are used here.
+# Run them (from the python directory) as:
+#   python -m unittest discover -s tests
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cabb_scheduler as cabb
+import cabb_scheduler.calibrator_database as calibratorDatabase
+import cabb_scheduler.transport as transport
+
+dataPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+def readData(name):
+    with open(os.path.join(dataPath, name), 'r') as dataFile:
+        return dataFile.read()
+
+class recordedResponse:
+    def __init__(self, status, text):
+        self.status_code = status
+        self.text = text
+
+class recordedTransport:
+    # Answers the searches around the magnetar, and the quality requests.
+    def __init__(self):
+        self.qualities = json.loads(readData("source_qualities.json"))
+
+    def post(self, url=None, data=None):
+        if data.get('mode') == "cals":
+            return recordedResponse(200, readData("cone_search_magnetar.xml"))
+        return recordedResponse(200, json.dumps({ data['source']: self.qualities[data['source']] }))
+
+# The request example4 makes the schedules for.
+magnetarRequest = {
+    "source": "magnetar", "rightAscension": "01:00:43.1",
+    "declination": "-23:11:33.8", "project": "C006",
+    "maxExposureLength": "12:00:00", "minExposureLength": "03:00:00",
+    "4cm": { "use": True, "exposureLength": "00:30:00",
+             "freq1": 5500, "freq2": 9000 },
+    "15mm": { "use": True, "exposureLength": "00:30:00",
+              "freq1": 17000, "freq2": 19000 }
+}
+
+def plan(sched):
+    # The parts of each scan that the builder decides, as they are read back
+    # from the schedule file (which is how example4's plans were recorded).
+    readBack = cabb.schedule()
+    readBack.parse(sched.toString())
+    return [ [ s.getSource(), s.getRightAscension(), s.getDeclination(), s.getCalCode(), s.getScanType(),
+               s.getPointing(), s.getCommand(), s.IF1().getFreq(), s.IF2().getFreq(),
+               s.IF1().getChannelWidth(), s.getDurationSeconds(), s.getTime() ]
+             for s in [ readBack.getScan(idx=i) for i in range(0, readBack.getNumberOfScans()) ] ]
+
+class scheduleBuilderTests(unittest.TestCase):
+    def setUp(self):
+        transport.setTransport(recordedTransport())
+        calibratorDatabase.setCatalogue(None)
+        self.plans = json.loads(readData("example4_plans.json"))
+        self.builder = cabb.scheduleBuilder(array="6A", pointingLowBand="15mm")
+
+    def tearDown(self):
+        transport.setTransport(None)
+
+    def test_sourceRising(self):
+        self.assertEqual(plan(self.builder.build(magnetarRequest, "19:10:00")), self.plans['test1'])
+
+    def test_sourceSetting(self):
+        self.assertEqual(plan(self.builder.build(magnetarRequest, "01:10:00")), self.plans['test2'])
+
+    def test_sourceSettingSoon(self):
+        self.assertEqual(plan(self.builder.build(magnetarRequest, "03:50:00")), self.plans['test3'])
+
+    def test_zoomModeWithDelayCalibration(self):
+        self.assertEqual(plan(self.builder.build(magnetarRequest, "19:10:00", cabb64=True, delayCal=True)),
+                         self.plans['test4'])
+
+if __name__ == "__main__":
+    unittest.main()
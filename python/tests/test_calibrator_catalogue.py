@@ -0,0 +1,104 @@
+# Tests that searching a local catalogue gives the same calibrators as asking
+# the calibrator database, using responses in the server's format from the
+# data directory.
+# Run them (from the python directory) as:
+#   python -m unittest discover -s tests
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cabb_scheduler as cabb
+import cabb_scheduler.calibrator_database as calibratorDatabase
+import cabb_scheduler.transport as transport
+
+dataPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+def readData(name):
+    with open(os.path.join(dataPath, name), 'r') as dataFile:
+        return dataFile.read()
+
+class recordedResponse:
+    def __init__(self, status, text):
+        self.status_code = status
+        self.text = text
+
+class recordedTransport:
+    # Answers each request with the recorded response of the calibrator
+    # database, and remembers the requests.
+    def __init__(self):
+        self.requests = []
+        self.qualities = json.loads(readData("source_qualities.json"))
+
+    def post(self, url=None, data=None):
+        self.requests.append(dict(data))
+        if data.get('mode') == "cals":
+            if float(data['theta']) >= 180:
+                return recordedResponse(200, readData("cone_search_all_sky.xml"))
+            return recordedResponse(200, readData("cone_search_1934-638.xml"))
+        if data.get('action') == "source_quality":
+            return recordedResponse(200, json.dumps({ data['source']: self.qualities[data['source']] }))
+        return recordedResponse(404, "")
+
+class calibratorCatalogueTests(unittest.TestCase):
+    def setUp(self):
+        self.transport = recordedTransport()
+        transport.setTransport(self.transport)
+        calibratorDatabase.setCatalogue(None)
+        # Make the catalogue like a user would: copy the whole sky, get the
+        # qualities, then save it.
+        catalogue = cabb.calibratorCatalogue()
+        catalogue.addSearchResponse(calibratorDatabase.coneSearch("00:00:00", "-90:00:00", 180, 0))
+        catalogue.fetchQualities()
+        ( handle, self.path ) = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        catalogue.save(self.path)
+        self.catalogue = cabb.calibratorCatalogue(self.path)
+
+    def tearDown(self):
+        calibratorDatabase.setCatalogue(None)
+        transport.setTransport(None)
+        os.remove(self.path)
+
+    def remoteSearch(self):
+        return calibratorDatabase.coneSearch("19:39:25.026", "-63:42:45.63", 20)
+
+    def offlineSearch(self):
+        return self.catalogue.coneSearch("19:39:25.026", "-63:42:45.63", 20)
+
+    def test_sameCalibrators(self):
+        remote = self.remoteSearch().getAllCalibrators()
+        offline = self.offlineSearch().getAllCalibrators()
+        self.assertEqual([ c['calibrator'].getName() for c in offline ],
+                         [ c['calibrator'].getName() for c in remote ])
+        for ( o, r ) in zip(offline, remote):
+            # The server gives distances to 4 decimal places.
+            self.assertAlmostEqual(o['distance'], r['distance'], delta=5e-5)
+            self.assertEqual(o['calibrator'].getRightAscension(), r['calibrator'].getRightAscension())
+            self.assertEqual(o['calibrator'].getDeclination(), r['calibrator'].getDeclination())
+            self.assertEqual(o['calibrator'].getFluxDensities(), r['calibrator'].getFluxDensities())
+
+    def test_fluxLimit(self):
+        # The faint sources near the position are left out, as the server does.
+        names = [ c['calibrator'].getName() for c in self.offlineSearch().getAllCalibrators() ]
+        self.assertNotIn("1929-643", names)
+        self.assertNotIn("1903-802", names)
+
+    def test_sameBestCalibrator(self):
+        for array in [ "6A", "1.5C" ]:
+            remote = self.remoteSearch().getBestCalibrator(array)
+            offline = self.offlineSearch().getBestCalibrator(array)
+            self.assertEqual(offline['calibrator'].getName(), remote['calibrator'].getName())
+
+    def test_offlineNeedsNoServer(self):
+        calibratorDatabase.setCatalogue(self.catalogue)
+        self.transport.requests = []
+        best = cabb.scan().setRightAscension("19:39:25.026").setDeclination("-63:42:45.63").findCalibrator(
+            ).getBestCalibrator("6A")
+        self.assertIsNotNone(best)
+        self.assertEqual(self.transport.requests, [])
+
+if __name__ == "__main__":
+    unittest.main()
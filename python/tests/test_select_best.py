@@ -0,0 +1,105 @@
+# Tests that selectBest, which gets all the qualities at once, chooses the
+# same calibrator as asking for them one at a time did.
+# Run them (from the python directory) as:
+#   python -m unittest discover -s tests
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cabb_scheduler.calibrator_database as calibratorDatabase
+import cabb_scheduler.errors
+import cabb_scheduler.transport as transport
+
+class qualityResponse:
+    def __init__(self, status, text):
+        self.status_code = status
+        self.text = text
+
+class qualityTransport:
+    # Answers quality requests from a table of made-up qualities; a source
+    # with the quality "fail" gets a server error.
+    def __init__(self):
+        self.qualities = {}
+
+    def post(self, url=None, data=None):
+        quality = self.qualities[data['source']]
+        if quality == "fail":
+            return qualityResponse(500, "")
+        return qualityResponse(200, json.dumps({ data['source']: { '6km': { '4cm': quality } } }))
+
+
+def sequentialBest(calList):
+    # The way selectBest used to choose, asking for the qualities one at a
+    # time as each candidate was looked at.
+    cals = calList.getAllCalibrators()
+    firstFrequency = cals[0]['calibrator'].getFluxDensities()[0]['frequency']
+    desiredScore = 4
+    bestIndex = None
+    calFd = None
+    while bestIndex is None and desiredScore > 1:
+        for i in range(0, len(cals)):
+            tcal = cals[i]['calibrator']
+            tFd = tcal.getFluxDensities(firstFrequency)[0]['fluxDensity']
+            if bestIndex is None or (tFd >= 2 * calFd and cals[i]['distance'] < 10):
+                tcal.fetchQualities()
+                if tcal.getQuality("6km", "4cm") == desiredScore:
+                    bestIndex = i
+                    calFd = tFd
+        desiredScore -= 1
+    return bestIndex
+
+class selectBestTests(unittest.TestCase):
+    def setUp(self):
+        self.transport = qualityTransport()
+        transport.setTransport(self.transport)
+
+    def tearDown(self):
+        transport.setTransport(None)
+
+    def randomList(self, rng, trial, failures=False):
+        # The candidates are not in distance order.
+        calList = calibratorDatabase.calibratorSearchResponse()
+        for i in range(0, 20):
+            name = "c%d_%d" % ( trial, i )
+            self.transport.qualities[name] = rng.choice([ None, 2, 3, 4, None ] + ([ "fail" ] if failures else []))
+            calList.addCalibrator({ 'name': name, 'rightAscension': "00:00:00", 'declination': "-30:00:00",
+                                    'fluxDensities': [ { 'frequency': 5500,
+                                                         'fluxDensity': rng.uniform(0, 3) } ] },
+                                  rng.uniform(0, 20))
+        return calList
+
+    def test_sameChoice(self):
+        rng = random.Random(5)
+        for trial in range(0, 200):
+            seed = rng.random()
+            calList = self.randomList(random.Random(seed), trial)
+            expected = sequentialBest(self.randomList(random.Random(seed), trial))
+            calList.selectBest("6A")
+            best = calList.getBestCalibrator("6A")
+            if expected is None:
+                self.assertIsNone(best)
+            else:
+                self.assertIs(best, calList.getCalibrator(expected))
+
+    def test_sameFailure(self):
+        # A failed fetch is raised when, and only when, the old way would
+        # have asked for that candidate.
+        rng = random.Random(7)
+        for trial in range(0, 200):
+            seed = rng.random()
+            calList = self.randomList(random.Random(seed), trial, failures=True)
+            try:
+                expected = sequentialBest(self.randomList(random.Random(seed), trial, failures=True))
+            except cabb_scheduler.errors.ServerError:
+                with self.assertRaises(cabb_scheduler.errors.ServerError):
+                    calList.selectBest("6A")
+                continue
+            calList.selectBest("6A")
+            best = calList.getBestCalibrator("6A")
+            self.assertEqual(None if best is None else calList.getAllCalibrators().index(best), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+# Tests for the HTTP transports, using stand-in servers on this machine.
+# Run them (from the python directory) as:
+#   python -m unittest discover -s tests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cabb_scheduler.transport as transport
+
+class slowHandler(BaseHTTPRequestHandler):
+    # Answers each POST after a short wait, counting how many are being
+    # answered at once.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        time.sleep(0.02)
+        with server.lock:
+            server.active -= 1
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class httpTransportTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(( "127.0.0.1", 0 ), slowHandler)
+        self.server.lock = threading.Lock()
+        self.server.active = 0
+        self.server.peak = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/caldb" % self.server.server_address[1]
+
+    def tearDown(self):
+        transport.setTransport(None)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_poolSizeLimitsSessions(self):
+        http = transport.httpTransport(poolSize=4)
+        with ThreadPoolExecutor(max_workers=30) as pool:
+            responses = list(pool.map(lambda i: http.post(self.url, { 'n': i }), range(0, 60)))
+        self.assertEqual([ r.text for r in responses ], [ "ok" ] * 60)
+        self.assertLessEqual(http.numSessions(), 4)
+        self.assertLessEqual(self.server.peak, 4)
+        http.close()
+
+    def test_replacedTransportDrains(self):
+        # Requests already using the old transport finish, and it is closed
+        # once they have.
+        old = transport.configure(poolSize=8)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            sending = [ pool.submit(old.post, self.url, { 'n': i }) for i in range(0, 8) ]
+            while self.server.active == 0:
+                time.sleep(0.001)
+            transport.configure(poolSize=2)
+            self.assertGreater(old.numSessions(), 0)
+            self.assertEqual([ f.result().text for f in sending ], [ "ok" ] * 8)
+        self.assertEqual(old.numSessions(), 0)
+        self.assertEqual(transport.post(self.url, { 'n': 0 }).text, "ok")
+
+ok = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+class standInServer:
+    # An asyncio server that answers each request with the next of the raw
+    # responses it is given (or ok once they run out), counting the
+    # connections and requests. A response given as ( response, True ) is
+    # followed by the server closing the connection without warning.
+    def __init__(self):
+        self.responses = []
+        self.connections = 0
+        self.requests = 0
+        self.handlers = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return "http://127.0.0.1:%d/caldb" % self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        # The connections should have been closed by now, so the handlers
+        # will finish.
+        self.server.close()
+        await asyncio.gather(*self.handlers)
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.handlers.append(asyncio.current_task())
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    ( name, _, value ) = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                self.requests += 1
+                response = self.responses.pop(0) if len(self.responses) > 0 else ok
+                closeAfter = isinstance(response, tuple)
+                if closeAfter:
+                    response = response[0]
+                writer.write(response)
+                await writer.drain()
+                if closeAfter:
+                    break
+        except ( asyncio.IncompleteReadError, ConnectionError ):
+            pass
+        writer.close()
+
+class asyncHttpTransportTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = standInServer()
+        self.url = await self.server.start()
+        self.http = transport.asyncHttpTransport(timeout=( 2, 2 ), retries=2, backoff=0.01)
+
+    async def asyncTearDown(self):
+        self.http.close()
+        await self.server.stop()
+
+    async def post(self):
+        return await self.http.post(self.url, { 'mode': "cals" })
+
+    async def test_keepAlive(self):
+        for i in range(0, 3):
+            self.assertEqual((await self.post()).text, "ok")
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.requests, 3)
+
+    async def test_chunkedBody(self):
+        self.server.responses = [ b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                                  b"5\r\n<resu\r\na;ext=1\r\nlts></resu\r\n4\r\nlts>\r\n"
+                                  b"0\r\nX-Trailer: 1\r\n\r\n" ]
+        self.assertEqual((await self.post()).content, b"<results></results>")
+        # The whole body was read, so the connection can be used again.
+        self.assertEqual((await self.post()).text, "ok")
+        self.assertEqual(self.server.connections, 1)
+
+    async def test_informationalResponsesSkipped(self):
+        self.server.responses = [ b"HTTP/1.1 100 Continue\r\n\r\n"
+                                  b"HTTP/1.1 103 Early Hints\r\nLink: </x>\r\n\r\n" + ok ]
+        response = await self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, "ok")
+        self.assertEqual(self.server.requests, 1)
+
+    async def test_noBody(self):
+        # 204 and 304 responses have no body, whatever their headers say.
+        self.server.responses = [ b"HTTP/1.1 204 No Content\r\n\r\n",
+                                  b"HTTP/1.1 304 Not Modified\r\nContent-Length: 10\r\n\r\n" ]
+        for status in [ 204, 304 ]:
+            response = await self.post()
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(response.content, b"")
+        self.assertEqual((await self.post()).text, "ok")
+        self.assertEqual(self.server.connections, 1)
+
+    async def test_staleConnectionReset(self):
+        # The server closes the idle connection, so the next request is sent
+        # again on a new one, without counting as a retry.
+        self.server.responses = [ ( ok, True ) ]
+        await self.post()
+        await asyncio.sleep(0.05)
+        self.http.retries = 0
+        self.assertEqual((await self.post()).text, "ok")
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.server.requests, 2)
+
+    async def test_retryServerErrors(self):
+        failed = b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n"
+        self.server.responses = [ failed, failed ]
+        self.assertEqual((await self.post()).status_code, 200)
+        self.assertEqual(self.server.requests, 3)
+        # Once the retries run out, the last response is given back.
+        self.server.responses = [ failed ] * 3
+        self.server.requests = 0
+        self.assertEqual((await self.post()).status_code, 503)
+        self.assertEqual(self.server.requests, 3)
+
+if __name__ == "__main__":
+    unittest.main()